@@ -0,0 +1,211 @@
+import numpy as np
+
+def get_planar_hull(points : np.ndarray, normal : np.ndarray) -> []:
+    """Indices of the 2D convex hull of coplanar points, counter-clockwise around the normal."""
+    axis_u = np.cross(normal, [1.0, 0.0, 0.0])
+
+    if np.linalg.norm(axis_u) < 1e-6:
+        axis_u = np.cross(normal, [0.0, 1.0, 0.0])
+
+    axis_u /= np.linalg.norm(axis_u)
+    axis_v = np.cross(normal, axis_u)
+
+    projected = np.stack((points @ axis_u, points @ axis_v), axis=1)
+
+    order = np.lexsort((projected[:, 1], projected[:, 0])).tolist()
+
+    def turn(o, a, b):
+        return (projected[a, 0] - projected[o, 0]) * (projected[b, 1] - projected[o, 1]) - (projected[a, 1] - projected[o, 1]) * (projected[b, 0] - projected[o, 0])
+
+    lower = []
+    upper = []
+
+    for i in order:
+        while len(lower) >= 2 and turn(lower[-2], lower[-1], i) <= 0.0:
+            lower.pop()
+
+        lower.append(i)
+
+    for i in reversed(order):
+        while len(upper) >= 2 and turn(upper[-2], upper[-1], i) <= 0.0:
+            upper.pop()
+
+        upper.append(i)
+
+    return lower[:-1] + upper[:-1]
+
+def convex_hull(points : np.ndarray) -> np.ndarray:
+    """
+    Quickhull. Returns the hull as triangles indexing into points, wound
+    counter-clockwise when seen from outside. Coplanar input yields a
+    single-sided fan of its 2D hull, fewer than three distinct points yield
+    no triangles.
+    """
+    points = np.asarray(points, dtype=np.float64)
+
+    if len(points) < 3:
+        return np.empty((0, 3), dtype=np.int64)
+
+    extent = float(np.max(np.ptp(points, axis=0)))
+    epsilon = max(extent, 1e-12) * 1e-9
+
+    # initial simplex from extreme points
+    extremes = np.concatenate((np.argmin(points, axis=0), np.argmax(points, axis=0)))
+    extreme_points = points[extremes]
+    pair_distances = np.linalg.norm(extreme_points[:, None, :] - extreme_points[None, :, :], axis=2)
+    i0, i1 = np.unravel_index(np.argmax(pair_distances), pair_distances.shape)
+    p0 = int(extremes[i0])
+    p1 = int(extremes[i1])
+
+    line = points[p1] - points[p0]
+
+    if np.linalg.norm(line) <= epsilon:
+        return np.empty((0, 3), dtype=np.int64)
+
+    line_distances = np.linalg.norm(np.cross(points - points[p0], line), axis=1)
+    p2 = int(np.argmax(line_distances))
+
+    if line_distances[p2] <= epsilon * np.linalg.norm(line):
+        return np.empty((0, 3), dtype=np.int64)
+
+    base_normal = np.cross(points[p1] - points[p0], points[p2] - points[p0])
+    base_normal /= np.linalg.norm(base_normal)
+
+    plane_distances = (points - points[p0]) @ base_normal
+    p3 = int(np.argmax(np.abs(plane_distances)))
+
+    if abs(plane_distances[p3]) <= epsilon:
+        hull = get_planar_hull(points, base_normal)
+
+        return np.array([(hull[0], hull[i], hull[i + 1]) for i in range(1, len(hull) - 1)], dtype=np.int64).reshape(-1, 3)
+
+    if plane_distances[p3] > 0.0:
+        p1, p2 = p2, p1
+
+    faces = {}
+    edge_faces = {}
+    next_face_id = 0
+
+    def add_face(a, b, c, candidates):
+        nonlocal next_face_id
+
+        normal = np.cross(points[b] - points[a], points[c] - points[a])
+        normal /= np.linalg.norm(normal)
+        offset = normal @ points[a]
+
+        outside = np.empty(0, dtype=np.int64)
+
+        if len(candidates) > 0:
+            distances = points[candidates] @ normal - offset
+            outside = candidates[distances > epsilon]
+
+        face_id = next_face_id
+        next_face_id += 1
+
+        faces[face_id] = [a, b, c, normal, offset, outside]
+
+        for edge in ((a, b), (b, c), (c, a)):
+            edge_faces[edge] = face_id
+
+        return face_id
+
+    def remove_face(face_id):
+        a, b, c = faces[face_id][0:3]
+
+        for edge in ((a, b), (b, c), (c, a)):
+            if edge_faces.get(edge) == face_id:
+                del edge_faces[edge]
+
+        return faces.pop(face_id)
+
+    all_points = np.arange(len(points))
+    simplex = (p0, p1, p2, p3)
+    remaining = all_points[~np.isin(all_points, simplex)]
+
+    # assign every point to the first face it lies above
+    assigned = np.zeros(len(points), dtype=bool)
+    assigned[list(simplex)] = True
+
+    for a, b, c in ((p0, p1, p2), (p0, p3, p1), (p1, p3, p2), (p2, p3, p0)):
+        face_id = add_face(a, b, c, remaining[~assigned[remaining]])
+        assigned[faces[face_id][5]] = True
+
+    pending = [face_id for face_id in faces if len(faces[face_id][5]) > 0]
+
+    while pending:
+        face_id = pending.pop()
+
+        if face_id not in faces or len(faces[face_id][5]) == 0:
+            continue
+
+        _, _, _, normal, offset, outside = faces[face_id]
+
+        eye = int(outside[np.argmax(points[outside] @ normal - offset)])
+        eye_position = points[eye]
+
+        # flood the faces the eye point can see
+        visible = set()
+        stack = [face_id]
+
+        while stack:
+            current = stack.pop()
+
+            if current in visible:
+                continue
+
+            visible.add(current)
+
+            a, b, c = faces[current][0:3]
+
+            for edge in ((b, a), (c, b), (a, c)):
+                neighbour = edge_faces.get(edge)
+
+                if neighbour is not None and neighbour not in visible:
+                    neighbour_normal = faces[neighbour][3]
+                    neighbour_offset = faces[neighbour][4]
+
+                    if eye_position @ neighbour_normal - neighbour_offset > epsilon:
+                        stack.append(neighbour)
+
+        horizon = []
+        orphaned = []
+
+        for current in visible:
+            a, b, c = faces[current][0:3]
+
+            for edge in ((a, b), (b, c), (c, a)):
+                neighbour = edge_faces.get((edge[1], edge[0]))
+
+                if neighbour not in visible:
+                    horizon.append(edge)
+
+        for current in visible:
+            orphaned.append(remove_face(current)[5])
+
+        candidates = np.unique(np.concatenate(orphaned)) if orphaned else np.empty(0, dtype=np.int64)
+        candidates = candidates[candidates != eye]
+
+        unassigned = np.ones(len(candidates), dtype=bool)
+
+        for a, b in horizon:
+            new_face_id = add_face(a, b, eye, candidates[unassigned])
+
+            new_outside = faces[new_face_id][5]
+
+            if len(new_outside) > 0:
+                unassigned &= ~np.isin(candidates, new_outside)
+                pending.append(new_face_id)
+
+    return np.array([face[0:3] for face in faces.values()], dtype=np.int64).reshape(-1, 3)
+
+def get_hull_planes(points : np.ndarray, triangles : np.ndarray) -> np.ndarray:
+    """Outward unit normals and offsets of the hull triangles, as (n, 4) rows."""
+    normals = np.cross(points[triangles[:, 1]] - points[triangles[:, 0]], points[triangles[:, 2]] - points[triangles[:, 0]])
+
+    lengths = np.linalg.norm(normals, axis=1)
+    valid = lengths > 0.0
+
+    normals = normals[valid] / lengths[valid, None]
+    offsets = np.einsum('ij,ij->i', normals, points[triangles[valid, 0]])
+
+    return np.concatenate((normals, offsets[:, None]), axis=1)
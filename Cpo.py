@@ -1,12 +1,13 @@
-
-import bpy
 import struct
-import io
+import numpy as np
 
 from enum import Enum
 from abc import ABC, abstractmethod
 from io import BufferedReader, BufferedWriter
 
+# vertex indices are 16 bit
+CPO_MAX_SHAPE_VERTICES = 0x10000
+
 class CpoShapeData(ABC):
     @abstractmethod
     def deserialize(self, file : BufferedReader) -> None:
@@ -17,34 +18,72 @@ class CpoShapeData(ABC):
         pass
     
 class CpoShapeDataSphere(CpoShapeData):
+    """
+    Assumed layout, not confirmed against game files: the radius as one
+    float, followed by the position and rotation every shape ends with.
+    """
     def __init__(self):
-        pass
+        self.radius = 0.0
+        self.position_x = 0.0
+        self.position_y = 0.0
+        self.position_z = 0.0
+        self.matrix = []
         
     def deserialize(self, reader : BufferedReader):
-        pass
+        self.radius = struct.unpack('f', reader.read(4))[0]
+        
+        read_transform(self, reader)
     
     def serialize(self, writer : BufferedWriter):
-        pass
+        writer.write(struct.pack("f", self.radius))
+        
+        write_transform(self, writer)
     
 class CpoShapeDataBox(CpoShapeData):
+    """
+    Assumed layout, not confirmed against game files: the half extents
+    along the box axes as three floats, followed by the position and
+    rotation every shape ends with.
+    """
     def __init__(self):
-        pass
+        self.half_extent_x = 0.0
+        self.half_extent_y = 0.0
+        self.half_extent_z = 0.0
+        self.position_x = 0.0
+        self.position_y = 0.0
+        self.position_z = 0.0
+        self.matrix = []
         
     def deserialize(self, reader : BufferedReader):
-        pass
+        read = struct.unpack('3f', reader.read(12))
+        self.half_extent_x = read[0]
+        self.half_extent_y = read[1]
+        self.half_extent_z = read[2]
+        
+        read_transform(self, reader)
     
     def serialize(self, writer : BufferedWriter):
-        pass
+        writer.write(struct.pack("3f", 
+            self.half_extent_x, 
+            self.half_extent_y, 
+            self.half_extent_z
+        ))
+        
+        write_transform(self, writer)
     
 class CpoShapeDataMesh(CpoShapeData):
     def __init__(self):
-        self.vertices = []
-        self.polygons = []
+        self.vertices = np.empty((0, 3), dtype=np.float32)
+        self.polygon_indices = np.empty(0, dtype=np.uint16)
+        self.polygon_offsets = np.zeros(1, dtype=np.int64)
         self.position_x = 0.0
         self.position_y = 0.0
         self.position_z = 0.0
         self.matrix = []
         
+    def get_polygon_count(self) -> int:
+        return len(self.polygon_offsets) - 1
+        
     def deserialize(self, reader : BufferedReader):
         read = struct.unpack('4I', reader.read(16))
         
@@ -53,42 +92,21 @@ class CpoShapeDataMesh(CpoShapeData):
         size_of_polygons = read[2]
         _ = read[3]
         
-        for i in range(number_of_vertices):
-            vertex = CpoVertex()
-            vertex.deserialize(reader)
-            self.vertices.append(vertex)
-            
-        for i in range(number_of_polygons):
-            polygon = CpoPolygon()
-            polygon.deserialize(reader)
-            self.polygons.append(polygon)
-            
-        read = struct.unpack('3f', reader.read(12))
-        self.position_x = read[0]
-        self.position_y = read[1]
-        self.position_z = read[2]
+        self.vertices = np.frombuffer(reader.read(number_of_vertices * 12), dtype=np.float32).reshape(-1, 3).copy()
         
-        read = struct.unpack('9f', reader.read(36))
-        self.matrix = [
-            [ read[0],  read[1], read[2]],
-            [ read[3],  read[4], read[5]],
-            [ read[6],  read[7], read[8]]
-        ]
+        polygon_data = np.frombuffer(reader.read(size_of_polygons), dtype=np.uint16)
+        
+        self.polygon_indices, self.polygon_offsets = decode_polygons(polygon_data, number_of_polygons)
+            
+        read_transform(self, reader)
     
     def serialize(self, writer : BufferedWriter):
         number_of_vertices = len(self.vertices)
-        number_of_polygons = len(self.polygons)
+        number_of_polygons = self.get_polygon_count()
         
-        polygons_buffer = io.BytesIO()
-        polygons_writer = io.BufferedWriter(polygons_buffer)
-        
-        for i in range(number_of_polygons):
-            polygon : CpoPolygon = self.polygons[i]
-            polygon.serialize(polygons_writer)
-            
-        polygons_writer.flush()
+        polygon_data = encode_polygons(self.polygon_indices, self.polygon_offsets)
             
-        size_of_polygons = polygons_writer.tell()
+        size_of_polygons = polygon_data.nbytes
             
         writer.write(struct.pack("4I", 
             number_of_vertices, 
@@ -97,31 +115,11 @@ class CpoShapeDataMesh(CpoShapeData):
             0
         ))
         
-        for i in range(number_of_vertices):
-            vertex : CpoVertex = self.vertices[i]
-            vertex.serialize(writer)
+        writer.write(self.vertices.astype(np.float32).tobytes())
             
-        polygons_writer.seek(0)
-        
-        writer.write(polygons_buffer.getvalue())
-        
-        writer.write(struct.pack("3f", 
-            self.position_x, 
-            self.position_y, 
-            self.position_z
-        ))
-        
-        input_matrix = self.matrix
-
-        matrix = [
-            [ input_matrix[0][0],  input_matrix[0][1], input_matrix[0][2]],
-            [ input_matrix[1][0],  input_matrix[1][1], input_matrix[1][2]],
-            [ input_matrix[2][0],  input_matrix[2][1], input_matrix[2][2]]
-        ]
-        
-        matrix_flat = [item for sublist in matrix for item in sublist]
+        writer.write(polygon_data.tobytes())
         
-        writer.write(struct.pack("9f", *matrix_flat))
+        write_transform(self, writer)
     
 class CpoShape:
     def __init__(self):
@@ -144,50 +142,97 @@ class CpoShape:
         writer.write(struct.pack("I", self.type))
         self.data.serialize(writer)
     
-class CpoVertex:
-    def __init__(self):
-        self.position_x = 0.0
-        self.position_y = 0.0
-        self.position_z = 0.0
-        
-    def deserialize(self, reader : BufferedReader):
-        read = struct.unpack('3f', reader.read(12))
-        self.position_x = read[0]
-        self.position_y = read[1]
-        self.position_z = read[2]
+def read_transform(shape_data : CpoShapeData, reader : BufferedReader):
+    """Read the position and rotation matrix every shape type ends with."""
+    read = struct.unpack('3f', reader.read(12))
+    shape_data.position_x = read[0]
+    shape_data.position_y = read[1]
+    shape_data.position_z = read[2]
     
-    def serialize(self, writer : BufferedWriter):
-        writer.write(struct.pack("3f", 
-            self.position_x, 
-            self.position_y, 
-            self.position_z
-        ))
-        
-class CpoPolygon:
-    def __init__(self):
-        self.vertex_indices = []
-        
-    def deserialize(self, reader : BufferedReader):
-        read = struct.unpack('H', reader.read(2))
-        
-        number_of_vertex_indices = read[0]
+    read = struct.unpack('9f', reader.read(36))
+    shape_data.matrix = [
+        [ read[0],  read[1], read[2]],
+        [ read[3],  read[4], read[5]],
+        [ read[6],  read[7], read[8]]
+    ]
+    
+def write_transform(shape_data : CpoShapeData, writer : BufferedWriter):
+    writer.write(struct.pack("3f", 
+        shape_data.position_x, 
+        shape_data.position_y, 
+        shape_data.position_z
+    ))
+    
+    input_matrix = shape_data.matrix
+
+    matrix = [
+        [ input_matrix[0][0],  input_matrix[0][1], input_matrix[0][2]],
+        [ input_matrix[1][0],  input_matrix[1][1], input_matrix[1][2]],
+        [ input_matrix[2][0],  input_matrix[2][1], input_matrix[2][2]]
+    ]
+    
+    matrix_flat = [item for sublist in matrix for item in sublist]
+    
+    writer.write(struct.pack("9f", *matrix_flat))
+    
+def encode_polygons(polygon_indices : np.ndarray, polygon_offsets : np.ndarray) -> np.ndarray:
+    """Interleave CSR polygon arrays into the count/index words of a polygon block."""
+    number_of_polygons = len(polygon_offsets) - 1
+    
+    polygon_counts = np.diff(polygon_offsets)
+    
+    # the words are 16 bit, larger values would wrap around silently
+    if len(polygon_indices) > 0 and int(np.max(polygon_indices)) > 0xFFFF:
+        raise ValueError(f"CPO vertex index {int(np.max(polygon_indices))} does not fit in 16 bits")
+    
+    if number_of_polygons > 0 and int(np.max(polygon_counts)) > 0xFFFF:
+        raise ValueError(f"CPO polygon with {int(np.max(polygon_counts))} vertices does not fit in 16 bits")
+    
+    count_positions = polygon_offsets[:-1] + np.arange(number_of_polygons)
+    
+    polygon_data = np.empty(len(polygon_indices) + number_of_polygons, dtype=np.uint16)
+    
+    is_index = np.ones(len(polygon_data), dtype=bool)
+    is_index[count_positions] = False
+    
+    polygon_data[count_positions] = polygon_counts
+    polygon_data[is_index] = polygon_indices
+    
+    return polygon_data
+    
+def decode_polygons(polygon_data : np.ndarray, number_of_polygons : int) -> (np.ndarray, np.ndarray):
+    """Split the interleaved count/index words of a polygon block into CSR index and offset arrays."""
+    polygon_counts = None
+    
+    # uniform polygons, the common case for triangulated meshes, need no walk over the counts
+    if number_of_polygons > 0 and len(polygon_data) % number_of_polygons == 0:
+        stride = len(polygon_data) // number_of_polygons
         
-        for i in range(number_of_vertex_indices):
-            read = struct.unpack('H', reader.read(2))
-            
-            vertex_index = read[0]
+        if stride > 1 and np.all(polygon_data[::stride] == stride - 1):
+            polygon_counts = np.full(number_of_polygons, stride - 1, dtype=np.int64)
             
-            self.vertex_indices.append(vertex_index)
-
-    def serialize(self, writer : BufferedWriter):
-        number_of_vertex_indices = len(self.vertex_indices)
+    if polygon_counts is None:
+        polygon_counts = np.empty(number_of_polygons, dtype=np.int64)
         
-        writer.write(struct.pack("H", number_of_vertex_indices))
+        words = polygon_data.tolist()
+        position = 0
         
-        for i in range(number_of_vertex_indices):
-            vertex_index = self.vertex_indices[i]
+        for i in range(number_of_polygons):
+            polygon_counts[i] = words[position]
+            position += words[position] + 1
             
-            writer.write(struct.pack("H", vertex_index))
+    polygon_offsets = np.zeros(number_of_polygons + 1, dtype=np.int64)
+    np.cumsum(polygon_counts, out=polygon_offsets[1:])
+    
+    count_positions = polygon_offsets[:-1] + np.arange(number_of_polygons)
+    
+    is_index = np.ones(len(polygon_data), dtype=bool)
+    is_index[count_positions] = False
+    is_index[polygon_offsets[-1] + number_of_polygons:] = False
+    
+    polygon_indices = polygon_data[is_index].copy()
+    
+    return polygon_indices, polygon_offsets
     
 class CpoFile:
     def __init__(self):
@@ -0,0 +1,302 @@
+import numpy as np
+
+from .Cpo import *
+from .CpoGeometry import *
+
+BVH_LEAF_SIZE = 8
+
+def sort_triangles(centroids : np.ndarray) -> np.ndarray:
+    """
+    Order triangles top-down so that every node of the tree covers a
+    contiguous range. Each range is split at its leaf-aligned middle, along
+    the axis its centroids spread the most.
+    """
+    triangle_count = len(centroids)
+
+    order = np.arange(triangle_count)
+
+    leaf_count = (triangle_count + BVH_LEAF_SIZE - 1) // BVH_LEAF_SIZE
+    depth = int(np.ceil(np.log2(max(leaf_count, 1))))
+
+    for level in range(depth, 0, -1):
+        node_size = BVH_LEAF_SIZE << level
+
+        node_starts = np.arange(0, triangle_count, node_size)
+        node_indices = np.arange(triangle_count) // node_size
+
+        sorted_centroids = centroids[order]
+
+        node_extents = np.maximum.reduceat(sorted_centroids, node_starts) - np.minimum.reduceat(sorted_centroids, node_starts)
+        node_axes = np.argmax(node_extents, axis=1)
+
+        keys = sorted_centroids[np.arange(triangle_count), node_axes[node_indices]]
+
+        order = order[np.lexsort((keys, node_indices))]
+
+    return order
+
+def get_world_triangles(cpo : CpoFile) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Fan-triangulate every mesh shape and move it into file space
+    (v @ matrix + position). Returns the (n, 3, 3) triangle corners and the
+    shape and polygon each triangle came from.
+    """
+    corners = []
+    shape_indices = []
+    polygon_indices = []
+
+    for shape_index, cpo_shape in enumerate(cpo.shapes):
+        if cpo_shape.type != 3:
+            continue
+
+        shape_data : CpoShapeDataMesh = cpo_shape.data
+
+        triangles = triangulate_polygons(shape_data.polygon_indices, shape_data.polygon_offsets)
+
+        matrix = np.array(shape_data.matrix, dtype=np.float64).reshape(3, 3)
+        position = np.array((shape_data.position_x, shape_data.position_y, shape_data.position_z))
+
+        vertices = shape_data.vertices.astype(np.float64) @ matrix + position
+
+        triangle_counts = np.maximum(np.diff(shape_data.polygon_offsets) - 2, 0)
+
+        corners.append(vertices[triangles])
+        shape_indices.append(np.full(len(triangles), shape_index, dtype=np.int64))
+        polygon_indices.append(np.repeat(np.arange(len(triangle_counts)), triangle_counts))
+
+    if not corners:
+        return np.empty((0, 3, 3)), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    return np.concatenate(corners), np.concatenate(shape_indices), np.concatenate(polygon_indices)
+
+class CpoBvh:
+    """
+    Bounding volume hierarchy over the polygons of a CpoFile, in file space.
+
+    Triangles are grouped into leaves of BVH_LEAF_SIZE by median splits.
+    Every level above pairs up the nodes of the level below, so node i has
+    the children 2i and 2i + 1. Queries walk the levels
+    breadth first for a whole batch at once.
+    """
+    def __init__(self):
+        self.corners = np.empty((0, 3, 3))
+        self.shape_indices = np.empty(0, dtype=np.int64)
+        self.polygon_indices = np.empty(0, dtype=np.int64)
+        self.levels = []
+
+    def build(self, cpo : CpoFile):
+        corners, shape_indices, polygon_indices = get_world_triangles(cpo)
+
+        self.levels = []
+
+        if len(corners) == 0:
+            self.corners = corners
+            self.shape_indices = shape_indices
+            self.polygon_indices = polygon_indices
+
+            return
+
+        order = sort_triangles(corners.mean(axis=1))
+
+        self.corners = corners[order]
+        self.shape_indices = shape_indices[order]
+        self.polygon_indices = polygon_indices[order]
+
+        triangle_count = len(self.corners)
+        leaf_count = (triangle_count + BVH_LEAF_SIZE - 1) // BVH_LEAF_SIZE
+
+        # pad the last leaf with copies of the final triangle so leaves can be reduced as one block
+        padding = np.full(leaf_count * BVH_LEAF_SIZE - triangle_count, triangle_count - 1)
+        padded_corners = self.corners[np.concatenate((np.arange(triangle_count), padding)).astype(np.int64)]
+
+        leaf_corners = padded_corners.reshape(leaf_count, BVH_LEAF_SIZE * 3, 3)
+
+        node_min = leaf_corners.min(axis=1)
+        node_max = leaf_corners.max(axis=1)
+
+        self.levels.append((node_min, node_max))
+
+        while len(node_min) > 1:
+            if len(node_min) % 2 == 1:
+                node_min = np.concatenate((node_min, node_min[-1:]))
+                node_max = np.concatenate((node_max, node_max[-1:]))
+
+            node_min = np.minimum(node_min[0::2], node_min[1::2])
+            node_max = np.maximum(node_max[0::2], node_max[1::2])
+
+            self.levels.append((node_min, node_max))
+
+        # root first
+        self.levels.reverse()
+
+    def get_triangle_count(self) -> int:
+        return len(self.corners)
+
+    def traverse(self, query_indices : np.ndarray, overlaps) -> (np.ndarray, np.ndarray):
+        """
+        Walk the tree for a batch of queries. overlaps(query_indices, node_min,
+        node_max) flags the pairs whose node is worth visiting. Returns the
+        (query, triangle) candidate pairs from the leaves that were reached.
+        """
+        if not self.levels:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        node_indices = np.zeros(len(query_indices), dtype=np.int64)
+
+        for level, (node_min, node_max) in enumerate(self.levels):
+            if level > 0:
+                query_indices = np.repeat(query_indices, 2)
+                node_indices = (np.repeat(node_indices, 2) * 2) + np.tile([0, 1], len(node_indices))
+
+                exists = node_indices < len(node_min)
+
+                query_indices = query_indices[exists]
+                node_indices = node_indices[exists]
+
+            hit = overlaps(query_indices, node_min[node_indices], node_max[node_indices])
+
+            query_indices = query_indices[hit]
+            node_indices = node_indices[hit]
+
+        triangle_indices = (node_indices[:, None] * BVH_LEAF_SIZE + np.arange(BVH_LEAF_SIZE)).ravel()
+        query_indices = np.repeat(query_indices, BVH_LEAF_SIZE)
+
+        exists = triangle_indices < len(self.corners)
+
+        return query_indices[exists], triangle_indices[exists]
+
+    def ray_cast(self, origins : np.ndarray, directions : np.ndarray, max_distance : float = np.inf) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Cast a batch of rays and return, per ray, the distance to the first
+        polygon hit along with its shape and polygon index. Misses report an
+        infinite distance and -1 indices. Both sides of a polygon are hit.
+        """
+        origins = np.atleast_2d(np.asarray(origins, dtype=np.float64))
+        directions = np.atleast_2d(np.asarray(directions, dtype=np.float64))
+
+        directions = directions / np.linalg.norm(directions, axis=1)[:, None]
+
+        ray_count = len(origins)
+
+        distances = np.full(ray_count, np.inf)
+        shape_indices = np.full(ray_count, -1, dtype=np.int64)
+        polygon_indices = np.full(ray_count, -1, dtype=np.int64)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inverse_directions = 1.0 / directions
+
+            def overlaps(ray_indices, node_min, node_max):
+                ray_origins = origins[ray_indices]
+                ray_inverse_directions = inverse_directions[ray_indices]
+
+                t0 = (node_min - ray_origins) * ray_inverse_directions
+                t1 = (node_max - ray_origins) * ray_inverse_directions
+
+                # fmin/fmax drop the NaN of an origin on a slab of an axis-parallel ray
+                t_near = np.fmin(t0, t1).max(axis=1)
+                t_far = np.fmax(t0, t1).min(axis=1)
+
+                return (t_near <= t_far) & (t_far >= 0.0) & (t_near <= max_distance)
+
+            ray_indices, triangle_indices = self.traverse(np.arange(ray_count), overlaps)
+
+        if len(ray_indices) == 0:
+            return distances, shape_indices, polygon_indices
+
+        # Moller-Trumbore
+        corners = self.corners[triangle_indices]
+        ray_origins = origins[ray_indices]
+        ray_directions = directions[ray_indices]
+
+        edge_1 = corners[:, 1] - corners[:, 0]
+        edge_2 = corners[:, 2] - corners[:, 0]
+
+        p = np.cross(ray_directions, edge_2)
+        determinant = np.einsum('ij,ij->i', edge_1, p)
+
+        valid = np.abs(determinant) > 1e-12
+
+        inverse_determinant = np.zeros_like(determinant)
+        inverse_determinant[valid] = 1.0 / determinant[valid]
+
+        s = ray_origins - corners[:, 0]
+        u = np.einsum('ij,ij->i', s, p) * inverse_determinant
+
+        q = np.cross(s, edge_1)
+        v = np.einsum('ij,ij->i', ray_directions, q) * inverse_determinant
+
+        t = np.einsum('ij,ij->i', edge_2, q) * inverse_determinant
+
+        hit = valid & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) & (t >= 0.0) & (t <= max_distance)
+
+        ray_indices = ray_indices[hit]
+        triangle_indices = triangle_indices[hit]
+        t = t[hit]
+
+        # nearest hit per ray
+        order = np.lexsort((t, ray_indices))
+        ray_indices = ray_indices[order]
+
+        first = np.ones(len(ray_indices), dtype=bool)
+        first[1:] = ray_indices[1:] != ray_indices[:-1]
+
+        ray_indices = ray_indices[first]
+        nearest = order[first]
+
+        distances[ray_indices] = t[nearest]
+        shape_indices[ray_indices] = self.shape_indices[triangle_indices[nearest]]
+        polygon_indices[ray_indices] = self.polygon_indices[triangle_indices[nearest]]
+
+        return distances, shape_indices, polygon_indices
+
+    def query_aabb(self, boxes_min : np.ndarray, boxes_max : np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Find the polygons that intersect a batch of axis-aligned boxes.
+        Returns matching arrays of box index, shape index and polygon index,
+        one row per overlapping polygon, sorted by box.
+        """
+        boxes_min = np.atleast_2d(np.asarray(boxes_min, dtype=np.float64))
+        boxes_max = np.atleast_2d(np.asarray(boxes_max, dtype=np.float64))
+
+        def overlaps(box_indices, node_min, node_max):
+            return np.all((node_min <= boxes_max[box_indices]) & (node_max >= boxes_min[box_indices]), axis=1)
+
+        box_indices, triangle_indices = self.traverse(np.arange(len(boxes_min)), overlaps)
+
+        corners = self.corners[triangle_indices]
+
+        touching = np.all((corners.min(axis=1) <= boxes_max[box_indices]) & (corners.max(axis=1) >= boxes_min[box_indices]), axis=1)
+
+        box_indices = box_indices[touching]
+        triangle_indices = triangle_indices[touching]
+
+        # separating axis test for the triangles whose bounds touch the box
+        box_centers = (boxes_min[box_indices] + boxes_max[box_indices]) * 0.5
+        box_half_extents = (boxes_max[box_indices] - boxes_min[box_indices]) * 0.5
+
+        corners = self.corners[triangle_indices] - box_centers[:, None, :]
+
+        edges = np.roll(corners, -1, axis=1) - corners
+
+        axes = [np.cross(edges[:, 0], edges[:, 1])]
+        axes += [np.cross(np.identity(3)[i], edges[:, j]) for i in range(3) for j in range(3)]
+
+        separated = np.zeros(len(box_indices), dtype=bool)
+
+        for axis in axes:
+            projections = np.einsum('nij,nj->ni', corners, axis)
+            radius = np.einsum('ij,ij->i', box_half_extents, np.abs(axis))
+
+            separated |= (projections.min(axis=1) > radius) | (projections.max(axis=1) < -radius)
+
+        box_indices = box_indices[~separated]
+        triangle_indices = triangle_indices[~separated]
+
+        # several triangles of one polygon can touch the same box
+        rows = np.unique(np.stack((
+            box_indices,
+            self.shape_indices[triangle_indices],
+            self.polygon_indices[triangle_indices]
+        ), axis=1).reshape(-1, 3), axis=0)
+
+        return rows[:, 0], rows[:, 1], rows[:, 2]
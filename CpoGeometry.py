@@ -0,0 +1,667 @@
+import numpy as np
+
+from .Cpo import *
+from .ConvexHull import *
+from .Simplify import *
+
+def get_polygon_offsets(polygon_counts : np.ndarray) -> np.ndarray:
+    polygon_offsets = np.zeros(len(polygon_counts) + 1, dtype=np.int64)
+    np.cumsum(polygon_counts, out=polygon_offsets[1:])
+
+    return polygon_offsets
+
+def triangulate_polygons(polygon_indices : np.ndarray, polygon_offsets : np.ndarray) -> np.ndarray:
+    """Fan-triangulate CSR polygons, keeping their winding."""
+    polygon_counts = np.diff(polygon_offsets)
+    triangle_counts = np.maximum(polygon_counts - 2, 0)
+
+    polygon_starts = np.repeat(polygon_offsets[:-1], triangle_counts)
+
+    triangle_offsets = get_polygon_offsets(triangle_counts)
+    fan_positions = np.arange(triangle_offsets[-1]) - np.repeat(triangle_offsets[:-1], triangle_counts) + 1
+
+    polygon_indices = polygon_indices.astype(np.int64)
+
+    return np.stack((
+        polygon_indices[polygon_starts],
+        polygon_indices[polygon_starts + fan_positions],
+        polygon_indices[polygon_starts + fan_positions + 1]
+    ), axis=1)
+
+def select_polygons(vertices : np.ndarray, polygon_indices : np.ndarray, polygon_offsets : np.ndarray, polygon_mask : np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray):
+    """Cut the masked polygons out of CSR arrays, keeping only the vertices they use."""
+    polygon_counts = np.diff(polygon_offsets)
+
+    polygon_indices = polygon_indices[np.repeat(polygon_mask, polygon_counts)]
+
+    vertices, polygon_indices = compact_vertices(vertices, polygon_indices)
+
+    return vertices, polygon_indices, get_polygon_offsets(polygon_counts[polygon_mask])
+
+def reverse_polygons(polygon_indices : np.ndarray, polygon_offsets : np.ndarray) -> np.ndarray:
+    """Flip the winding of CSR polygons."""
+    polygon_counts = np.diff(polygon_offsets)
+
+    polygon_starts = np.repeat(polygon_offsets[:-1], polygon_counts)
+    polygon_ends = np.repeat(polygon_offsets[1:], polygon_counts)
+
+    return polygon_indices[polygon_starts + polygon_ends - 1 - np.arange(len(polygon_indices))]
+
+def compact_vertices(vertices : np.ndarray, polygon_indices : np.ndarray) -> (np.ndarray, np.ndarray):
+    """Drop the vertices no polygon references and renumber the indices."""
+    used_vertices, polygon_indices = np.unique(polygon_indices, return_inverse=True)
+
+    return vertices[used_vertices], polygon_indices.reshape(-1)
+
+def weld_vertices(vertices : np.ndarray, polygon_indices : np.ndarray, polygon_offsets : np.ndarray, tolerance : float) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Merge the vertices that fall into the same cell of a grid with the given
+    spacing, placing each merged vertex at the mean of its cell. Repeated
+    corners are dropped from the polygons, and polygons left with fewer than
+    three corners are removed.
+    """
+    if tolerance <= 0.0 or len(vertices) == 0:
+        return vertices, polygon_indices, polygon_offsets
+
+    cells = np.floor(vertices.astype(np.float64) / tolerance + 0.5).astype(np.int64)
+
+    _, vertex_remap, cell_sizes = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    vertex_remap = vertex_remap.reshape(-1)
+
+    welded_vertices = np.zeros((len(cell_sizes), 3))
+    np.add.at(welded_vertices, vertex_remap, vertices)
+    welded_vertices /= cell_sizes[:, None]
+
+    polygon_indices = vertex_remap[polygon_indices.astype(np.int64)]
+
+    polygon_counts = np.diff(polygon_offsets)
+    corner_polygons = np.repeat(np.arange(len(polygon_counts)), polygon_counts)
+
+    next_positions = np.arange(len(polygon_indices)) + 1
+    polygon_ends = polygon_offsets[1:][polygon_counts > 0]
+    next_positions[polygon_ends - 1] = polygon_offsets[:-1][polygon_counts > 0]
+
+    keep = polygon_indices != polygon_indices[next_positions]
+
+    polygon_counts = np.bincount(corner_polygons[keep], minlength=len(polygon_counts))
+
+    keep &= polygon_counts[corner_polygons] >= 3
+    polygon_counts = polygon_counts[polygon_counts >= 3]
+
+    welded_vertices, polygon_indices = compact_vertices(welded_vertices, polygon_indices[keep])
+
+    return welded_vertices.astype(vertices.dtype), polygon_indices, get_polygon_offsets(polygon_counts)
+
+def decimate_mesh_shape(shape_data : CpoShapeDataMesh, target_polygon_count : int, max_error : float = np.inf):
+    """
+    Decimate a mesh shape into triangles with quadric edge collapses. Open
+    borders are locked so the outline of the collision surface is kept. The
+    shape is left alone unless the result has fewer polygons.
+    """
+    polygon_count = shape_data.get_polygon_count()
+
+    if polygon_count <= target_polygon_count:
+        return
+
+    triangles = triangulate_polygons(shape_data.polygon_indices, shape_data.polygon_offsets)
+
+    vertex_count = len(shape_data.vertices)
+
+    locked = get_boundary_vertices(triangles, vertex_count)
+
+    triangles = simplify_triangles(shape_data.vertices, triangles, target_polygon_count, locked, max_error)
+
+    if len(triangles) >= polygon_count:
+        return
+
+    vertices, polygon_indices = compact_vertices(shape_data.vertices, triangles.ravel())
+
+    shape_data.vertices = vertices
+    shape_data.polygon_indices = polygon_indices.astype(np.uint16)
+    shape_data.polygon_offsets = np.arange(0, len(polygon_indices) + 1, 3, dtype=np.int64)
+
+def get_polygon_normals(vertices : np.ndarray, polygon_indices : np.ndarray, polygon_offsets : np.ndarray) -> np.ndarray:
+    """Newell normals of CSR polygons, normalised."""
+    polygon_counts = np.diff(polygon_offsets)
+
+    current = vertices[polygon_indices.astype(np.int64)].astype(np.float64)
+
+    next_positions = np.arange(len(polygon_indices)) + 1
+    polygon_ends = polygon_offsets[1:][polygon_counts > 0]
+    next_positions[polygon_ends - 1] = polygon_offsets[:-1][polygon_counts > 0]
+
+    following = current[next_positions]
+
+    corner_normals = np.cross(current, following)
+
+    normals = np.zeros((len(polygon_counts), 3))
+    np.add.at(normals, np.repeat(np.arange(len(polygon_counts)), polygon_counts), corner_normals)
+
+    lengths = np.linalg.norm(normals, axis=1)
+    normals[lengths > 0.0] /= lengths[lengths > 0.0, None]
+
+    return normals
+
+def is_convex_polygon(positions : np.ndarray, normal : np.ndarray) -> bool:
+    edges = np.roll(positions, -1, axis=0) - positions
+    turns = np.cross(edges, np.roll(edges, -1, axis=0)) @ normal
+
+    tolerance = 1e-6 * max(float(np.max(np.abs(edges))), 1e-12) ** 2
+
+    return bool(np.all(turns >= -tolerance))
+
+def merge_polygon_loops(loop_a : [], loop_b : [], shared_edge : tuple) -> []:
+    """Splice two polygon loops together along an edge that loop_a holds as (a, b) and loop_b as (b, a)."""
+    a, b = shared_edge
+
+    start_a = loop_a.index(b)
+    start_b = loop_b.index(a)
+
+    rotated_a = loop_a[start_a:] + loop_a[:start_a]
+    rotated_b = loop_b[start_b:] + loop_b[:start_b]
+
+    return rotated_a + rotated_b[1:-1]
+
+def merge_coplanar_polygons(vertices : np.ndarray, polygon_indices : np.ndarray, polygon_offsets : np.ndarray, max_angle : float) -> (np.ndarray, np.ndarray):
+    """
+    Greedily merge neighbouring polygons into larger convex n-gons while
+    the normals of all polygons merged into one stay within max_angle
+    (radians) of each other. The collision surface is unchanged, only the
+    number of polygons drops.
+    """
+    polygon_count = len(polygon_offsets) - 1
+
+    normals = get_polygon_normals(vertices, polygon_indices, polygon_offsets)
+
+    indices = polygon_indices.tolist()
+    offsets = polygon_offsets.tolist()
+
+    loops = [indices[offsets[i]:offsets[i + 1]] for i in range(polygon_count)]
+
+    edge_polygons = {}
+
+    for polygon_index, loop in enumerate(loops):
+        for a, b in zip(loop, loop[1:] + loop[:1]):
+            edge_polygons[(a, b)] = polygon_index
+
+    candidates = []
+
+    for (a, b), polygon_a in edge_polygons.items():
+        polygon_b = edge_polygons.get((b, a))
+
+        if polygon_b is not None and polygon_a < polygon_b:
+            candidates.append((float(normals[polygon_a] @ normals[polygon_b]), polygon_a, (a, b)))
+
+    # merge the flattest pairs first
+    candidates.sort(key=lambda candidate: -candidate[0])
+
+    min_cosine = np.cos(max_angle)
+
+    regions = list(range(polygon_count))
+    region_normals = normals.copy()
+    region_members = [[i] for i in range(polygon_count)]
+
+    def find_region(polygon_index):
+        while regions[polygon_index] != polygon_index:
+            regions[polygon_index] = regions[regions[polygon_index]]
+            polygon_index = regions[polygon_index]
+
+        return polygon_index
+
+    for cosine, polygon_a, (a, b) in candidates:
+        if cosine < min_cosine:
+            break
+
+        region_a = find_region(polygon_a)
+        region_b = find_region(edge_polygons[(b, a)])
+
+        if region_a == region_b:
+            continue
+
+        # every pair of member normals, comparing region averages lets them drift apart as merges chain
+        if np.min(normals[region_members[region_a]] @ normals[region_members[region_b]].T) < min_cosine:
+            continue
+
+        loop_a = loops[region_a]
+        loop_b = loops[region_b]
+
+        if len(loop_a) + len(loop_b) - 2 > 0xFFFF:
+            continue
+
+        edges_b = set(zip(loop_b, loop_b[1:] + loop_b[:1]))
+        shared_edges = [(c, d) for c, d in zip(loop_a, loop_a[1:] + loop_a[:1]) if (d, c) in edges_b]
+
+        # regions touching along several edges would enclose a hole or fold back on themselves
+        if len(shared_edges) != 1:
+            continue
+
+        merged_loop = merge_polygon_loops(loop_a, loop_b, shared_edges[0])
+
+        if len(set(merged_loop)) != len(merged_loop):
+            continue
+
+        merged_normal = region_normals[region_a] + region_normals[region_b]
+        merged_normal /= np.linalg.norm(merged_normal)
+
+        if not is_convex_polygon(vertices[merged_loop].astype(np.float64), merged_normal):
+            continue
+
+        regions[region_b] = region_a
+        region_normals[region_a] = merged_normal
+        region_members[region_a] += region_members[region_b]
+        region_members[region_b] = None
+
+        loops[region_a] = merged_loop
+        loops[region_b] = None
+
+    merged_loops = [loops[i] for i in range(polygon_count) if find_region(i) == i]
+
+    merged_offsets = get_polygon_offsets(np.array([len(loop) for loop in merged_loops], dtype=np.int64))
+    merged_indices = np.array([index for loop in merged_loops for index in loop], dtype=polygon_indices.dtype)
+
+    return merged_indices, merged_offsets
+
+def get_concavity(vertices : np.ndarray, triangles : np.ndarray) -> float:
+    """Depth of the surface sample lying furthest inside the convex hull of a set of triangles."""
+    points = vertices[np.unique(triangles)]
+
+    hull_triangles = convex_hull(points)
+
+    if len(hull_triangles) < 4:
+        return 0.0
+
+    planes = get_hull_planes(points, hull_triangles)
+
+    samples = np.concatenate((points, vertices[triangles].mean(axis=1)))
+
+    concavity = 0.0
+
+    # bounded blocks keep the sample/plane distance matrix small on dense meshes
+    for first_sample in range(0, len(samples), 4096):
+        block = samples[first_sample:first_sample + 4096]
+
+        depths = np.min(planes[:, 3] - block @ planes[:, 0:3].T, axis=1)
+
+        concavity = max(concavity, float(np.max(depths)))
+
+    return concavity
+
+def run_steps(steps):
+    """Run a generator that yields between steps to its end and return its return value."""
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+def split_triangles(vertices : np.ndarray, triangles : np.ndarray):
+    """
+    Split triangles in two along the axis-aligned plane that leaves the
+    least concave halves. A generator yielding after every half it
+    measures, returning (concavity, triangles) per half, or None.
+    """
+    centroids = vertices[triangles].mean(axis=1)
+
+    best_halves = None
+    best_concavity = np.inf
+
+    for axis in range(3):
+        for quantile in (0.25, 0.5, 0.75):
+            position = np.quantile(centroids[:, axis], quantile)
+
+            below = centroids[:, axis] <= position
+
+            if np.all(below) or not np.any(below):
+                continue
+
+            halves = []
+
+            for half in (triangles[below], triangles[~below]):
+                halves.append((get_concavity(vertices, half), half))
+
+                yield
+
+            concavity = max(half[0] for half in halves)
+
+            if concavity < best_concavity:
+                best_concavity = concavity
+                best_halves = halves
+
+    return best_halves
+
+def limit_hull_vertices(points : np.ndarray, max_hull_vertices : int) -> np.ndarray:
+    """Pick a well spread subset of hull points by farthest point sampling."""
+    if len(points) <= max_hull_vertices:
+        return points
+
+    selected = [int(np.argmax(np.linalg.norm(points - points.mean(axis=0), axis=1)))]
+    distances = np.linalg.norm(points - points[selected[0]], axis=1)
+
+    while len(selected) < max_hull_vertices:
+        farthest = int(np.argmax(distances))
+        selected.append(farthest)
+        distances = np.minimum(distances, np.linalg.norm(points - points[farthest], axis=1))
+
+    return points[selected]
+
+def decompose_convex(vertices : np.ndarray, triangles : np.ndarray, max_hulls : int, max_concavity : float, max_hull_vertices : int):
+    """
+    Approximate convex decomposition by recursive plane splits. The most
+    concave piece is split until every piece is within max_concavity or
+    max_hulls pieces exist.
+
+    A generator yielding after every convex hull it computes, so callers
+    can spread the work over several calls, see run_steps. Returns
+    (points, triangles) per convex hull.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+
+    pieces = [(get_concavity(vertices, triangles), triangles)]
+    finished = []
+
+    yield
+
+    while pieces and len(pieces) + len(finished) < max_hulls:
+        pieces.sort(key=lambda piece: piece[0])
+
+        concavity, piece_triangles = pieces.pop()
+
+        if concavity <= max_concavity:
+            finished.append((concavity, piece_triangles))
+            continue
+
+        halves = yield from split_triangles(vertices, piece_triangles)
+
+        if halves is None:
+            finished.append((concavity, piece_triangles))
+            continue
+
+        pieces.extend(halves)
+
+    hulls = []
+
+    for _, piece_triangles in pieces + finished:
+        points = limit_hull_vertices(vertices[np.unique(piece_triangles)], max_hull_vertices)
+
+        hull_triangles = convex_hull(points)
+
+        yield
+
+        if len(hull_triangles) == 0:
+            continue
+
+        hull_points, hull_triangles = compact_vertices(points, hull_triangles.ravel())
+
+        hulls.append((hull_points, hull_triangles.reshape(-1, 3)))
+
+    return hulls
+
+def decompose_mesh_shape(cpo_shape : CpoShape, max_hulls : int, max_concavity : float, max_hull_vertices : int):
+    """
+    Replace a mesh shape by convex mesh shapes that share its position and
+    matrix. A generator like decompose_convex, returning the new shapes.
+    """
+    shape_data : CpoShapeDataMesh = cpo_shape.data
+
+    triangles = triangulate_polygons(shape_data.polygon_indices, shape_data.polygon_offsets)
+
+    if len(triangles) == 0:
+        return [cpo_shape]
+
+    hull_shapes = []
+
+    hulls = yield from decompose_convex(shape_data.vertices, triangles, max_hulls, max_concavity, max_hull_vertices)
+
+    for hull_points, hull_triangles in hulls:
+        hull_offsets = np.arange(0, hull_triangles.size + 1, 3, dtype=np.int64)
+
+        # hull faces are convex, so flat ones can always be joined into a single polygon
+        hull_indices, hull_offsets = merge_coplanar_polygons(hull_points, hull_triangles.ravel(), hull_offsets, 1e-4)
+
+        hull_shape = CpoShape()
+        hull_shape.type = 3
+
+        hull_shape.data = CpoShapeDataMesh()
+        hull_shape.data.vertices = hull_points.astype(np.float32)
+        hull_shape.data.polygon_indices = hull_indices.astype(np.uint16)
+        hull_shape.data.polygon_offsets = hull_offsets
+        hull_shape.data.position_x = shape_data.position_x
+        hull_shape.data.position_y = shape_data.position_y
+        hull_shape.data.position_z = shape_data.position_z
+        hull_shape.data.matrix = shape_data.matrix
+
+        hull_shapes.append(hull_shape)
+
+    return hull_shapes
+
+def decompose_cpo_shape(cpo_shape : CpoShape, max_hulls : int, max_concavity : float, max_hull_vertices : int):
+    """Decompose a mesh shape, other shapes are returned as they are. A generator like decompose_convex."""
+    if cpo_shape.type != 3:
+        return [cpo_shape]
+
+    return (yield from decompose_mesh_shape(cpo_shape, max_hulls, max_concavity, max_hull_vertices))
+
+def decompose_cpo_shapes(cpo_shapes : [], max_hulls : int, max_concavity : float, max_hull_vertices : int) -> []:
+    """Decompose every mesh shape in one go, keeping the shape order."""
+    return [hull_shape for cpo_shape in cpo_shapes for hull_shape in run_steps(decompose_cpo_shape(cpo_shape, max_hulls, max_concavity, max_hull_vertices))]
+
+def get_surface_samples(vertices : np.ndarray, triangles : np.ndarray) -> np.ndarray:
+    """Corners, edge midpoints and centroids of a triangle list."""
+    corners = vertices[triangles].astype(np.float64)
+
+    return np.concatenate((
+        corners.reshape(-1, 3),
+        (corners + np.roll(corners, -1, axis=1)).reshape(-1, 3) * 0.5,
+        corners.mean(axis=1)
+    ))
+
+def get_box_axis_candidates(vertices : np.ndarray, triangles : np.ndarray, samples : np.ndarray) -> []:
+    """Rotations worth trying for an oriented box: the shape's own axes, its principal axes, and its largest faces."""
+    candidates = [np.identity(3)]
+
+    _, principal_axes = np.linalg.eigh(np.cov(samples, rowvar=False))
+    candidates.append(principal_axes.T)
+
+    normals = get_triangle_normals(vertices.astype(np.float64), triangles)
+    areas = np.linalg.norm(normals, axis=1)
+
+    if np.any(areas > 0.0):
+        normals = normals[areas > 0.0] / areas[areas > 0.0, None]
+        areas = areas[areas > 0.0]
+
+        first_axis = normals[np.argmax(areas)]
+
+        perpendicular = np.abs(normals @ first_axis) < 0.05
+
+        if np.any(perpendicular):
+            second_axis = normals[perpendicular][np.argmax(areas[perpendicular])]
+        else:
+            planar_samples = samples - np.outer(samples @ first_axis, first_axis)
+            _, planar_axes = np.linalg.eigh(np.cov(planar_samples, rowvar=False))
+            second_axis = planar_axes[:, 2]
+
+        second_axis = second_axis - (second_axis @ first_axis) * first_axis
+
+        if np.linalg.norm(second_axis) > 1e-6:
+            second_axis /= np.linalg.norm(second_axis)
+
+            candidates.append(np.stack((first_axis, second_axis, np.cross(first_axis, second_axis))))
+
+    for i in range(len(candidates)):
+        if np.linalg.det(candidates[i]) < 0.0:
+            candidates[i] = candidates[i] * np.array([[1.0], [1.0], [-1.0]])
+
+    return candidates
+
+def fit_sphere(samples : np.ndarray) -> (np.ndarray, float, float):
+    """Bounding sphere around the box centre of the samples, with its largest distance to the surface samples."""
+    center = (samples.min(axis=0) + samples.max(axis=0)) * 0.5
+
+    distances = np.linalg.norm(samples - center, axis=1)
+
+    radius = float(distances.max())
+
+    return center, radius, radius - float(distances.min())
+
+def fit_box(samples : np.ndarray, axis_candidates : []) -> (np.ndarray, np.ndarray, np.ndarray, float):
+    """Smallest bounding box over the axis candidates, with its largest distance to the surface samples."""
+    best_fit = None
+
+    for axes in axis_candidates:
+        local_samples = samples @ axes.T
+
+        local_min = local_samples.min(axis=0)
+        local_max = local_samples.max(axis=0)
+
+        half_extents = (local_max - local_min) * 0.5
+        local_center = (local_max + local_min) * 0.5
+
+        volume = float(np.prod(half_extents))
+
+        if best_fit is None or volume < best_fit[0]:
+            best_fit = (volume, axes, local_center, half_extents, local_samples)
+
+    _, axes, local_center, half_extents, local_samples = best_fit
+
+    # every sample is inside the box, so its distance to the surface is the gap to the nearest face
+    face_distances = half_extents - np.abs(local_samples - local_center)
+
+    return local_center @ axes, axes, half_extents, float(face_distances.min(axis=1).max())
+
+def get_sphere_surface_points(center : np.ndarray, radius : float, count : int = 256) -> np.ndarray:
+    """Evenly spread points on a sphere, along a Fibonacci spiral."""
+    heights = 1.0 - (np.arange(count) + 0.5) * 2.0 / count
+    ring_radii = np.sqrt(1.0 - heights * heights)
+    angles = np.arange(count) * np.pi * (3.0 - np.sqrt(5.0))
+
+    return center + radius * np.stack((ring_radii * np.cos(angles), heights, ring_radii * np.sin(angles)), axis=1)
+
+def get_box_surface_points(center : np.ndarray, axes : np.ndarray, half_extents : np.ndarray, steps : int = 5) -> np.ndarray:
+    """A grid of points on every face of an oriented box."""
+    grid = np.linspace(-1.0, 1.0, steps)
+    grid_u, grid_v = [values.ravel() for values in np.meshgrid(grid, grid)]
+
+    local_points = []
+
+    for axis in range(3):
+        for side in (-1.0, 1.0):
+            face_points = np.empty((len(grid_u), 3))
+            face_points[:, axis] = side
+            face_points[:, (axis + 1) % 3] = grid_u
+            face_points[:, (axis + 2) % 3] = grid_v
+
+            local_points.append(face_points)
+
+    return (np.concatenate(local_points) * half_extents) @ axes + center
+
+def get_surface_distances(points : np.ndarray, corners : np.ndarray) -> np.ndarray:
+    """Distance from every point to the nearest of the (n, 3, 3) triangles."""
+    edge_1 = corners[:, 1] - corners[:, 0]
+    edge_2 = corners[:, 2] - corners[:, 0]
+
+    normals = np.cross(edge_1, edge_2)
+    normal_lengths = np.linalg.norm(normals, axis=1)
+
+    valid = normal_lengths > 0.0
+    normals[valid] /= normal_lengths[valid, None]
+
+    distances = np.empty(len(points))
+
+    # keep the point-triangle pairs of a batch to about a million
+    batch_size = max(1, 1000000 // max(len(corners), 1))
+
+    for start in range(0, len(points), batch_size):
+        offsets = points[start:start + batch_size, None, :] - corners[None, :, 0]
+
+        plane_distances = np.einsum('ptj,tj->pt', offsets, normals)
+
+        # barycentric coordinates of the point projected onto the plane
+        projected = offsets - plane_distances[:, :, None] * normals
+        cross_1 = np.cross(edge_1, projected)
+        cross_2 = np.cross(projected, edge_2)
+
+        u = np.einsum('ptj,tj->pt', cross_2, normals) / np.where(valid, normal_lengths, 1.0)
+        v = np.einsum('ptj,tj->pt', cross_1, normals) / np.where(valid, normal_lengths, 1.0)
+
+        inside = valid & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0)
+
+        pair_distances = np.where(inside, np.abs(plane_distances), np.inf)
+
+        for a, b in ((0, 1), (1, 2), (2, 0)):
+            edge = corners[:, b] - corners[:, a]
+            edge_offsets = points[start:start + batch_size, None, :] - corners[None, :, a]
+
+            t = np.clip(np.einsum('ptj,tj->pt', edge_offsets, edge) / np.maximum(np.einsum('tj,tj->t', edge, edge), 1e-30), 0.0, 1.0)
+
+            pair_distances = np.minimum(pair_distances, np.linalg.norm(edge_offsets - t[:, :, None] * edge, axis=2))
+
+        distances[start:start + batch_size] = pair_distances.min(axis=1)
+
+    return distances
+
+def fit_primitive_shape(cpo_shape : CpoShape, max_error : float) -> CpoShape:
+    """
+    Replace a mesh shape by a sphere or an oriented box when no part of its
+    surface is further than max_error from the primitive's surface, and no
+    part of the primitive's surface is further than max_error from the mesh,
+    so open bands or rings are not mistaken for closed primitives. Spheres
+    are preferred. Returns None when neither primitive fits.
+    """
+    shape_data : CpoShapeDataMesh = cpo_shape.data
+
+    triangles = triangulate_polygons(shape_data.polygon_indices, shape_data.polygon_offsets)
+
+    if len(triangles) == 0:
+        return None
+
+    samples = get_surface_samples(shape_data.vertices, triangles)
+
+    # shapes built on export may carry the 4x4 transform, only its rotation part applies
+    matrix = np.array(shape_data.matrix, dtype=np.float64)[0:3, 0:3]
+    position = np.array((shape_data.position_x, shape_data.position_y, shape_data.position_z))
+
+    corners = shape_data.vertices.astype(np.float64)[triangles]
+
+    sphere_center, radius, sphere_error = fit_sphere(samples)
+
+    if sphere_error <= max_error:
+        sphere_error = max(sphere_error, float(get_surface_distances(get_sphere_surface_points(sphere_center, radius), corners).max()))
+
+    primitive_shape = CpoShape()
+
+    if sphere_error <= max_error:
+        primitive_shape.type = 1
+
+        primitive_shape.data = CpoShapeDataSphere()
+        primitive_shape.data.radius = radius
+
+        center = sphere_center
+        primitive_matrix = matrix
+    else:
+        box_center, axes, half_extents, box_error = fit_box(samples, get_box_axis_candidates(shape_data.vertices, triangles, samples))
+
+        if box_error <= max_error:
+            box_error = max(box_error, float(get_surface_distances(get_box_surface_points(box_center, axes, half_extents), corners).max()))
+
+        if box_error > max_error:
+            return None
+
+        primitive_shape.type = 2
+
+        primitive_shape.data = CpoShapeDataBox()
+        primitive_shape.data.half_extent_x = float(half_extents[0])
+        primitive_shape.data.half_extent_y = float(half_extents[1])
+        primitive_shape.data.half_extent_z = float(half_extents[2])
+
+        center = box_center
+        primitive_matrix = axes @ matrix
+
+    # shape space is v @ matrix + position, so the primitive's centre moves into its position
+    primitive_position = center @ matrix + position
+
+    primitive_shape.data.position_x = float(primitive_position[0])
+    primitive_shape.data.position_y = float(primitive_position[1])
+    primitive_shape.data.position_z = float(primitive_position[2])
+    primitive_shape.data.matrix = primitive_matrix.tolist()
+
+    return primitive_shape
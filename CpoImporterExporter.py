@@ -1,92 +1,218 @@
 import bpy
 import bmesh
+import functools
+import time
+import numpy as np
 
 from bpy_extras.io_utils import ImportHelper, ExportHelper
-from bpy.props import StringProperty, BoolProperty, EnumProperty
+from bpy.props import StringProperty, BoolProperty, EnumProperty, IntProperty, FloatProperty
 from bpy.types import Operator
 from mathutils import Vector, Matrix
 from pathlib import Path
 
 from .Cpo import *
+from .CpoGeometry import *
 from .utils import *
 
+CPO_SHAPE_INDEX_ATTRIBUTE = "cpo_shape_index"
+
+# seconds of convex decomposition per timer call, so Blender stays responsive
+CPO_DECOMPOSITION_TIME_BUDGET = 0.05
+
+class CpoExportSettings:
+    def __init__(self):
+        self.use_weld = False
+        self.weld_distance = 0.0
+        self.use_decimate = False
+        self.decimate_polygon_budget = 0
+        self.decimate_max_error = np.inf
+        self.use_merge_coplanar = False
+        self.merge_angle = 0.0
+        self.use_fit_primitives = False
+        self.primitive_max_error = 0.0
+        
+class CpoExportStatistics:
+    def __init__(self):
+        self.polygons_before = 0
+        self.vertices_before = 0
+        self.vertices_after = 0
+        self.polygons_after = 0
+        self.primitives = 0
+        self.oversized_shapes = []
+
+class CpoDecompositionJob:
+    """
+    State of one ExportCpo run whose shapes are decomposed on a timer,
+    a few convex hulls per call, before the file is written. Only shapes
+    listed in decompose_shape_indices are decomposed, the others are kept.
+    """
+    def __init__(self):
+        self.cpo = CpoFile()
+        self.source_shapes = []
+        self.decompose_shape_indices = set()
+        self.shapes = []
+        # decompose_cpo_shape generator of the shape being decomposed
+        self.steps = None
+        self.max_hulls = 16
+        self.max_concavity = 0.0
+        self.max_hull_vertices = 32
+        self.decomposed_shapes = 0
+        self.timer = None
+        self.window_manager = None
+        self.finished = False
+        self.error = None
+
+def decompose_shape_batch(job : CpoDecompositionJob):
+    """Decompose shapes until the time budget is spent. Runs as a timer callback, or in one go without a timer."""
+    if job.finished:
+        return None
+    
+    deadline = time.perf_counter() + CPO_DECOMPOSITION_TIME_BUDGET
+    
+    try:
+        # at least one step per call, however long it takes
+        while job.decomposed_shapes < len(job.source_shapes):
+            cpo_shape = job.source_shapes[job.decomposed_shapes]
+            
+            if job.decomposed_shapes not in job.decompose_shape_indices:
+                job.shapes.append(cpo_shape)
+                job.decomposed_shapes += 1
+                continue
+            
+            if job.steps is None:
+                job.steps = decompose_cpo_shape(cpo_shape, job.max_hulls, job.max_concavity, job.max_hull_vertices)
+                
+            # one step is one convex hull, so a large shape spreads over many calls
+            try:
+                next(job.steps)
+            except StopIteration as stop:
+                job.shapes.extend(stop.value)
+                job.steps = None
+                job.decomposed_shapes += 1
+                
+            if job.timer is not None and time.perf_counter() >= deadline:
+                break
+    except Exception as exception:
+        print(f"decomposing shape {job.decomposed_shapes} failed: {exception!r}")
+        
+        job.error = f"Decomposing shape {job.decomposed_shapes} failed: {exception}"
+        job.finished = True
+        
+        return None
+    
+    if job.window_manager is not None:
+        job.window_manager.progress_update(job.decomposed_shapes)
+    
+    if job.decomposed_shapes == len(job.source_shapes):
+        job.cpo.shapes = job.shapes
+        job.finished = True
+        
+        return None
+    
+    return 0.01
+
 def add_cpo_shape(cpo : CpoFile, shape_index : int):
     cpo_shape : CpoShape = cpo.shapes[shape_index]
     
     landscape_scale = 10
     
-    bm = bmesh.new()
-    
-    vertices = {}
+    mesh_name = f"Collision Shape {shape_index} Mesh"
     
-    if cpo_shape.type == 1:
-        print("collision shape type 1 not supported")
-    elif cpo_shape.type == 2:
-        print("collision shape type 2 not supported")
-    elif cpo_shape.type == 3:
+    if cpo_shape.type == 3:
         cpo_shape_data : CpoShapeDataMesh = cpo_shape.data
         
-        for i in range(len(cpo_shape_data.polygons)):
-            cpo_polygon : CpoPolygon = cpo_shape_data.polygons[i]
+        # swapping y and z mirrors the shape, so the winding is flipped with it
+        vertices = cpo_shape_data.vertices[:, [0, 2, 1]] / landscape_scale
+        polygon_indices = reverse_polygons(cpo_shape_data.polygon_indices, cpo_shape_data.polygon_offsets)
+        
+        mesh = create_mesh(mesh_name, vertices, polygon_indices, cpo_shape_data.polygon_offsets)
+    else:
+        mesh = bpy.data.meshes.new(name=mesh_name)
+        
+        bm = bmesh.new()
+        
+        if cpo_shape.type == 1:
+            cpo_shape_data : CpoShapeDataSphere = cpo_shape.data
             
-            number_of_polygons = len(cpo_polygon.vertex_indices)
+            bmesh.ops.create_uvsphere(bm, u_segments=32, v_segments=16, radius=cpo_shape_data.radius / landscape_scale)
+        elif cpo_shape.type == 2:
+            cpo_shape_data : CpoShapeDataBox = cpo_shape.data
             
-            polygon_vertices = list(range(number_of_polygons))
+            bmesh.ops.create_cube(bm, size=2.0)
             
-            for j in range(number_of_polygons):
-                vertex_index = cpo_polygon.vertex_indices[number_of_polygons - 1 - j]
-                
-                if vertex_index in vertices:
-                    polygon_vertices[j] = vertices[vertex_index]
-                else:
-                    cpo_vertex = cpo_shape_data.vertices[vertex_index]
-                    
-                    vertex_position = Vector((cpo_vertex.position_x, cpo_vertex.position_z, cpo_vertex.position_y)) / landscape_scale
-                      
-                    vertex = bm.verts.new(vertex_position)
-                    vertices[vertex_index] = vertex
-                    
-                    polygon_vertices[j] = vertex
-                    
-            face_vertices = tuple(polygon_vertices)
-                
-            face = bm.faces.new(face_vertices)
-                
-    bm.verts.ensure_lookup_table()
-    bm.faces.ensure_lookup_table()
-    
-    mesh = bpy.data.meshes.new(name=f"Collision Shape {shape_index} Mesh")
+            half_extents = Vector((cpo_shape_data.half_extent_x, cpo_shape_data.half_extent_z, cpo_shape_data.half_extent_y)) / landscape_scale
+            
+            bmesh.ops.scale(bm, vec=half_extents, verts=bm.verts)
+            
+        bm.to_mesh(mesh)
+        bm.free()
+        
+        mesh.update()
+        
     obj = bpy.data.objects.new(f"Collision Shape {shape_index}", mesh)
     
     bpy.context.collection.objects.link(obj)
     
-    bm.to_mesh(mesh)
-    bm.free()
-        
-    mesh.update()
+    cpo_shape_data = cpo_shape.data
     
-    if cpo_shape.type == 1:
-        pass
-    elif cpo_shape.type == 2:
-        pass
-    elif cpo_shape.type == 3:
-        cpo_shape_data : CpoShapeDataMesh = cpo_shape.data
-        
-        position = Vector((cpo_shape_data.position_x, cpo_shape_data.position_y, cpo_shape_data.position_z))
-        
-        print("position:", position)
-
-        matrix = Matrix(cpo_shape_data.matrix).to_4x4().transposed()
-        matrix.translation += position
+    position = Vector((cpo_shape_data.position_x, cpo_shape_data.position_y, cpo_shape_data.position_z))
     
-        decompose_and_apply_matrix(obj, matrix, landscape_scale)
+    print("position:", position)
+
+    matrix = Matrix(cpo_shape_data.matrix).to_4x4().transposed()
+    matrix.translation += position
 
-def retrieve_cpo_shape(cpo : CpoFile, shape_obj):
-    cpo_shape = CpoShape()
-    cpo_shape.type = 3
+    decompose_and_apply_matrix(obj, matrix, landscape_scale)
+
+def add_merged_cpo_shapes(cpo : CpoFile):
+    """
+    Import every mesh shape into a single object, with the shape transforms
+    applied. The shape each polygon came from is kept in an integer face
+    attribute so the export can split them up again.
+    """
+    landscape_scale = 10
     
-    cpo_shape.data = CpoShapeDataMesh()
+    mesh_shape_indices = [i for i in range(len(cpo.shapes)) if cpo.shapes[i].type == 3]
     
+    for i in range(len(cpo.shapes)):
+        if cpo.shapes[i].type != 3:
+            add_cpo_shape(cpo, i)
+            
+    if not mesh_shape_indices:
+        return
+    
+    mesh_shapes = [cpo.shapes[i].data for i in mesh_shape_indices]
+    
+    vertex_counts = np.array([len(shape_data.vertices) for shape_data in mesh_shapes], dtype=np.int64)
+    polygon_counts = np.array([shape_data.get_polygon_count() for shape_data in mesh_shapes], dtype=np.int64)
+    
+    vertex_offsets = get_polygon_offsets(vertex_counts)
+    
+    matrices = np.array([np.array(shape_data.matrix, dtype=np.float64).reshape(3, 3) for shape_data in mesh_shapes])
+    positions = np.array([(shape_data.position_x, shape_data.position_y, shape_data.position_z) for shape_data in mesh_shapes])
+    
+    vertex_shapes = np.repeat(np.arange(len(mesh_shapes)), vertex_counts)
+    
+    vertices = np.concatenate([shape_data.vertices for shape_data in mesh_shapes]).astype(np.float64)
+    vertices = np.einsum('ni,nij->nj', vertices, matrices[vertex_shapes]) + positions[vertex_shapes]
+    
+    polygon_indices = np.concatenate([
+        reverse_polygons(shape_data.polygon_indices.astype(np.int64), shape_data.polygon_offsets) + vertex_offsets[i] for i, shape_data in enumerate(mesh_shapes)
+    ])
+    
+    polygon_offsets = get_polygon_offsets(np.concatenate([np.diff(shape_data.polygon_offsets) for shape_data in mesh_shapes]))
+    
+    # swapping y and z mirrors the shapes, so the winding is flipped with it
+    mesh = create_mesh("Collision Mesh", vertices[:, [0, 2, 1]] / landscape_scale, polygon_indices, polygon_offsets)
+    
+    shape_attribute = mesh.attributes.new(name=CPO_SHAPE_INDEX_ATTRIBUTE, type='INT', domain='FACE')
+    shape_attribute.data.foreach_set("value", np.repeat(np.array(mesh_shape_indices, dtype=np.int32), polygon_counts))
+    
+    obj = bpy.data.objects.new("Collision", mesh)
+    
+    bpy.context.collection.objects.link(obj)
+
+def retrieve_cpo_shape(cpo : CpoFile, shape_obj, settings : CpoExportSettings, statistics : CpoExportStatistics):
     temp_obj = shape_obj.copy()
     temp_obj.data = shape_obj.data.copy()
     bpy.context.collection.objects.link(temp_obj)
@@ -103,9 +229,11 @@ def retrieve_cpo_shape(cpo : CpoFile, shape_obj):
     
     used_vertex_indices = {}
     
+    cpo_vertices = []
+    polygon_indices = []
+    polygon_offsets = [0]
+    
     for polygon in mesh.polygons:
-        cpo_polygon = CpoPolygon()
-        
         number_of_vertices = len(polygon.loop_indices)
 
         for i in range(number_of_vertices):
@@ -116,33 +244,105 @@ def retrieve_cpo_shape(cpo : CpoFile, shape_obj):
             if source_vertex_index not in used_vertex_indices:
                 source_vertex = mesh.vertices[source_vertex_index]
                 
-                used_vertex_indices[source_vertex_index] = len(cpo_shape.data.vertices)
+                used_vertex_indices[source_vertex_index] = len(cpo_vertices)
                     
                 position = source_vertex.co
             
-                cpo_vertex = CpoVertex()
-            
-                cpo_vertex.position_x = position.x * landscape_scale
-                cpo_vertex.position_y = position.z * landscape_scale
-                cpo_vertex.position_z = position.y * landscape_scale
-            
-                cpo_shape.data.vertices.append(cpo_vertex)
+                cpo_vertices.append((
+                    position.x * landscape_scale,
+                    position.z * landscape_scale,
+                    position.y * landscape_scale
+                ))
                 
-            cpo_polygon.vertex_indices.append(used_vertex_indices[source_vertex_index])
+            polygon_indices.append(used_vertex_indices[source_vertex_index])
             
-        cpo_shape.data.polygons.append(cpo_polygon)
+        polygon_offsets.append(len(polygon_indices))
         
+    cpo_vertices = np.array(cpo_vertices, dtype=np.float32).reshape(-1, 3)
+    polygon_indices = np.array(polygon_indices, dtype=np.int64)
+    polygon_offsets = np.array(polygon_offsets, dtype=np.int64)
+    
+    # objects from a merged import are split back into the shapes they were made of
+    polygon_shapes = np.zeros(len(mesh.polygons), dtype=np.int32)
+    
+    shape_attribute = mesh.attributes.get(CPO_SHAPE_INDEX_ATTRIBUTE)
+    
+    if shape_attribute is not None and shape_attribute.domain == 'FACE' and shape_attribute.data_type == 'INT':
+        shape_attribute.data.foreach_get("value", polygon_shapes)
+    
     bpy.data.objects.remove(temp_obj, do_unlink=True)
         
     input_matrix = compose_matrix(shape_obj, landscape_scale)
     input_position = input_matrix.to_translation()
     
     input_matrix.translation = Vector((0.0, 0.0, 0.0))
-
-    cpo_shape.data.matrix = input_matrix.transposed()
-    cpo_shape.data.position_x = input_position.x
-    cpo_shape.data.position_y = input_position.y
-    cpo_shape.data.position_z = input_position.z
+    
+    for shape_index in np.unique(polygon_shapes):
+        cpo_shape = CpoShape()
+        cpo_shape.type = 3
+        
+        cpo_shape.data = CpoShapeDataMesh()
+        
+        shape_vertices, shape_polygon_indices, shape_polygon_offsets = select_polygons(cpo_vertices, polygon_indices, polygon_offsets, polygon_shapes == shape_index)
+        
+        if len(shape_vertices) > CPO_MAX_SHAPE_VERTICES:
+            print(f"{shape_obj.name}: shape {shape_index} has {len(shape_vertices)} vertices, more than 16-bit indices can address")
+            statistics.oversized_shapes.append(shape_obj.name)
+            continue
+        
+        cpo_shape.data.vertices = shape_vertices
+        cpo_shape.data.polygon_indices = shape_polygon_indices.astype(np.uint16)
+        cpo_shape.data.polygon_offsets = shape_polygon_offsets
+        
+        cpo_shape.data.matrix = input_matrix.to_3x3().transposed()
+        cpo_shape.data.position_x = input_position.x
+        cpo_shape.data.position_y = input_position.y
+        cpo_shape.data.position_z = input_position.z
+        
+        process_cpo_shape(cpo, cpo_shape, settings, statistics)
+        
+def process_cpo_shape(cpo : CpoFile, cpo_shape : CpoShape, settings : CpoExportSettings, statistics : CpoExportStatistics):
+    statistics.polygons_before += cpo_shape.data.get_polygon_count()
+    statistics.vertices_before += len(cpo_shape.data.vertices)
+    
+    if settings.use_weld:
+        cpo_shape_data : CpoShapeDataMesh = cpo_shape.data
+        
+        cpo_shape_data.vertices, polygon_indices, cpo_shape_data.polygon_offsets = weld_vertices(
+            cpo_shape_data.vertices,
+            cpo_shape_data.polygon_indices,
+            cpo_shape_data.polygon_offsets,
+            settings.weld_distance
+        )
+        
+        cpo_shape_data.polygon_indices = polygon_indices.astype(np.uint16)
+        
+    statistics.vertices_after += len(cpo_shape.data.vertices)
+    
+    if settings.use_fit_primitives:
+        primitive_shape = fit_primitive_shape(cpo_shape, settings.primitive_max_error)
+        
+        if primitive_shape is not None:
+            statistics.primitives += 1
+            
+            cpo.shapes.append(primitive_shape)
+            
+            return
+    
+    if settings.use_decimate:
+        decimate_mesh_shape(cpo_shape.data, settings.decimate_polygon_budget, settings.decimate_max_error)
+        
+    if settings.use_merge_coplanar:
+        cpo_shape_data : CpoShapeDataMesh = cpo_shape.data
+        
+        cpo_shape_data.polygon_indices, cpo_shape_data.polygon_offsets = merge_coplanar_polygons(
+            cpo_shape_data.vertices,
+            cpo_shape_data.polygon_indices,
+            cpo_shape_data.polygon_offsets,
+            settings.merge_angle
+        )
+        
+    statistics.polygons_after += cpo_shape.data.get_polygon_count()
     
     cpo.shapes.append(cpo_shape)
 
@@ -159,6 +359,12 @@ class ImportCpo(Operator, ImportHelper):
         maxlen=255
     )
 
+    use_merge_shapes: BoolProperty(
+        name="Merge Shapes",
+        description="Import all mesh shapes into a single object, keeping the shape of every polygon in a face attribute",
+        default=False,
+    )
+
     def execute(self, context):
         print("ImportCpo.execute() IN")
         cpo_file_path = Path(self.filepath)
@@ -169,8 +375,11 @@ class ImportCpo(Operator, ImportHelper):
         with cpo_file_path.open('rb') as cpo_reader:
             cpo.deserialize(cpo_reader)
                 
-        for i in range(len(cpo.shapes)):
-            add_cpo_shape(cpo, i)
+        if self.use_merge_shapes:
+            add_merged_cpo_shapes(cpo)
+        else:
+            for i in range(len(cpo.shapes)):
+                add_cpo_shape(cpo, i)
 
         print("ImportCpo.execute() OUT")
 
@@ -189,18 +398,250 @@ class ExportCpo(Operator, ExportHelper):
         maxlen=255
     )
     
+    use_weld: BoolProperty(
+        name="Weld Vertices",
+        description="Merge collision vertices that are closer than the weld distance",
+        default=False,
+    )
+
+    weld_distance: FloatProperty(
+        name="Weld Distance",
+        description="Grid spacing vertices are snapped to before merging",
+        default=0.001,
+        min=0.0,
+        subtype='DISTANCE',
+    )
+
+    use_decimate: BoolProperty(
+        name="Decimate",
+        description="Reduce the polygon count of every collision shape",
+        default=False,
+    )
+
+    decimate_mode: EnumProperty(
+        name="Decimate Mode",
+        description="How far each collision shape is decimated",
+        items=(
+            ('BUDGET', "Polygon Budget", "Decimate each shape down to a target number of polygons"),
+            ('TOLERANCE', "Error Tolerance", "Decimate each shape as long as the surface moves less than the tolerance")
+        ),
+        default='BUDGET',
+    )
+
+    decimate_polygon_budget: IntProperty(
+        name="Polygon Budget",
+        description="Target number of polygons per collision shape",
+        default=500,
+        min=1,
+    )
+
+    decimate_tolerance: FloatProperty(
+        name="Tolerance",
+        description="Largest distance the collision surface may move",
+        default=0.01,
+        min=0.0,
+        subtype='DISTANCE',
+    )
+
+
+    use_merge_coplanar: BoolProperty(
+        name="Merge Coplanar Polygons",
+        description="Merge neighbouring coplanar polygons into larger convex polygons",
+        default=False,
+    )
+
+    merge_angle: FloatProperty(
+        name="Merge Angle",
+        description="Largest angle between the normals of polygons that are merged",
+        default=0.0174533,
+        min=0.0,
+        max=0.785398,
+        subtype='ANGLE',
+    )
+
+    use_fit_primitives: BoolProperty(
+        name="Fit Primitives",
+        description="Export collision objects that are close to a sphere or a box as that primitive",
+        default=False,
+    )
+
+    primitive_tolerance: FloatProperty(
+        name="Primitive Tolerance",
+        description="Largest distance between the collision surface and the primitive replacing it",
+        default=0.01,
+        min=0.0,
+        subtype='DISTANCE',
+    )
+
+    use_convex_decomposition: BoolProperty(
+        name="Convex Decomposition",
+        description="Split the active collision object into convex hulls, each exported as its own shape",
+        default=False,
+    )
+
+    max_hulls: IntProperty(
+        name="Max Hulls",
+        description="Largest number of convex hulls per collision shape",
+        default=16,
+        min=1,
+        max=256,
+    )
+
+    max_concavity: FloatProperty(
+        name="Concavity Tolerance",
+        description="How far the surface may lie inside the convex hull that replaces it",
+        default=0.05,
+        min=0.0,
+        subtype='DISTANCE',
+    )
+
+    max_hull_vertices: IntProperty(
+        name="Max Hull Vertices",
+        description="Largest number of vertices per convex hull",
+        default=32,
+        min=4,
+        max=1024,
+    )
+    
     def execute(self, context):
         print("ExportCpo.execute() IN")
         cpo_file_path = Path(self.filepath)
         print("cpo_file_path:", cpo_file_path)
         
+        landscape_scale = 10
+        
         cpo = CpoFile()
         
+        settings = CpoExportSettings()
+        settings.use_weld = self.use_weld
+        settings.weld_distance = self.weld_distance * landscape_scale
+        settings.use_decimate = self.use_decimate
+        settings.use_merge_coplanar = self.use_merge_coplanar
+        settings.merge_angle = self.merge_angle
+        settings.use_fit_primitives = self.use_fit_primitives
+        settings.primitive_max_error = self.primitive_tolerance * landscape_scale
+        
+        if self.decimate_mode == 'BUDGET':
+            settings.decimate_polygon_budget = self.decimate_polygon_budget
+        else:
+            settings.decimate_max_error = (self.decimate_tolerance * landscape_scale) ** 2
+            
+        statistics = CpoExportStatistics()
+        
+        # retrieve_cpo_shape changes the active object
+        decompose_obj = context.view_layer.objects.active
+        decompose_shape_indices = set()
+        
         for obj in bpy.context.scene.objects:
             if obj.type == 'MESH' and obj.parent is None and (obj.select_get() and not obj.hide_select):
-                retrieve_cpo_shape(cpo, obj)
+                first_shape_index = len(cpo.shapes)
+                
+                retrieve_cpo_shape(cpo, obj, settings, statistics)
+                
+                if obj == decompose_obj:
+                    decompose_shape_indices.update(range(first_shape_index, len(cpo.shapes)))
+                    
+        context.view_layer.objects.active = decompose_obj
+        
+        if statistics.oversized_shapes:
+            self.report({'ERROR'}, f"{', '.join(sorted(set(statistics.oversized_shapes)))}: shapes with more than {CPO_MAX_SHAPE_VERTICES} vertices can not be exported, split them first")
+            return {'CANCELLED'}
+        
+        if self.use_convex_decomposition and not decompose_shape_indices:
+            self.report({'ERROR'}, "Convex decomposition needs the collision object to split as the active, selected object")
+            return {'CANCELLED'}
+        
+        if self.use_weld:
+            self.report({'INFO'}, f"Welded collision vertices from {statistics.vertices_before} to {statistics.vertices_after}")
+            
+        if self.use_fit_primitives:
+            self.report({'INFO'}, f"Exported {statistics.primitives} shapes as primitives")
+                
+        self.statistics = statistics
+        
+        if not self.use_convex_decomposition:
+            return self.write_cpo(cpo)
+        
+        job = CpoDecompositionJob()
+        job.cpo = cpo
+        job.source_shapes = cpo.shapes
+        job.decompose_shape_indices = decompose_shape_indices
+        job.max_hulls = self.max_hulls
+        job.max_concavity = self.max_concavity * landscape_scale
+        job.max_hull_vertices = self.max_hull_vertices
+        
+        self.job = job
+        
+        # without a window there is nothing to stay responsive for, e.g. in background mode
+        if context.window is None:
+            decompose_shape_batch(job)
+            
+            return self.finish_decomposition()
+        
+        job.window_manager = context.window_manager
+        job.window_manager.progress_begin(0, max(len(job.source_shapes), 1))
+        
+        job.timer = functools.partial(decompose_shape_batch, job)
+        bpy.app.timers.register(job.timer)
+        
+        # wakes the modal handler up to notice the end of the decomposition without user input
+        self.event_timer = context.window_manager.event_timer_add(0.1, window=context.window)
+        
+        context.window_manager.modal_handler_add(self)
+        
+        return {'RUNNING_MODAL'}
+    
+    def modal(self, context, event):
+        job : CpoDecompositionJob = self.job
+        
+        if event.type == 'ESC':
+            job.finished = True
+            
+            if bpy.app.timers.is_registered(job.timer):
+                bpy.app.timers.unregister(job.timer)
+                
+            context.window_manager.event_timer_remove(self.event_timer)
+            context.window_manager.progress_end()
+            
+            self.report({'WARNING'}, f"Collision export cancelled after decomposing {job.decomposed_shapes} of {len(job.source_shapes)} shapes")
+            
+            print("ExportCpo.modal() cancelled")
+            
+            return {'CANCELLED'}
+        
+        if job.finished:
+            context.window_manager.event_timer_remove(self.event_timer)
+            context.window_manager.progress_end()
+            
+            return self.finish_decomposition()
+        
+        return {'PASS_THROUGH'}
+    
+    def finish_decomposition(self):
+        job : CpoDecompositionJob = self.job
+        
+        if job.error is not None:
+            self.report({'ERROR'}, job.error)
+            
+            return {'CANCELLED'}
+        
+        self.statistics.polygons_after = sum(cpo_shape.data.get_polygon_count() for cpo_shape in job.cpo.shapes if cpo_shape.type == 3)
+        
+        number_of_hulls = len(job.cpo.shapes) - (len(job.source_shapes) - len(job.decompose_shape_indices))
+        
+        self.report({'INFO'}, f"Decomposed {len(job.decompose_shape_indices)} shapes into {number_of_hulls} convex hulls")
+        
+        return self.write_cpo(job.cpo)
+    
+    def write_cpo(self, cpo : CpoFile):
+        statistics : CpoExportStatistics = self.statistics
+        
+        if self.use_decimate or self.use_merge_coplanar or self.use_fit_primitives or self.use_convex_decomposition:
+            print(f"polygons: {statistics.polygons_before} -> {statistics.polygons_after}")
+            
+            self.report({'INFO'}, f"Reduced collision from {statistics.polygons_before} to {statistics.polygons_after} polygons")
                 
-        with cpo_file_path.open('wb') as cpo_writer:
+        with Path(self.filepath).open('wb') as cpo_writer:
             cpo.serialize(cpo_writer)
 
         print("ExportCpo.execute() OUT")
@@ -0,0 +1,105 @@
+import hashlib
+import numpy as np
+
+from collections import OrderedDict
+
+from .utils import hash_array, hash_collection
+
+MAX_CACHE_SIZE = 64 * 1024 * 1024
+
+class MoxExportCache:
+    def __init__(self, max_size : int = MAX_CACHE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, key : str):
+        block = self.entries.get(key)
+
+        if block is not None:
+            self.entries.move_to_end(key)
+
+        return block
+
+    def put(self, key : str, block):
+        if key in self.entries:
+            self.size -= get_block_size(self.entries.pop(key))
+
+        block_size = get_block_size(block)
+
+        if block_size > self.max_size:
+            return
+
+        self.entries[key] = block
+        self.size += block_size
+
+        while self.size > self.max_size:
+            _, evicted_block = self.entries.popitem(last=False)
+            self.size -= get_block_size(evicted_block)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+# .blend file path -> cache, emptied whenever a file is loaded
+export_caches = {}
+
+def get_export_cache(blend_file_path : str) -> MoxExportCache:
+    """
+    Return the export cache belonging to a .blend file, creating it on
+    first use. Unsaved files all have an empty path, so they get no cache.
+    """
+    if not blend_file_path:
+        return None
+
+    if blend_file_path not in export_caches:
+        export_caches[blend_file_path] = MoxExportCache()
+
+    return export_caches[blend_file_path]
+
+def clear_export_caches():
+    for export_cache in export_caches.values():
+        export_cache.clear()
+
+    export_caches.clear()
+
+def get_block_size(block) -> int:
+    return block.vertices.nbytes + block.tangents.nbytes + block.triangles.nbytes + 24 * len(block.chunks)
+
+def compute_part_key(part_obj, geometry_options : tuple) -> str:
+    """Hash everything retrieve_part reads from a part object into a cache key."""
+    hasher = hashlib.blake2b(digest_size=20)
+
+    mesh = part_obj.data
+
+    mesh.calc_normals_split()
+
+    hash_collection(hasher, mesh.vertices, "co", np.float32, 3)
+    hash_collection(hasher, mesh.edges, "vertices", np.int32, 2)
+    hash_collection(hasher, mesh.loops, "vertex_index", np.int32)
+    hash_collection(hasher, mesh.loops, "normal", np.float32, 3)
+    hash_collection(hasher, mesh.polygons, "loop_total", np.int32)
+    hash_collection(hasher, mesh.polygons, "material_index", np.int32)
+
+    for uv_layer in mesh.uv_layers[:2]:
+        hasher.update(uv_layer.name.encode())
+        hash_collection(hasher, uv_layer.data, "uv", np.float32, 2)
+
+    material_names = [slot.material.name if slot.material else "" for slot in part_obj.material_slots]
+
+    part_properties = part_obj.mox_part_properties
+
+    hasher.update(repr((
+        material_names,
+        part_properties.type,
+        part_properties.enable_deformation,
+        part_properties.enable_detachment,
+        part_properties.enable_animation,
+        tuple(part_properties.swing_min),
+        tuple(part_properties.swing_max),
+        tuple(part_properties.center),
+        part_properties.radius,
+        geometry_options
+    )).encode())
+
+    return hasher.hexdigest()
@@ -4,10 +4,11 @@ import bmesh
 import struct
 import math
 import io
+import copy
 import numpy as np
 
 from bpy_extras.io_utils import ImportHelper, ExportHelper
-from bpy.props import StringProperty, BoolProperty, EnumProperty
+from bpy.props import StringProperty, BoolProperty, EnumProperty, IntProperty, FloatVectorProperty
 from bpy.types import Operator
 from mathutils import Vector, Matrix
 from math import radians, degrees
@@ -15,6 +16,9 @@ from typing import List
 from pathlib import Path
 
 from .MoxPanels import *
+from .MoxExportCache import *
+from .VertexCache import *
+from .Simplify import *
 from .Markers import *
 from .utils import *
 
@@ -550,6 +554,35 @@ class Ref:
     def get(self):
         return self.value
     
+class MoxPartBlock:
+    def __init__(self):
+        self.vertices = np.empty((0, 10), dtype=np.float32)
+        self.tangents = np.empty((0, 8), dtype=np.float16)
+        self.triangles = np.empty((0, 3), dtype=np.uint32)
+        self.chunks = []
+        self.material_names = []
+        self.cache_misses_before = 0
+        self.cache_misses_after = 0
+        
+class MoxExportSettings:
+    def __init__(self):
+        self.use_triangulate = True
+        self.use_vertex_cache_optimization = False
+        self.use_shared_vertices = False
+        self.export_cache = None
+        self.part_blocks = None
+        
+    def geometry_options(self) -> tuple:
+        return (self.use_triangulate, self.use_vertex_cache_optimization, self.use_shared_vertices)
+        
+class MoxExportStatistics:
+    def __init__(self):
+        self.exported_parts = 0
+        self.cached_parts = 0
+        self.triangles = 0
+        self.cache_misses_before = 0
+        self.cache_misses_after = 0
+    
 class NativePart:
     def __init__(self, obj, mox_part : MoxPart, parent_part : 'NativePart', index : int, child_index : int):
         self.obj = obj
@@ -801,10 +834,13 @@ def add_part(mox, part_index, parent_obj, material_data, part_objs : []):
     uvs1 = {}
     uvs2 = {}
     
-    part_material_indices = []
+    material_slots = {}
+    face_material_slots = []
     
     for i in range(mox_part.firstChunk, mox_part.firstChunk + mox_part.chunkCount):
         mox_chunk : MoxChunk = mox.chunks[i]
+        
+        material_slot = material_slots.setdefault(mox_chunk.materialIndex, len(material_slots))
     
         for j in range(mox_chunk.firstTriangle, mox_chunk.firstTriangle + mox_chunk.triangleCount):
             mox_triangle = mox.triangles[j]
@@ -839,9 +875,7 @@ def add_part(mox, part_index, parent_obj, material_data, part_objs : []):
                     loop[uv_layer1].uv = uvs1[vertex_index]
                     loop[uv_layer2].uv = uvs2[vertex_index]
 
-                face.material_index = len(part_material_indices)
-                
-        part_material_indices.append(mox_chunk.materialIndex)
+                face_material_slots.append(material_slot)
           
     bm.verts.ensure_lookup_table()
     bm.faces.ensure_lookup_table()
@@ -860,11 +894,10 @@ def add_part(mox, part_index, parent_obj, material_data, part_objs : []):
     bm.to_mesh(mesh)
     bm.free()
         
-    for i in range(len(part_material_indices)):
-        part_material_index = part_material_indices[i]
-        part_material = material_data.materials[part_material_index]
-        mesh.materials.append(part_material)
-        #print(f"part material {i} -> index {part_material_index}")
+    for material_index in material_slots:
+        mesh.materials.append(material_data.materials[material_index])
+        
+    mesh.polygons.foreach_set("material_index", face_material_slots)
         
     mesh.normals_split_custom_set_from_vertices([v.normal for v in mesh.vertices])
     
@@ -914,74 +947,17 @@ def retrieve_native_part(native_part : NativePart, part_index_ref : Ref):
             native_part.child_parts.append(child_native_part)
             retrieve_native_part(child_native_part, part_index_ref)
     
-def retrieve_part(mox : MoxFile, native_part : NativePart, source_materials : [], part_objs : [], use_triangulate : bool):
-    part_obj = native_part.obj
-    
-    part_index = native_part.index
-    
-    part_objs[part_index] = part_obj
-    
-    print(f"part {part_index}: {part_obj.name}:")
-    
-    temp_obj = part_obj.copy()
-    temp_obj.data = part_obj.data.copy()
-    bpy.context.collection.objects.link(temp_obj)
-    
-    bpy.context.view_layer.objects.active = temp_obj
-    temp_obj.select_set(True)
-    bpy.ops.object.mode_set(mode='OBJECT')
-    
-    if use_triangulate:
-        tri_mod = temp_obj.modifiers.new(name="Triangulate", type='TRIANGULATE')
-        bpy.ops.object.modifier_apply(modifier=tri_mod.name)
-        
+def extract_part_block(part_obj, mesh, use_shared_vertices : bool) -> MoxPartBlock:
     landscape_scale = 10
     
-    mox_part = MoxPart()
-    mox_part.name = part_obj.name
+    block = MoxPartBlock()
     
-    part_type_name = part_obj.mox_part_properties.type
-    part_type = PartType[part_type_name].value
-    mox_part.typeId = part_type
-    
-    enable_deformation = part_obj.mox_part_properties.enable_deformation
-    enable_detachment = part_obj.mox_part_properties.enable_detachment
-    enable_animation = part_obj.mox_part_properties.enable_animation
-    
-    options = 0
-    
-    options |= (not enable_deformation) << 0
-    options |= (not enable_detachment) << 1
-    options |= (not enable_animation) << 2
-
-    mox_part.options = options
-    
-    mox_part.x1 = radians(part_obj.mox_part_properties.swing_min.x)
-    mox_part.y1 = radians(part_obj.mox_part_properties.swing_min.z)
-    mox_part.z1 = radians(part_obj.mox_part_properties.swing_min.y)
-    
-    mox_part.x2 = radians(part_obj.mox_part_properties.swing_max.x)
-    mox_part.y2 = radians(part_obj.mox_part_properties.swing_max.z)
-    mox_part.z2 = radians(part_obj.mox_part_properties.swing_max.y)
-    
-    mox_part.midX = part_obj.mox_part_properties.center.x * landscape_scale
-    mox_part.midY = part_obj.mox_part_properties.center.z * landscape_scale
-    mox_part.midZ = part_obj.mox_part_properties.center.y * landscape_scale
-    
-    mox_part.radius = part_obj.mox_part_properties.radius * landscape_scale
-
-    input_matrix = compose_matrix(part_obj, landscape_scale)
-    mox_part.matrix = input_matrix.transposed()
-    
-    mox_part.firstChunk = len(mox.chunks)
+    block_vertices = []
+    block_tangents = []
+    block_triangles = []
     
     chunk_triangle_indices = {}
     
-    mesh = temp_obj.data
-
-    mesh.calc_loop_triangles()
-    mesh.calc_normals_split()
-    
     uv_layers = [uv_layer.name for uv_layer in mesh.uv_layers]
     
     for uv_index in range(min(len(uv_layers), 2)):
@@ -999,6 +975,8 @@ def retrieve_part(mox : MoxFile, native_part : NativePart, source_materials : []
         
         chunk_triangle_indices[material_slot_index].append(polygon_index)
         
+    used_vertex_indices = {}
+        
     for material_slot_index in range(max(1, len(part_obj.material_slots))):
         source_triangle_indices = chunk_triangle_indices[material_slot_index]
         
@@ -1007,18 +985,19 @@ def retrieve_part(mox : MoxFile, native_part : NativePart, source_materials : []
         chunk_last_vertex = 0
         chunk_triangle_count = 0
         
-        used_vertex_indices = {}
+        if not use_shared_vertices:
+            used_vertex_indices = {}
         
         for i, source_triangle_index in enumerate(source_triangle_indices):
             polygon = mesh.polygons[source_triangle_index]
             
             if len(polygon.loop_indices) > 3:
                 print("found non-triangle polygon, aborting")
-                return
+                return None
             
             polygon.use_smooth = True
             
-            triangle_index = len(mox.triangles)
+            triangle_index = len(block_triangles)
 
             vertex_indices = []
 
@@ -1069,39 +1048,37 @@ def retrieve_part(mox : MoxFile, native_part : NativePart, source_materials : []
                 
                 vertex_key = (tuple(position), (u1, v1, u2, v2), tuple(normal))
                 
+                # vertices on material seams may only be shared if their tangents agree as well
+                if use_shared_vertices:
+                    vertex_key += (
+                        t1.tobytes() if t1 is not None else None,
+                        t2.tobytes() if t2 is not None else None
+                    )
+                
                 if vertex_key not in used_vertex_indices:
-                    used_vertex_indices[vertex_key] = len(mox.vertices)
-            
-                    mox_vertex = MoxVertex()
-                    mox_tangent = MoxTangent()
-            
-                    mox_vertex.positionX = position.x * landscape_scale
-                    mox_vertex.positionY = position.z * landscape_scale
-                    mox_vertex.positionZ = position.y * landscape_scale
-            
-                    mox_vertex.normalX = normal.x
-                    mox_vertex.normalY = normal.z
-                    mox_vertex.normalZ = normal.y
-            
-                    mox_vertex.u1 = u1
-                    mox_vertex.v1 = v1
+                    used_vertex_indices[vertex_key] = len(block_vertices)
                     
-                    mox_vertex.u2 = u2
-                    mox_vertex.v2 = v2
-                            
-                    mox_tangent.uv1 = t1
-                    mox_tangent.uv2 = t2
-                
-                    mox.vertices.append(mox_vertex)
-                    mox.tangents.append(mox_tangent)
+                    block_vertices.append((
+                        position.x * landscape_scale,
+                        position.z * landscape_scale,
+                        position.y * landscape_scale,
+                        normal.x,
+                        normal.z,
+                        normal.y,
+                        u1 or 0.0,
+                        v1 or 0.0,
+                        u2 or 0.0,
+                        v2 or 0.0
+                    ))
+                    
+                    block_tangents.append((
+                        t1 if t1 is not None else np.zeros(4, dtype=np.float16),
+                        t2 if t2 is not None else np.zeros(4, dtype=np.float16)
+                    ))
             
                 vertex_indices.append(used_vertex_indices[vertex_key])
                 
-            mox_triangle = MoxTriangle()
-            mox_triangle.vertexIndex1 = vertex_indices[2]
-            mox_triangle.vertexIndex2 = vertex_indices[1]
-            mox_triangle.vertexIndex3 = vertex_indices[0]
-            mox.triangles.append(mox_triangle)
+            block_triangles.append((vertex_indices[2], vertex_indices[1], vertex_indices[0]))
             
             if i == 0:
                 chunk_first_triangle = triangle_index
@@ -1125,8 +1102,173 @@ def retrieve_part(mox : MoxFile, native_part : NativePart, source_materials : []
             material_index = len(bpy.data.materials)
             material = bpy.data.materials.new(name=f"{material_index} {(0x1000 + material_index):04x}")
 
-        material_name = material.name
+        mox_chunk = MoxChunk()
+        
+        mox_chunk.firstTriangle = chunk_first_triangle
+        mox_chunk.triangleCount = chunk_triangle_count
+        
+        mox_chunk.firstVertex = chunk_first_vertex
+        mox_chunk.lastVertex = chunk_last_vertex
+        
+        block.chunks.append(mox_chunk)
+        block.material_names.append(material.name)
+        
+    block.vertices = np.array(block_vertices, dtype=np.float32).reshape(-1, 10)
+    block.tangents = np.array(block_tangents, dtype=np.float16).reshape(-1, 8)
+    block.triangles = np.array(block_triangles, dtype=np.uint32).reshape(-1, 3)
+    
+    if use_shared_vertices:
+        update_chunk_vertex_ranges(block)
+        
+    return block
+
+def copy_chunk(mox_chunk : MoxChunk) -> MoxChunk:
+    chunk = MoxChunk()
+    chunk.materialIndex = mox_chunk.materialIndex
+    chunk.materialId = mox_chunk.materialId
+    chunk.firstTriangle = mox_chunk.firstTriangle
+    chunk.triangleCount = mox_chunk.triangleCount
+    chunk.firstVertex = mox_chunk.firstVertex
+    chunk.lastVertex = mox_chunk.lastVertex
+    return chunk
+
+def update_chunk_vertex_ranges(block : MoxPartBlock):
+    for chunk in block.chunks:
+        if chunk.triangleCount > 0:
+            chunk_triangles = block.triangles[chunk.firstTriangle:chunk.firstTriangle + chunk.triangleCount]
+            chunk.firstVertex = int(chunk_triangles.min())
+            chunk.lastVertex = int(chunk_triangles.max())
+
+def renumber_block_vertices(block : MoxPartBlock, remove_unused : bool = False):
+    """Renumber the vertices of a block in the order the triangles first use them."""
+    vertex_count = len(block.vertices)
+    
+    used_vertices, first_uses = np.unique(block.triangles.ravel(), return_index=True)
+    
+    vertex_order = used_vertices[np.argsort(first_uses, kind='stable')]
+    
+    if not remove_unused:
+        unused_vertices = np.setdiff1d(np.arange(vertex_count), used_vertices)
+        vertex_order = np.concatenate((vertex_order, unused_vertices))
+        
+    vertex_order = vertex_order.astype(np.int64)
+    
+    vertex_remap = np.zeros(vertex_count, dtype=np.uint32)
+    vertex_remap[vertex_order] = np.arange(len(vertex_order), dtype=np.uint32)
+    
+    block.vertices = block.vertices[vertex_order]
+    block.tangents = block.tangents[vertex_order]
+    block.triangles = vertex_remap[block.triangles]
+    
+    update_chunk_vertex_ranges(block)
+
+def optimize_part_block(block : MoxPartBlock) -> MoxPartBlock:
+    optimized_block = MoxPartBlock()
+    optimized_block.vertices = block.vertices
+    optimized_block.tangents = block.tangents
+    optimized_block.triangles = block.triangles.copy()
+    optimized_block.chunks = [copy_chunk(chunk) for chunk in block.chunks]
+    optimized_block.material_names = list(block.material_names)
+    
+    for chunk in optimized_block.chunks:
+        if chunk.triangleCount > 0:
+            first_triangle = chunk.firstTriangle
+            last_triangle = chunk.firstTriangle + chunk.triangleCount
+            
+            chunk_triangles = block.triangles[first_triangle:last_triangle]
+            
+            triangle_order = optimize_vertex_cache(chunk_triangles)
+            
+            optimized_block.triangles[first_triangle:last_triangle] = chunk_triangles[triangle_order]
+            
+    renumber_block_vertices(optimized_block)
+    
+    optimized_block.cache_misses_before = calculate_cache_misses(block.triangles)
+    optimized_block.cache_misses_after = calculate_cache_misses(optimized_block.triangles)
+    
+    return optimized_block
+
+def simplify_part_block(block : MoxPartBlock, triangle_ratio : float) -> MoxPartBlock:
+    simplified_block = MoxPartBlock()
+    simplified_block.vertices = block.vertices
+    simplified_block.tangents = block.tangents
+    simplified_block.material_names = list(block.material_names)
+    
+    vertex_count = len(block.vertices)
+    
+    positions = block.vertices[:, 0:3]
+    vertex_uses = np.bincount(block.triangles.ravel().astype(np.int64), minlength=vertex_count)
+    
+    simplified_triangles = []
+    simplified_triangle_count = 0
+    
+    for chunk in block.chunks:
+        simplified_chunk = copy_chunk(chunk)
+        
+        if chunk.triangleCount > 0:
+            chunk_triangles = block.triangles[chunk.firstTriangle:chunk.firstTriangle + chunk.triangleCount]
+            
+            # chunk borders and vertices shared with other chunks stay in place so the chunks keep fitting together
+            chunk_vertex_uses = np.bincount(chunk_triangles.ravel().astype(np.int64), minlength=vertex_count)
+            locked = get_boundary_vertices(chunk_triangles, vertex_count) | (vertex_uses > chunk_vertex_uses)
+            
+            target_triangle_count = max(1, int(round(chunk.triangleCount * triangle_ratio)))
+            
+            chunk_triangles = simplify_triangles(positions, chunk_triangles, target_triangle_count, locked).astype(np.uint32)
+            
+            simplified_chunk.firstTriangle = simplified_triangle_count if len(chunk_triangles) > 0 else 0
+            simplified_chunk.triangleCount = len(chunk_triangles)
+            
+            simplified_triangles.append(chunk_triangles)
+            simplified_triangle_count += len(chunk_triangles)
+            
+        simplified_block.chunks.append(simplified_chunk)
+        
+    if simplified_triangles:
+        simplified_block.triangles = np.concatenate(simplified_triangles)
+        
+    renumber_block_vertices(simplified_block, remove_unused=True)
+    
+    for chunk in simplified_block.chunks:
+        if chunk.triangleCount == 0:
+            chunk.firstVertex = 0
+            chunk.lastVertex = 0
+    
+    return simplified_block
+
+def append_part_block(mox : MoxFile, mox_part : MoxPart, block : MoxPartBlock, source_materials : []):
+    vertex_base = len(mox.vertices)
+    triangle_base = len(mox.triangles)
+    
+    mox_part.firstChunk = len(mox.chunks)
+    
+    for block_vertex, block_tangent in zip(block.vertices.tolist(), block.tangents):
+        mox_vertex = MoxVertex()
+        mox_vertex.positionX = block_vertex[0]
+        mox_vertex.positionY = block_vertex[1]
+        mox_vertex.positionZ = block_vertex[2]
+        mox_vertex.normalX = block_vertex[3]
+        mox_vertex.normalY = block_vertex[4]
+        mox_vertex.normalZ = block_vertex[5]
+        mox_vertex.u1 = block_vertex[6]
+        mox_vertex.v1 = block_vertex[7]
+        mox_vertex.u2 = block_vertex[8]
+        mox_vertex.v2 = block_vertex[9]
+        mox.vertices.append(mox_vertex)
+        
+        mox_tangent = MoxTangent()
+        mox_tangent.uv1 = block_tangent[0:4]
+        mox_tangent.uv2 = block_tangent[4:8]
+        mox.tangents.append(mox_tangent)
         
+    for block_triangle in (block.triangles.astype(np.int64) + vertex_base).tolist():
+        mox_triangle = MoxTriangle()
+        mox_triangle.vertexIndex1 = block_triangle[0]
+        mox_triangle.vertexIndex2 = block_triangle[1]
+        mox_triangle.vertexIndex3 = block_triangle[2]
+        mox.triangles.append(mox_triangle)
+        
+    for block_chunk, material_name in zip(block.chunks, block.material_names):
         if material_name not in source_materials:
             source_materials.append(material_name)
             
@@ -1136,19 +1278,115 @@ def retrieve_part(mox : MoxFile, native_part : NativePart, source_materials : []
         mox_chunk.materialIndex = material_index
         mox_chunk.materialId = 0x1000 + material_index
         
-        mox_chunk.firstTriangle = chunk_first_triangle
-        mox_chunk.triangleCount = chunk_triangle_count
-        
-        mox_chunk.firstVertex = chunk_first_vertex
-        mox_chunk.lastVertex = chunk_last_vertex
+        # empty chunks keep their zeroed ranges
+        if block_chunk.triangleCount > 0:
+            mox_chunk.firstTriangle = block_chunk.firstTriangle + triangle_base
+            mox_chunk.triangleCount = block_chunk.triangleCount
+            mox_chunk.firstVertex = block_chunk.firstVertex + vertex_base
+            mox_chunk.lastVertex = block_chunk.lastVertex + vertex_base
         
         mox.chunks.append(mox_chunk)
         
         mox_part.chunkCount += 1
+
+def retrieve_part(mox : MoxFile, native_part : NativePart, source_materials : [], part_objs : [], settings : MoxExportSettings, statistics : MoxExportStatistics):
+    part_obj = native_part.obj
+    
+    part_index = native_part.index
+    
+    part_objs[part_index] = part_obj
+    
+    print(f"part {part_index}: {part_obj.name}:")
+    
+    landscape_scale = 10
+    
+    mox_part = MoxPart()
+    mox_part.name = part_obj.name
+    
+    part_type_name = part_obj.mox_part_properties.type
+    part_type = PartType[part_type_name].value
+    mox_part.typeId = part_type
+    
+    enable_deformation = part_obj.mox_part_properties.enable_deformation
+    enable_detachment = part_obj.mox_part_properties.enable_detachment
+    enable_animation = part_obj.mox_part_properties.enable_animation
+    
+    options = 0
+    
+    options |= (not enable_deformation) << 0
+    options |= (not enable_detachment) << 1
+    options |= (not enable_animation) << 2
+
+    mox_part.options = options
+    
+    mox_part.x1 = radians(part_obj.mox_part_properties.swing_min.x)
+    mox_part.y1 = radians(part_obj.mox_part_properties.swing_min.z)
+    mox_part.z1 = radians(part_obj.mox_part_properties.swing_min.y)
+    
+    mox_part.x2 = radians(part_obj.mox_part_properties.swing_max.x)
+    mox_part.y2 = radians(part_obj.mox_part_properties.swing_max.z)
+    mox_part.z2 = radians(part_obj.mox_part_properties.swing_max.y)
+    
+    mox_part.midX = part_obj.mox_part_properties.center.x * landscape_scale
+    mox_part.midY = part_obj.mox_part_properties.center.z * landscape_scale
+    mox_part.midZ = part_obj.mox_part_properties.center.y * landscape_scale
+    
+    mox_part.radius = part_obj.mox_part_properties.radius * landscape_scale
+
+    input_matrix = compose_matrix(part_obj, landscape_scale)
+    mox_part.matrix = input_matrix.transposed()
+    
+    block = None
+    cache_key = None
+    
+    if settings.export_cache is not None:
+        cache_key = compute_part_key(part_obj, settings.geometry_options())
+        block = settings.export_cache.get(cache_key)
         
-    mox.parts.append(mox_part)
+    if block is not None:
+        statistics.cached_parts += 1
+    else:
+        temp_obj = part_obj.copy()
+        temp_obj.data = part_obj.data.copy()
+        bpy.context.collection.objects.link(temp_obj)
+        
+        bpy.context.view_layer.objects.active = temp_obj
+        temp_obj.select_set(True)
+        bpy.ops.object.mode_set(mode='OBJECT')
+        
+        if settings.use_triangulate:
+            tri_mod = temp_obj.modifiers.new(name="Triangulate", type='TRIANGULATE')
+            bpy.ops.object.modifier_apply(modifier=tri_mod.name)
+        
+        mesh = temp_obj.data
+
+        mesh.calc_loop_triangles()
+        mesh.calc_normals_split()
+        
+        block = extract_part_block(part_obj, mesh, settings.use_shared_vertices)
+        
+        bpy.data.objects.remove(temp_obj, do_unlink=True)
+        
+        if block is None:
+            return
+        
+        if settings.use_vertex_cache_optimization:
+            block = optimize_part_block(block)
+        
+        if cache_key is not None:
+            settings.export_cache.put(cache_key, block)
+            
+    statistics.exported_parts += 1
+    statistics.triangles += len(block.triangles)
+    statistics.cache_misses_before += block.cache_misses_before
+    statistics.cache_misses_after += block.cache_misses_after
     
-    bpy.data.objects.remove(temp_obj, do_unlink=True)
+    append_part_block(mox, mox_part, block, source_materials)
+    
+    if settings.part_blocks is not None:
+        settings.part_blocks.append(block)
+        
+    mox.parts.append(mox_part)
     
     parent_part = native_part.parent_part
 
@@ -1173,7 +1411,61 @@ def retrieve_part(mox : MoxFile, native_part : NativePart, source_materials : []
         mox_part.child = native_part.child_parts[0].index
         
     for i, child_part in enumerate(native_part.child_parts):
-        retrieve_part(mox, child_part, source_materials, part_objs, use_triangulate)
+        retrieve_part(mox, child_part, source_materials, part_objs, settings, statistics)
+
+def get_max_vertex_index(part_blocks : []) -> int:
+    """Largest vertex index of the blocks once appended one after another."""
+    max_vertex_index = 0
+    vertex_base = 0
+    
+    for block in part_blocks:
+        if len(block.triangles) > 0:
+            max_vertex_index = max(max_vertex_index, vertex_base + int(block.triangles.max()))
+            
+        vertex_base += len(block.vertices)
+        
+    return max_vertex_index
+
+def get_mox_options(mox : MoxFile, part_blocks : []) -> int:
+    # triangles index the file-wide vertex array (append_part_block adds each
+    # part's vertex base, add_part reads mox.vertices[index] directly) and the
+    # index width is a single file option, so parts can not be split into
+    # 16-bit sub-parts, only the file as a whole fits in 16 bits or not
+    use_big_indices = get_max_vertex_index(part_blocks) > 0xFFFF
+    use_tangents = mox.version == 0x0203 and len(mox.tangents) > 0
+    
+    options = 0
+    options |= (int(use_big_indices) & 1) << 0
+    options |= (int(use_tangents) & 1) << 1
+    
+    return options
+
+def build_lod_mox(mox : MoxFile, part_blocks : [], source_materials : [], triangle_ratio : float) -> MoxFile:
+    lod_mox = MoxFile()
+    lod_mox.version = mox.version
+    
+    lod_source_materials = list(source_materials)
+    
+    lod_blocks = []
+    
+    for mox_part, block in zip(mox.parts, part_blocks):
+        lod_part = copy.copy(mox_part)
+        lod_part.chunkCount = 0
+        
+        lod_block = simplify_part_block(block, triangle_ratio)
+        lod_blocks.append(lod_block)
+        
+        append_part_block(lod_mox, lod_part, lod_block, lod_source_materials)
+        
+        lod_mox.parts.append(lod_part)
+        
+    lod_mox.markers = mox.markers
+    lod_mox.markerParameters = mox.markerParameters
+    lod_mox.materials = mox.materials
+    
+    lod_mox.options = get_mox_options(lod_mox, lod_blocks)
+    
+    return lod_mox
 
 def retrieve_marker(mox : MoxFile, marker_index : int, marker_objs : [], part_objs : []):
     marker_obj = marker_objs[marker_index]
@@ -1421,6 +1713,41 @@ class ExportMox(Operator, ExportHelper):
         default=True,
     )
 
+    use_vertex_cache_optimization: BoolProperty(
+        name="Optimize Vertex Cache",
+        description="Reorder the triangles of each chunk for the post-transform vertex cache and renumber vertices in first-use order",
+        default=False,
+    )
+
+    use_shared_vertices: BoolProperty(
+        name="Share Vertices Across Chunks",
+        description="Share identical vertices between the material chunks of a part instead of duplicating them on material seams",
+        default=False,
+    )
+
+    lod_count: IntProperty(
+        name="LOD Levels",
+        description="Number of simplified level of detail files to write next to the exported file (_lod1, _lod2, ...)",
+        default=0,
+        min=0,
+        max=3,
+    )
+
+    lod_ratios: FloatVectorProperty(
+        name="LOD Triangle Ratios",
+        description="Fraction of triangles each level of detail keeps",
+        size=3,
+        default=(0.5, 0.25, 0.125),
+        min=0.01,
+        max=1.0,
+    )
+
+    use_cache: BoolProperty(
+        name="Use Export Cache",
+        description="Reuse the encoded geometry of parts that are unchanged since the last export of this .blend file",
+        default=True,
+    )
+
     mox_version: EnumProperty(
         name="Version",
         description="Target MOX version",
@@ -1474,17 +1801,34 @@ class ExportMox(Operator, ExportHelper):
         
         source_materials = []
         
-        for native_part in native_parts:
-            retrieve_part(mox, native_part, source_materials, part_objs, self.use_triangulate)
+        settings = MoxExportSettings()
+        settings.use_triangulate = self.use_triangulate
+        settings.use_vertex_cache_optimization = self.use_vertex_cache_optimization
+        settings.use_shared_vertices = self.use_shared_vertices
+        
+        if self.use_cache:
+            settings.export_cache = get_export_cache(bpy.data.filepath)
+            
+            if settings.export_cache is None:
+                self.report({'INFO'}, "The export cache is off until the .blend file is saved")
+            
+        statistics = MoxExportStatistics()
         
-        use_big_indices = len(mox.vertices) > 0xFFFF
-        use_tangents = mox.version == 0x0203 and len(mox.tangents) > 0
+        settings.part_blocks = []
         
-        options = 0
-        options |= (int(use_big_indices) & 1) << 0
-        options |= (int(use_tangents) & 1) << 1
+        for native_part in native_parts:
+            retrieve_part(mox, native_part, source_materials, part_objs, settings, statistics)
+            
+        if settings.export_cache is not None:
+            self.report({'INFO'}, f"Reused {statistics.cached_parts} of {statistics.exported_parts} parts from the export cache")
+            
+        if self.use_vertex_cache_optimization and statistics.triangles > 0:
+            acmr_before = statistics.cache_misses_before / statistics.triangles
+            acmr_after = statistics.cache_misses_after / statistics.triangles
+            
+            self.report({'INFO'}, f"Vertex cache ACMR {acmr_before:.3f} -> {acmr_after:.3f}")
         
-        mox.options = options
+        mox.options = get_mox_options(mox, settings.part_blocks)
         
         for obj in bpy.context.scene.objects:
             if obj.type == 'EMPTY' and obj.parent is None and (obj.select_get() and not obj.hide_select):
@@ -1503,6 +1847,19 @@ class ExportMox(Operator, ExportHelper):
         with mox_file_path.open('wb') as mox_writer:
             mox.serialize(mox_writer)
             
+        for lod_level in range(1, self.lod_count + 1):
+            triangle_ratio = self.lod_ratios[lod_level - 1]
+            
+            lod_mox = build_lod_mox(mox, settings.part_blocks, source_materials, triangle_ratio)
+            
+            lod_file_path = mox_file_path.with_name(f"{mox_file_path.stem}_lod{lod_level}{mox_file_path.suffix}")
+            print("lod_file_path:", lod_file_path)
+            
+            with lod_file_path.open('wb') as lod_writer:
+                lod_mox.serialize(lod_writer)
+                
+            self.report({'INFO'}, f"LOD {lod_level}: {len(lod_mox.triangles)} of {len(mox.triangles)} triangles")
+            
         print("ExportMox.execute() OUT")
 
         return {'FINISHED'}
@@ -1513,14 +1870,22 @@ def menu_func_import(self, context):
 def menu_func_export(self, context):
     self.layout.operator(ExportMox.bl_idname, text="Landscape Object (.mox)")
     
+@bpy.app.handlers.persistent
+def clear_export_caches_on_load(*args):
+    """Drop every cached part when a .blend file is loaded."""
+    clear_export_caches()
+    
 def register():
     bpy.utils.register_class(ImportMox)
     bpy.utils.register_class(ExportMox)
     bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
     bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
+    bpy.app.handlers.load_post.append(clear_export_caches_on_load)
 
 def unregister():
     bpy.utils.unregister_class(ImportMox)
     bpy.utils.unregister_class(ExportMox)
     bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
-    bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
\ No newline at end of file
+    bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
+    bpy.app.handlers.load_post.remove(clear_export_caches_on_load)
+    clear_export_caches()
\ No newline at end of file
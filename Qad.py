@@ -0,0 +1,643 @@
+import copy
+import struct
+import numpy as np
+
+from io import BufferedReader, BufferedWriter, SEEK_CUR
+from pathlib import Path
+
+QAD_SIGNATURE = 0x51414421
+GEO_SIGNATURE = 0x47454F21
+
+QAD_OBJECT_FORMAT = '2H 4I 48s 48s'
+QAD_QUAD_FORMAT = '2H 4I 4f 6H'
+QAD_CHUNK_FORMAT = '2I 1H 2B'
+QAD_MATERIAL_FORMAT = '4H 3H 3H 4f 4f 2I'
+
+# vertex indices are 16 bit
+GEO_MAX_BUFFER_VERTICES = 0x10000
+
+COPY_BLOCK_SIZE = 1 << 20
+
+GEO_VERTEX_DTYPE = np.dtype([
+    ('position', '<f4', 3),
+    ('normal', '<u4'),
+    ('uv1', '<f4', 2),
+    ('uv2', '<f4', 2),
+    ('blend', '<u4'),
+    ('ambient', '<u4')
+])
+
+GEO_TANGENT_DTYPE = np.dtype([
+    ('uv1Tangent', '<f2', 4),
+    ('uv2Tangent', '<f2', 4)
+])
+
+def read_names(reader : BufferedReader, count : int) -> []:
+    return [name.decode().rstrip('\x00') for (name,) in struct.iter_unpack('32s', reader.read(32 * count))]
+
+def write_names(writer : BufferedWriter, names : []):
+    for name in names:
+        writer.write(struct.pack('32s', name.encode()))
+
+def get_buffer_vertex_offsets(buffer_vertex_counts : []) -> np.ndarray:
+    buffer_vertex_offsets = np.zeros(len(buffer_vertex_counts) + 1, dtype=np.int64)
+    np.cumsum(buffer_vertex_counts, out=buffer_vertex_offsets[1:])
+
+    return buffer_vertex_offsets
+
+class QadObject:
+    def __init__(self):
+        self.name = ""
+        self.typeA = 0
+        self.typeB = 0
+        self.weight = 0
+        self.reserved = [0, 0, 0]
+        self.soundA = ""
+        self.soundB = ""
+
+class QadQuad:
+    def __init__(self):
+        self.quadX = 0
+        self.quadY = 0
+        self.firstFace = 0
+        self.numFaces = 0
+        self.firstChunk = 0
+        self.numChunks = 0
+        self.circumSpherePositionX = 0.0
+        self.circumSpherePositionY = 0.0
+        self.circumSpherePositionZ = 0.0
+        self.circumSphereRadius = 0.0
+        self.firstObject = 0
+        self.numObjects = 0
+        self.firstMarker = 0
+        self.numMarkers = 0
+        self.vertexBufferIndex = 0
+        self.reserved = 0
+
+class QadChunk:
+    def __init__(self):
+        self.firstFace = 0
+        self.numFaces = 0
+        self.materialIndex = 0
+        self.viewDistLayer = 0
+        self.reserved = 0
+
+class QadMaterial:
+    def __init__(self):
+        self.textureNameIndices = []
+        self.bumpTextureNameIndices = []
+        self.materialType = 0
+        self.textureAnimIndex = 0
+        self.reserved = 0
+        self.texMods = []
+        self.texModCrcs = []
+
+class QadFile:
+    """
+    Scenario layout file. Everything after the material table (placed
+    objects, texture property groups, markers, sounds, named objects) is
+    kept as raw bytes, together with the header fields that describe it.
+    """
+    def __init__(self):
+        self.header = [0] * 32
+        self.version = 0
+        self.numberOfQuadsX = 0
+        self.numberOfQuadsY = 0
+        self.numberOfPolygons = 0
+        self.textureNames = []
+        self.bumpTextureNames = []
+        self.objects = []
+        self.quads = []
+        self.collisionQuads = b''
+        self.chunks = []
+        self.materials = []
+        self.trailer = b''
+
+    def deserialize(self, reader : BufferedReader):
+        print("QadFile.deserialize()")
+
+        self.header = list(struct.unpack('32I', reader.read(128)))
+
+        self.version = self.header[1]
+        self.numberOfQuadsX = self.header[4]
+        self.numberOfQuadsY = self.header[5]
+        numberOfQuads = self.header[6]
+        numberOfChunks = self.header[7]
+        numberOfTextureNamesTotal = self.header[8]
+        numberOfObjectNames = self.header[9]
+        self.numberOfPolygons = self.header[10]
+        numberOfMaterials = self.header[11]
+        sizeOfCollisionQuads = self.header[14]
+
+        numberOfTextureNames = numberOfTextureNamesTotal & 0xFFFF
+        numberOfBumpTextureNames = (numberOfTextureNamesTotal >> 16) & 0xFFFF
+
+        if True:
+            print("version:", self.version)
+            print("numberOfQuads:", numberOfQuads)
+            print("numberOfChunks:", numberOfChunks)
+            print("numberOfTextureNames:", numberOfTextureNames)
+            print("numberOfBumpTextureNames:", numberOfBumpTextureNames)
+
+        self.textureNames = read_names(reader, numberOfTextureNames)
+        self.bumpTextureNames = read_names(reader, numberOfBumpTextureNames)
+
+        objectNames = read_names(reader, numberOfObjectNames)
+
+        self.objects = []
+
+        objectData = reader.read(struct.calcsize(QAD_OBJECT_FORMAT) * numberOfObjectNames)
+
+        for objectName, readData_object in zip(objectNames, struct.iter_unpack(QAD_OBJECT_FORMAT, objectData)):
+            qad_object = QadObject()
+            qad_object.name = objectName
+            qad_object.typeA = readData_object[0]
+            qad_object.typeB = readData_object[1]
+            qad_object.weight = readData_object[2]
+            qad_object.reserved = list(readData_object[3:6])
+            qad_object.soundA = readData_object[6].decode().rstrip('\x00')
+            qad_object.soundB = readData_object[7].decode().rstrip('\x00')
+            self.objects.append(qad_object)
+
+        self.quads = []
+
+        quadData = reader.read(struct.calcsize(QAD_QUAD_FORMAT) * numberOfQuads)
+
+        for readData_quad in struct.iter_unpack(QAD_QUAD_FORMAT, quadData):
+            quad = QadQuad()
+            quad.quadX = readData_quad[0]
+            quad.quadY = readData_quad[1]
+            quad.firstFace = readData_quad[2]
+            quad.numFaces = readData_quad[3]
+            quad.firstChunk = readData_quad[4]
+            quad.numChunks = readData_quad[5]
+            quad.circumSpherePositionX = readData_quad[6]
+            quad.circumSpherePositionY = readData_quad[7]
+            quad.circumSpherePositionZ = readData_quad[8]
+            quad.circumSphereRadius = readData_quad[9]
+            quad.firstObject = readData_quad[10]
+            quad.numObjects = readData_quad[11]
+            quad.firstMarker = readData_quad[12]
+            quad.numMarkers = readData_quad[13]
+            quad.vertexBufferIndex = readData_quad[14]
+            quad.reserved = readData_quad[15]
+            self.quads.append(quad)
+
+        self.collisionQuads = reader.read(sizeOfCollisionQuads)
+
+        self.chunks = []
+
+        chunkData = reader.read(struct.calcsize(QAD_CHUNK_FORMAT) * numberOfChunks)
+
+        for readData_chunk in struct.iter_unpack(QAD_CHUNK_FORMAT, chunkData):
+            chunk = QadChunk()
+            chunk.firstFace = readData_chunk[0]
+            chunk.numFaces = readData_chunk[1]
+            chunk.materialIndex = readData_chunk[2]
+            chunk.viewDistLayer = readData_chunk[3]
+            chunk.reserved = readData_chunk[4]
+            self.chunks.append(chunk)
+
+        self.materials = []
+
+        materialData = reader.read(struct.calcsize(QAD_MATERIAL_FORMAT) * numberOfMaterials)
+
+        for readData_material in struct.iter_unpack(QAD_MATERIAL_FORMAT, materialData):
+            material = QadMaterial()
+            material.textureNameIndices = list(readData_material[0:4])
+            material.bumpTextureNameIndices = list(readData_material[4:7])
+            material.materialType = readData_material[7]
+            material.textureAnimIndex = readData_material[8]
+            material.reserved = readData_material[9]
+            material.texMods = [ list(readData_material[10:14]), list(readData_material[14:18]) ]
+            material.texModCrcs = list(readData_material[18:20])
+            self.materials.append(material)
+
+        self.trailer = reader.read()
+
+        print("Done reading QAD")
+
+    def serialize(self, writer : BufferedWriter):
+        print("QadFile.serialize()")
+
+        header = list(self.header)
+        header[0] = self.header[0] or QAD_SIGNATURE
+        header[1] = self.version
+        header[4] = self.numberOfQuadsX
+        header[5] = self.numberOfQuadsY
+        header[6] = len(self.quads)
+        header[7] = len(self.chunks)
+        header[8] = (len(self.bumpTextureNames) << 16) | len(self.textureNames)
+        header[9] = len(self.objects)
+        header[10] = self.numberOfPolygons
+        header[11] = len(self.materials)
+        header[14] = len(self.collisionQuads)
+
+        writer.write(struct.pack('32I', *header))
+
+        write_names(writer, self.textureNames)
+        write_names(writer, self.bumpTextureNames)
+        write_names(writer, [qad_object.name for qad_object in self.objects])
+
+        for qad_object in self.objects:
+            writer.write(struct.pack(QAD_OBJECT_FORMAT,
+                qad_object.typeA,
+                qad_object.typeB,
+                qad_object.weight,
+                *qad_object.reserved,
+                qad_object.soundA.encode(),
+                qad_object.soundB.encode()
+            ))
+
+        for quad in self.quads:
+            writer.write(struct.pack(QAD_QUAD_FORMAT,
+                quad.quadX,
+                quad.quadY,
+                quad.firstFace,
+                quad.numFaces,
+                quad.firstChunk,
+                quad.numChunks,
+                quad.circumSpherePositionX,
+                quad.circumSpherePositionY,
+                quad.circumSpherePositionZ,
+                quad.circumSphereRadius,
+                quad.firstObject,
+                quad.numObjects,
+                quad.firstMarker,
+                quad.numMarkers,
+                quad.vertexBufferIndex,
+                quad.reserved
+            ))
+
+        writer.write(self.collisionQuads)
+
+        for chunk in self.chunks:
+            writer.write(struct.pack(QAD_CHUNK_FORMAT,
+                chunk.firstFace,
+                chunk.numFaces,
+                chunk.materialIndex,
+                chunk.viewDistLayer,
+                chunk.reserved
+            ))
+
+        for material in self.materials:
+            writer.write(struct.pack(QAD_MATERIAL_FORMAT,
+                *material.textureNameIndices,
+                *material.bumpTextureNameIndices,
+                material.materialType,
+                material.textureAnimIndex,
+                material.reserved,
+                *material.texMods[0],
+                *material.texMods[1],
+                *material.texModCrcs
+            ))
+
+        writer.write(self.trailer)
+
+class GeoFile:
+    """
+    Scenario geometry file. vertexBuffers and tangentBuffers hold one
+    structured array per buffer, triangles is an (n, 3) uint16 array indexing
+    into the vertex buffer of the quad that uses it.
+    """
+    def __init__(self):
+        self.header = [0] * 8
+        self.version = 0
+        self.vertexFormat = 0
+        self.bufferCount = 0
+        self.indexCount = 0
+        self.bufferVertexCounts = []
+        self.vertexBuffers = []
+        self.tangentBuffers = []
+        self.vertexOffset = 0
+        self.tangentOffset = 0
+        self.indexOffset = 0
+        self.triangles = np.empty((0, 3), dtype=np.uint16)
+        self.trailer = b''
+
+    def deserialize_header(self, reader : BufferedReader):
+        """
+        Read the header and buffer sizes and work out where every block
+        starts, leaving the reader at the vertex data. read_triangles and
+        read_vertices can then fetch parts of the file on their own.
+        """
+        self.header = list(struct.unpack('8I', reader.read(32)))
+
+        self.version = self.header[1]
+        self.vertexFormat = self.header[2]
+        self.bufferCount = self.header[3]
+        self.indexCount = self.header[4]
+
+        if True:
+            print("version:", self.version)
+            print("vertexFormat:", self.vertexFormat)
+            print("bufferCount:", self.bufferCount)
+            print("indexCount:", self.indexCount)
+
+        self.bufferVertexCounts = list(struct.unpack(f'{self.bufferCount}I', reader.read(4 * self.bufferCount)))
+
+        numberOfVertices = sum(self.bufferVertexCounts)
+
+        self.vertexOffset = reader.tell()
+        self.tangentOffset = self.vertexOffset + numberOfVertices * GEO_VERTEX_DTYPE.itemsize
+        self.indexOffset = self.tangentOffset
+
+        if self.vertexFormat > 2:
+            self.indexOffset += numberOfVertices * GEO_TANGENT_DTYPE.itemsize
+
+    def read_triangles(self, reader : BufferedReader, firstFace : int, numFaces : int) -> np.ndarray:
+        reader.seek(self.indexOffset + firstFace * 6)
+
+        return np.frombuffer(reader.read(numFaces * 6), dtype='<u2').reshape(-1, 3)
+
+    def read_vertices(self, reader : BufferedReader, bufferIndex : int, firstVertex : int, numVertices : int) -> np.ndarray:
+        bufferFirstVertex = sum(self.bufferVertexCounts[:bufferIndex])
+
+        reader.seek(self.vertexOffset + (bufferFirstVertex + firstVertex) * GEO_VERTEX_DTYPE.itemsize)
+
+        return np.frombuffer(reader.read(numVertices * GEO_VERTEX_DTYPE.itemsize), dtype=GEO_VERTEX_DTYPE)
+
+    def deserialize(self, reader : BufferedReader, read_tangents : bool = True):
+        """Without read_tangents the tangent block is skipped, map_tangent_buffers can still fetch it later."""
+        print("GeoFile.deserialize()")
+
+        self.deserialize_header(reader)
+
+        # all vertex buffers follow each other, so they are read in one go and split into views
+        bufferVertexOffsets = get_buffer_vertex_offsets(self.bufferVertexCounts)
+
+        numberOfVertices = int(bufferVertexOffsets[-1])
+
+        vertexData = np.frombuffer(reader.read(numberOfVertices * GEO_VERTEX_DTYPE.itemsize), dtype=GEO_VERTEX_DTYPE)
+
+        self.vertexBuffers = [vertexData[bufferVertexOffsets[i]:bufferVertexOffsets[i + 1]] for i in range(self.bufferCount)]
+
+        self.tangentBuffers = []
+
+        if self.vertexFormat > 2:
+            if read_tangents:
+                tangentData = np.frombuffer(reader.read(numberOfVertices * GEO_TANGENT_DTYPE.itemsize), dtype=GEO_TANGENT_DTYPE)
+
+                self.tangentBuffers = [tangentData[bufferVertexOffsets[i]:bufferVertexOffsets[i + 1]] for i in range(self.bufferCount)]
+            else:
+                reader.seek(numberOfVertices * GEO_TANGENT_DTYPE.itemsize, SEEK_CUR)
+
+        indices = np.frombuffer(reader.read(self.indexCount * 2), dtype='<u2')
+
+        self.triangles = indices[:len(indices) // 3 * 3].reshape(-1, 3)
+
+        self.trailer = reader.read()
+
+        print("Done reading GEO")
+
+    def serialize(self, writer : BufferedWriter):
+        print("GeoFile.serialize()")
+
+        self.bufferCount = len(self.vertexBuffers)
+        self.bufferVertexCounts = [len(vertex_buffer) for vertex_buffer in self.vertexBuffers]
+        self.indexCount = self.triangles.size
+
+        header = list(self.header)
+        header[0] = self.header[0] or GEO_SIGNATURE
+        header[1] = self.version
+        header[2] = self.vertexFormat
+        header[3] = self.bufferCount
+        header[4] = self.indexCount
+
+        writer.write(struct.pack('8I', *header))
+
+        writer.write(struct.pack(f'{self.bufferCount}I', *self.bufferVertexCounts))
+
+        for vertex_buffer in self.vertexBuffers:
+            writer.write(np.ascontiguousarray(vertex_buffer, dtype=GEO_VERTEX_DTYPE).tobytes())
+
+        if self.vertexFormat > 2:
+            if len(self.tangentBuffers) != self.bufferCount:
+                print("GEO tangents were not read, writing zero tangents")
+
+                self.tangentBuffers = [np.zeros(len(vertex_buffer), dtype=GEO_TANGENT_DTYPE) for vertex_buffer in self.vertexBuffers]
+
+            for tangent_buffer in self.tangentBuffers:
+                writer.write(np.ascontiguousarray(tangent_buffer, dtype=GEO_TANGENT_DTYPE).tobytes())
+
+        writer.write(np.ascontiguousarray(self.triangles, dtype='<u2').tobytes())
+
+        writer.write(self.trailer)
+
+def map_tangent_buffers(geo_file_path : Path, geo : GeoFile) -> []:
+    """Map the tangent block of a GEO file read-only, split into one view per vertex buffer."""
+    if geo.vertexFormat <= 2:
+        return []
+
+    bufferVertexOffsets = get_buffer_vertex_offsets(geo.bufferVertexCounts)
+
+    if bufferVertexOffsets[-1] == 0:
+        return [np.empty(0, dtype=GEO_TANGENT_DTYPE) for _ in range(geo.bufferCount)]
+
+    tangentData = np.memmap(geo_file_path, dtype=GEO_TANGENT_DTYPE, mode='r', offset=geo.tangentOffset, shape=(int(bufferVertexOffsets[-1]),))
+
+    return [tangentData[bufferVertexOffsets[i]:bufferVertexOffsets[i + 1]] for i in range(geo.bufferCount)]
+
+def decode_packed_normals(packed_normals : np.ndarray) -> np.ndarray:
+    """Unpack 8-bit x, y, z normals from bits 16, 8 and 0, swapped into Blender's z-up order."""
+    normals = np.empty((len(packed_normals), 3), dtype=np.float32)
+    normals[:, 0] = (packed_normals >> 16) & 0xFF
+    normals[:, 1] = (packed_normals >> 0) & 0xFF
+    normals[:, 2] = (packed_normals >> 8) & 0xFF
+
+    return normals / 255
+
+def encode_packed_normals(normals : np.ndarray, source_packed_normals : np.ndarray = None) -> np.ndarray:
+    """
+    Pack normals the way decode_packed_normals reads them. The round trip
+    is lossy: the decode only yields directions with non-negative
+    components, Blender renormalizes them on import, and an edited normal
+    is quantized to 8 bits per component. Each normal is scaled so its
+    largest component becomes 255, which keeps its direction as well as
+    8 bits allow. Where a normal still points along its decoded
+    source_packed_normals, that source value is kept unchanged.
+    """
+    scales = 255 / np.maximum(np.max(normals, axis=1), 1e-12)
+
+    components = np.clip(np.rint(normals * scales[:, None]), 0, 255).astype(np.uint32)
+
+    packed_normals = (components[:, 0] << 16) | (components[:, 2] << 8) | components[:, 1]
+
+    if source_packed_normals is not None and len(source_packed_normals) == len(normals):
+        source_normals = decode_packed_normals(source_packed_normals).astype(np.float64)
+        source_normals /= np.maximum(np.linalg.norm(source_normals, axis=1), 1e-12)[:, None]
+
+        unit_normals = normals / np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:, None]
+
+        # well below the angle between neighbouring 8-bit normals
+        unchanged = np.einsum('ij,ij->i', unit_normals, source_normals) >= 1.0 - 1e-6
+
+        packed_normals[unchanged] = source_packed_normals[unchanged]
+
+    return packed_normals
+
+class QadEditedQuad:
+    """
+    Replacement geometry of one quad. chunks holds (materialIndex,
+    viewDistLayer, triangles) tuples, the triangles indexing into vertices.
+    """
+    def __init__(self):
+        self.vertices = np.empty(0, dtype=GEO_VERTEX_DTYPE)
+        self.chunks = []
+
+def copy_byte_range(reader : BufferedReader, writer : BufferedWriter, offset : int, size : int = -1):
+    """Copy size bytes, or everything up to the end with -1, from offset in reader to writer in blocks."""
+    reader.seek(offset)
+
+    while size != 0:
+        data = reader.read(COPY_BLOCK_SIZE if size < 0 else min(size, COPY_BLOCK_SIZE))
+
+        if not data:
+            break
+
+        writer.write(data)
+
+        if size > 0:
+            size -= len(data)
+
+def write_scenario(qad : QadFile, geo : GeoFile, geo_reader : BufferedReader, editedQuads : {}, qad_writer : BufferedWriter, geo_writer : BufferedWriter):
+    """
+    Write a scenario quad by quad. Quads in editedQuads, keyed by quad index,
+    get their new geometry. The vertices, tangents and triangles of every
+    other quad are copied from the source GEO file unchanged. geo only needs
+    its header read from geo_reader.
+
+    Edited vertices are appended to the quad's vertex buffer, or to a new
+    buffer once it is full. The vertices they replace stay in place, unused,
+    so other quads sharing the buffer keep their indices.
+
+    Returns the indices of edited quads with more vertices than a buffer
+    holds. They are written with their original geometry.
+    """
+    bufferVertexCounts = list(geo.bufferVertexCounts)
+    sourceBufferVertexOffsets = get_buffer_vertex_offsets(geo.bufferVertexCounts)
+
+    appendedVertices = [[] for _ in bufferVertexCounts]
+    placements = {}
+    skippedQuads = []
+
+    for h in sorted(editedQuads):
+        numVertices = len(editedQuads[h].vertices)
+
+        if numVertices > GEO_MAX_BUFFER_VERTICES:
+            print(f"quad {h} has {numVertices} vertices, more than a vertex buffer holds, keeping its original geometry")
+            skippedQuads.append(h)
+            continue
+
+        bufferIndex = qad.quads[h].vertexBufferIndex
+
+        if bufferVertexCounts[bufferIndex] + numVertices > GEO_MAX_BUFFER_VERTICES:
+            bufferIndex = len(bufferVertexCounts) - 1
+
+            if bufferIndex < geo.bufferCount or bufferVertexCounts[bufferIndex] + numVertices > GEO_MAX_BUFFER_VERTICES:
+                bufferIndex = len(bufferVertexCounts)
+
+                bufferVertexCounts.append(0)
+                appendedVertices.append([])
+
+        placements[h] = (bufferIndex, bufferVertexCounts[bufferIndex])
+
+        bufferVertexCounts[bufferIndex] += numVertices
+        appendedVertices[bufferIndex].append(editedQuads[h].vertices)
+
+    numberOfFaces = 0
+
+    for h, quad in enumerate(qad.quads):
+        if h in placements:
+            numberOfFaces += sum(len(triangles) for _, _, triangles in editedQuads[h].chunks)
+        else:
+            numberOfFaces += quad.numFaces
+
+    header = list(geo.header)
+    header[0] = geo.header[0] or GEO_SIGNATURE
+    header[3] = len(bufferVertexCounts)
+    header[4] = numberOfFaces * 3
+
+    geo_writer.write(struct.pack('8I', *header))
+    geo_writer.write(struct.pack(f'{len(bufferVertexCounts)}I', *bufferVertexCounts))
+
+    for i in range(len(bufferVertexCounts)):
+        if i < geo.bufferCount:
+            copy_byte_range(geo_reader, geo_writer, geo.vertexOffset + int(sourceBufferVertexOffsets[i]) * GEO_VERTEX_DTYPE.itemsize, geo.bufferVertexCounts[i] * GEO_VERTEX_DTYPE.itemsize)
+
+        for vertices in appendedVertices[i]:
+            geo_writer.write(np.ascontiguousarray(vertices, dtype=GEO_VERTEX_DTYPE).tobytes())
+
+    if geo.vertexFormat > 2:
+        # edited vertices get zero tangents
+        for i in range(len(bufferVertexCounts)):
+            numAppendedVertices = bufferVertexCounts[i]
+
+            if i < geo.bufferCount:
+                copy_byte_range(geo_reader, geo_writer, geo.tangentOffset + int(sourceBufferVertexOffsets[i]) * GEO_TANGENT_DTYPE.itemsize, geo.bufferVertexCounts[i] * GEO_TANGENT_DTYPE.itemsize)
+
+                numAppendedVertices -= geo.bufferVertexCounts[i]
+
+            geo_writer.write(np.zeros(numAppendedVertices, dtype=GEO_TANGENT_DTYPE).tobytes())
+
+    quads = []
+    chunks = []
+
+    firstFace = 0
+
+    for h, sourceQuad in enumerate(qad.quads):
+        quad = copy.copy(sourceQuad)
+
+        quad.firstFace = firstFace
+        quad.firstChunk = len(chunks)
+
+        if h in placements:
+            edited = editedQuads[h]
+            bufferIndex, firstVertex = placements[h]
+
+            quad.vertexBufferIndex = bufferIndex
+
+            for materialIndex, viewDistLayer, triangles in edited.chunks:
+                chunk = QadChunk()
+                chunk.firstFace = firstFace
+                chunk.numFaces = len(triangles)
+                chunk.materialIndex = materialIndex
+                chunk.viewDistLayer = viewDistLayer
+                chunks.append(chunk)
+
+                geo_writer.write((np.asarray(triangles, dtype=np.int64) + firstVertex).astype('<u2').tobytes())
+
+                firstFace += len(triangles)
+
+            if len(edited.vertices) > 0:
+                positions = edited.vertices['position'].astype(np.float64)
+                center = (positions.min(axis=0) + positions.max(axis=0)) * 0.5
+
+                quad.circumSpherePositionX, quad.circumSpherePositionY, quad.circumSpherePositionZ = center.tolist()
+                quad.circumSphereRadius = float(np.linalg.norm(positions - center, axis=1).max())
+        else:
+            copy_byte_range(geo_reader, geo_writer, geo.indexOffset + sourceQuad.firstFace * 6, sourceQuad.numFaces * 6)
+
+            # chunks lie inside their quad's face range and move with it
+            for i in range(sourceQuad.firstChunk, sourceQuad.firstChunk + sourceQuad.numChunks):
+                chunk = copy.copy(qad.chunks[i])
+                chunk.firstFace += firstFace - sourceQuad.firstFace
+                chunks.append(chunk)
+
+            firstFace += sourceQuad.numFaces
+
+        quad.numFaces = firstFace - quad.firstFace
+        quad.numChunks = len(chunks) - quad.firstChunk
+
+        quads.append(quad)
+
+    copy_byte_range(geo_reader, geo_writer, geo.indexOffset + geo.indexCount * 2)
+
+    scenario = copy.copy(qad)
+    scenario.quads = quads
+    scenario.chunks = chunks
+    scenario.numberOfPolygons = numberOfFaces
+
+    scenario.serialize(qad_writer)
+
+    return skippedQuads
@@ -1,127 +1,646 @@
 import bpy
-import struct
 import bmesh
+import functools
+import hashlib
+import os
+import queue
+import threading
+import time
+import numpy as np
 
 from bpy_extras.io_utils import ImportHelper, ExportHelper
-from bpy.props import StringProperty, BoolProperty, EnumProperty
+from bpy.props import StringProperty, BoolProperty, EnumProperty, IntVectorProperty, FloatProperty
 from bpy.types import Operator
 from mathutils import Vector, Color
 
 from pathlib import Path
 
-class QadFile:
-    def __init__(self):
-        self.version = 0
-        # ...
-        self.textureNames = []
-        self.bumpTextureNames = []
-        self.quads = []
-        self.chunks = []
-        self.materials = []
+from .Qad import *
+from .QadIndex import *
+from .utils import *
 
-class QadMaterial:
-    def __init__(self):
-        self.textureNameIndices = []
-        self.bumpTextureNameIndices = []
-        self.materialType = 0
-        self.textureAnimIndex = 0
-        self.texMods = []
-        self.texModCrcs = []
-
-class QadQuad:
-    def __init__(self):
-        self.quadX = 0
-        self.quadY = 0
-        self.firstFace = 0
-        self.numFaces = 0
-        self.firstChunk = 0
-        self.numChunks = 0
-        self.circumSpherePositionX = 0.0
-        self.circumSpherePositionY = 0.0
-        self.circumSpherePositionZ = 0.0
-        self.circumSphereRadius = 0.0
-        self.firstObject = 0
-        self.numObjects = 0
-        self.firstMarker = 0
-        self.numMarkers = 0
-        self.vertexBufferIndex = 0
-
-class QadChunk:
-    def __init__(self):
-        self.firstFace = 0
-        self.numFaces = 0
-        self.materialIndex = 0
-        self.viewDistLayer = 0
+# seconds of geometry building per timer call, so Blender stays responsive
+SCENARIO_IMPORT_TIME_BUDGET = 0.05
 
-class GeoFile:
+# decoded quads the worker may run ahead of the geometry building
+SCENARIO_IMPORT_QUEUE_SIZE = 16
+
+QAD_PACKED_NORMAL_ATTRIBUTE = "qad_packed_normal"
+
+class GeoVertexAttributes:
     def __init__(self):
-        self.version = 0
-        self.vertexFormat = 0
-        self.bufferCount = 0
-        self.indexCount = 0
-        self.bufferVertexCounts = []
-        self.vertexBuffers = []
-        self.triangles = []
-
-class GeoVertex:
+        self.positions = np.empty((0, 3), dtype=np.float32)
+        self.normals = np.empty((0, 3), dtype=np.float32)
+        # normals as stored in the GEO file, kept for writing unchanged normals back
+        self.packed_normals = np.empty(0, dtype=np.uint32)
+        self.uvs1 = np.empty((0, 2), dtype=np.float32)
+        self.uvs2 = np.empty((0, 2), dtype=np.float32)
+        self.blend_colors = np.empty((0, 4), dtype=np.float32)
+        self.ambient_colors = np.empty((0, 4), dtype=np.float32)
+        
+def decode_packed_colors(packed_colors : np.ndarray) -> np.ndarray:
+    """Unpack 8-bit RGBA colors from bits 24, 16, 8 and 0."""
+    colors = np.empty((len(packed_colors), 4), dtype=np.float32)
+    colors[:, 0] = (packed_colors >> 24) & 0xFF
+    colors[:, 1] = (packed_colors >> 16) & 0xFF
+    colors[:, 2] = (packed_colors >> 8) & 0xFF
+    colors[:, 3] = (packed_colors >> 0) & 0xFF
+    
+    return colors / 255
+    
+def decode_vertex_attributes(vertex_buffer : np.ndarray, landscape_scale) -> GeoVertexAttributes:
+    attributes = GeoVertexAttributes()
+    
+    attributes.positions = vertex_buffer['position'][:, [0, 2, 1]] / np.float32(landscape_scale)
+    attributes.normals = decode_packed_normals(vertex_buffer['normal'])
+    attributes.packed_normals = vertex_buffer['normal']
+    
+    attributes.uvs1 = vertex_buffer['uv1'] * np.array([1.0, -1.0], dtype=np.float32)
+    attributes.uvs2 = vertex_buffer['uv2'] * np.array([1.0, -1.0], dtype=np.float32)
+    
+    attributes.blend_colors = decode_packed_colors(vertex_buffer['blend'])
+    attributes.ambient_colors = decode_packed_colors(vertex_buffer['ambient'])
+    
+    return attributes
+    
+def encode_packed_colors(colors : np.ndarray) -> np.ndarray:
+    """Inverse of decode_packed_colors."""
+    components = np.clip(np.rint(colors * 255), 0, 255).astype(np.uint32)
+    
+    return (components[:, 0] << 24) | (components[:, 1] << 16) | (components[:, 2] << 8) | components[:, 3]
+    
+def encode_vertex_attributes(attributes : GeoVertexAttributes, landscape_scale) -> np.ndarray:
+    vertex_buffer = np.zeros(len(attributes.positions), dtype=GEO_VERTEX_DTYPE)
+    
+    vertex_buffer['position'] = attributes.positions[:, [0, 2, 1]] * landscape_scale
+    vertex_buffer['normal'] = encode_packed_normals(attributes.normals, attributes.packed_normals)
+    
+    vertex_buffer['uv1'] = attributes.uvs1 * np.array([1.0, -1.0], dtype=np.float32)
+    vertex_buffer['uv2'] = attributes.uvs2 * np.array([1.0, -1.0], dtype=np.float32)
+    
+    vertex_buffer['blend'] = encode_packed_colors(attributes.blend_colors)
+    vertex_buffer['ambient'] = encode_packed_colors(attributes.ambient_colors)
+    
+    return vertex_buffer
+    
+def create_vertex_from_geo(attributes : GeoVertexAttributes, vertex_index : int, bm):
+    vertex = bm.verts.new(attributes.positions[vertex_index])
+    vertex.normal = attributes.normals[vertex_index]
+    
+    return vertex
+
+class ScenarioGeometry:
     def __init__(self):
-        self.positionX = 0.0
-        self.positionY = 0.0
-        self.positionZ = 0.0
-        self.normal = 0
-        self.u1 = 0.0
-        self.v1 = 0.0
-        self.u2 = 0.0
-        self.v2 = 0.0
-        self.blend = 0
-        self.ambient = 0
-    
-class GeoTriangle:
+        # chunk index -> triangles indexing the vertex attributes of their buffer
+        self.chunk_triangles = {}
+        self.vertex_attributes = {}
+        # buffer index -> buffer vertex the attributes start at
+        self.vertex_bases = {}
+
+def load_scenario_geometry(geo : GeoFile, geo_reader, qad : QadFile, quad_indices : [], landscape_scale) -> ScenarioGeometry:
+    """
+    Fetch the triangles and vertices the given quads use. Only the GEO
+    header needs to have been read, every chunk's triangles and every
+    buffer's used vertex range are fetched by seeking.
+    """
+    geometry = ScenarioGeometry()
+    
+    vertex_ranges = {}
+    chunk_buffers = {}
+    
+    for h in quad_indices:
+        qad_quad : QadQuad = qad.quads[h]
+        
+        vertex_buffer_index = qad_quad.vertexBufferIndex
+        
+        for i in range(qad_quad.firstChunk, qad_quad.firstChunk + qad_quad.numChunks):
+            qad_chunk : QadChunk = qad.chunks[i]
+            
+            chunk_triangles = geo.read_triangles(geo_reader, qad_chunk.firstFace, qad_chunk.numFaces)
+            
+            geometry.chunk_triangles[i] = chunk_triangles
+            chunk_buffers[i] = vertex_buffer_index
+            
+            if len(chunk_triangles) > 0:
+                first_vertex, last_vertex = vertex_ranges.get(vertex_buffer_index, (0xFFFF, 0))
+                
+                vertex_ranges[vertex_buffer_index] = (min(first_vertex, int(chunk_triangles.min())), max(last_vertex, int(chunk_triangles.max())))
+                
+    vertex_bases = geometry.vertex_bases
+    
+    for vertex_buffer_index, (first_vertex, last_vertex) in vertex_ranges.items():
+        vertex_buffer = geo.read_vertices(geo_reader, vertex_buffer_index, first_vertex, last_vertex - first_vertex + 1)
+        
+        vertex_bases[vertex_buffer_index] = first_vertex
+        geometry.vertex_attributes[vertex_buffer_index] = decode_vertex_attributes(vertex_buffer, landscape_scale)
+        
+    for i, vertex_buffer_index in chunk_buffers.items():
+        geometry.chunk_triangles[i] = geometry.chunk_triangles[i].astype(np.int64) - vertex_bases.get(vertex_buffer_index, 0)
+            
+    return geometry
+
+def create_scenario_mesh(name : str, geometry : ScenarioGeometry, chunk_indices : [], vertex_buffer_index : int, chunk_material_slots : {}):
+    """Build a mesh from chunks sharing one vertex buffer in bulk, keeping only the vertices they use."""
+    attributes = geometry.vertex_attributes[vertex_buffer_index]
+    
+    chunk_triangles = [geometry.chunk_triangles[i] for i in chunk_indices]
+    
+    triangles = np.concatenate(chunk_triangles).reshape(-1, 3)
+    face_material_slots = np.concatenate([np.full(len(chunk_triangles[k]), chunk_material_slots[i], dtype=np.int32) for k, i in enumerate(chunk_indices)])
+    
+    degenerate = (triangles[:, 0] == triangles[:, 1]) | (triangles[:, 1] == triangles[:, 2]) | (triangles[:, 2] == triangles[:, 0])
+    
+    if np.any(degenerate):
+        print(f"{name}: skipping {np.count_nonzero(degenerate)} degenerate triangles")
+        
+    triangles = triangles[~degenerate][:, ::-1]
+    face_material_slots = face_material_slots[~degenerate]
+    
+    used_vertices, loop_vertices = np.unique(triangles, return_inverse=True)
+    loop_vertices = loop_vertices.reshape(-1)
+    
+    # attributes of every corner, looked up in the vertex buffer
+    loop_buffer_vertices = used_vertices[loop_vertices]
+    
+    mesh = create_mesh(name, attributes.positions[used_vertices], loop_vertices, np.arange(0, len(loop_vertices) + 1, 3))
+    
+    mesh.polygons.foreach_set("material_index", face_material_slots)
+    mesh.polygons.foreach_set("use_smooth", np.ones(len(triangles), dtype=bool))
+    
+    uv_layer1 = mesh.uv_layers.new(name="UV1")
+    uv_layer1.data.foreach_set("uv", attributes.uvs1[loop_buffer_vertices].ravel())
+    
+    uv_layer2 = mesh.uv_layers.new(name="UV2")
+    uv_layer2.data.foreach_set("uv", attributes.uvs2[loop_buffer_vertices].ravel())
+    
+    color_layer_blend = mesh.vertex_colors.new(name="Blend")
+    color_layer_blend.data.foreach_set("color", attributes.blend_colors[loop_buffer_vertices].ravel())
+    
+    color_layer_ambient = mesh.vertex_colors.new(name="Ambient")
+    color_layer_ambient.data.foreach_set("color", attributes.ambient_colors[loop_buffer_vertices].ravel())
+    
+    mesh.normals_split_custom_set_from_vertices(attributes.normals[used_vertices])
+    
+    packed_normal_attribute = mesh.attributes.new(name=QAD_PACKED_NORMAL_ATTRIBUTE, type='INT', domain='POINT')
+    packed_normal_attribute.data.foreach_set("value", attributes.packed_normals[used_vertices].astype(np.int32))
+    
+    mesh.use_auto_smooth = True
+    
+    mesh.update()
+    
+    return mesh
+
+def add_quad_objects(qad : QadFile, quad_index : int, geometry : ScenarioGeometry, materials : [], layer_collections : {}, parent_collection, source_path : Path) -> []:
+    """Create one object per view distance layer used by a quad, linked into that layer's collection."""
+    qad_quad : QadQuad = qad.quads[quad_index]
+    
+    objects = []
+    
+    layer_chunks = {}
+    
+    for i in range(qad_quad.firstChunk, qad_quad.firstChunk + qad_quad.numChunks):
+        layer_chunks.setdefault(qad.chunks[i].viewDistLayer, []).append(i)
+        
+    for view_dist_layer, chunk_indices in sorted(layer_chunks.items()):
+        chunk_indices = [i for i in chunk_indices if len(geometry.chunk_triangles[i]) > 0]
+        
+        if not chunk_indices:
+            continue
+        
+        if view_dist_layer not in layer_collections:
+            layer_collection = bpy.data.collections.new(f"{parent_collection.name} View Distance {view_dist_layer}")
+            parent_collection.children.link(layer_collection)
+            layer_collections[view_dist_layer] = layer_collection
+            
+        name = f"Quad {qad_quad.quadX} {qad_quad.quadY} Layer {view_dist_layer}"
+        
+        # one slot per material, however many chunks use it
+        material_slots = {}
+        
+        chunk_material_slots = {i: material_slots.setdefault(qad.chunks[i].materialIndex, len(material_slots)) for i in chunk_indices}
+        
+        mesh = create_scenario_mesh(f"{name} Mesh", geometry, chunk_indices, qad_quad.vertexBufferIndex, chunk_material_slots)
+        
+        for material_index in material_slots:
+            mesh.materials.append(materials[material_index])
+            
+        obj = bpy.data.objects.new(name, mesh)
+        
+        obj["qad_quad_index"] = quad_index
+        obj["qad_view_dist_layer"] = view_dist_layer
+        obj["qad_source_path"] = str(source_path)
+        obj["qad_geometry_hash"] = get_quad_object_hash(obj)
+        
+        layer_collections[view_dist_layer].objects.link(obj)
+        
+        objects.append(obj)
+        
+    return objects
+
+def get_collection_array(collection, attribute : str, dtype, components : int = 1) -> np.ndarray:
+    array = np.empty(len(collection) * components, dtype=dtype)
+    collection.foreach_get(attribute, array)
+    
+    return array.reshape(-1, components) if components > 1 else array
+
+def get_quad_object_hash(obj) -> str:
+    """Hash everything get_edited_quad reads from a quad object, to tell edited quads from imported ones."""
+    hasher = hashlib.blake2b(digest_size=20)
+    
+    mesh = obj.data
+    
+    hash_array(hasher, np.array(obj.matrix_world, dtype=np.float32))
+    
+    mesh.calc_normals_split()
+    
+    hash_collection(hasher, mesh.vertices, "co", np.float32, 3)
+    hash_collection(hasher, mesh.loops, "vertex_index", np.int32)
+    hash_collection(hasher, mesh.loops, "normal", np.float32, 3)
+    hash_collection(hasher, mesh.polygons, "loop_total", np.int32)
+    hash_collection(hasher, mesh.polygons, "material_index", np.int32)
+    
+    for uv_layer in mesh.uv_layers:
+        hasher.update(uv_layer.name.encode())
+        hash_collection(hasher, uv_layer.data, "uv", np.float32, 2)
+        
+    for color_layer in mesh.vertex_colors:
+        hasher.update(color_layer.name.encode())
+        hash_collection(hasher, color_layer.data, "color", np.float32, 4)
+        
+    material_indices = [slot.material.get("qad_material_index", -1) if slot.material else -1 for slot in obj.material_slots]
+    
+    hasher.update(repr((material_indices, obj.get("qad_view_dist_layer", 0))).encode())
+    
+    return hasher.hexdigest()
+
+def get_edited_quad(objects : [], landscape_scale) -> QadEditedQuad:
+    """
+    Turn the objects of one quad into GEO vertices and chunks. Every corner
+    becomes a vertex, identical ones are merged again afterwards.
+    """
+    vertex_buffers = []
+    chunks = []
+    
+    loop_offset = 0
+    
+    for obj in sorted(objects, key=lambda obj: obj.get("qad_view_dist_layer", 0)):
+        mesh = obj.data
+        view_dist_layer = int(obj.get("qad_view_dist_layer", 0))
+        
+        mesh.calc_loop_triangles()
+        mesh.calc_normals_split()
+        
+        matrix = np.array(obj.matrix_world, dtype=np.float64)
+        normal_matrix = np.linalg.inv(matrix[0:3, 0:3]).T
+        
+        loop_vertices = get_collection_array(mesh.loops, "vertex_index", np.int32)
+        loop_count = len(loop_vertices)
+        
+        normals = get_collection_array(mesh.loops, "normal", np.float32, 3) @ normal_matrix.T
+        normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:, None]
+        
+        attributes = GeoVertexAttributes()
+        attributes.positions = get_collection_array(mesh.vertices, "co", np.float32, 3)[loop_vertices] @ matrix[0:3, 0:3].T + matrix[0:3, 3]
+        attributes.normals = normals
+        
+        packed_normal_attribute = mesh.attributes.get(QAD_PACKED_NORMAL_ATTRIBUTE)
+        
+        if packed_normal_attribute is not None and packed_normal_attribute.domain == 'POINT' and packed_normal_attribute.data_type == 'INT':
+            attributes.packed_normals = get_collection_array(packed_normal_attribute.data, "value", np.int32)[loop_vertices].astype(np.uint32)
+        
+        uv_layer1 = mesh.uv_layers.get("UV1")
+        uv_layer2 = mesh.uv_layers.get("UV2")
+        
+        attributes.uvs1 = get_collection_array(uv_layer1.data, "uv", np.float32, 2) if uv_layer1 else np.zeros((loop_count, 2), dtype=np.float32)
+        attributes.uvs2 = get_collection_array(uv_layer2.data, "uv", np.float32, 2) if uv_layer2 else np.zeros((loop_count, 2), dtype=np.float32)
+        
+        color_layer_blend = mesh.vertex_colors.get("Blend")
+        color_layer_ambient = mesh.vertex_colors.get("Ambient")
+        
+        attributes.blend_colors = get_collection_array(color_layer_blend.data, "color", np.float32, 4) if color_layer_blend else np.ones((loop_count, 4), dtype=np.float32)
+        attributes.ambient_colors = get_collection_array(color_layer_ambient.data, "color", np.float32, 4) if color_layer_ambient else np.ones((loop_count, 4), dtype=np.float32)
+        
+        vertex_buffers.append(encode_vertex_attributes(attributes, landscape_scale))
+        
+        slot_material_indices = []
+        
+        for slot in obj.material_slots:
+            if slot.material and "qad_material_index" in slot.material:
+                slot_material_indices.append(int(slot.material["qad_material_index"]))
+            else:
+                print(f"{obj.name}: material slot {slot.name} is not a scenario material, using material 0")
+                slot_material_indices.append(0)
+                
+        slot_material_indices = np.array(slot_material_indices or [0], dtype=np.int64)
+        
+        triangle_loops = get_collection_array(mesh.loop_triangles, "loops", np.int32, 3)
+        triangle_polygons = get_collection_array(mesh.loop_triangles, "polygon_index", np.int32)
+        polygon_slots = get_collection_array(mesh.polygons, "material_index", np.int32)
+        
+        triangle_material_indices = slot_material_indices[np.clip(polygon_slots[triangle_polygons], 0, len(slot_material_indices) - 1)]
+        
+        # undo the winding reversal of the import
+        triangles = triangle_loops[:, ::-1].astype(np.int64) + loop_offset
+        
+        for material_index in np.unique(triangle_material_indices).tolist():
+            chunks.append((material_index, view_dist_layer, triangles[triangle_material_indices == material_index]))
+            
+        loop_offset += loop_count
+        
+    edited_quad = QadEditedQuad()
+    
+    if not vertex_buffers:
+        return edited_quad
+    
+    corner_vertices = np.concatenate(vertex_buffers)
+    
+    _, first_corners, corner_to_vertex = np.unique(corner_vertices.view(np.dtype((np.void, GEO_VERTEX_DTYPE.itemsize))), return_index=True, return_inverse=True)
+    
+    corner_to_vertex = corner_to_vertex.reshape(-1)
+    
+    edited_quad.vertices = corner_vertices[first_corners]
+    edited_quad.chunks = [(material_index, view_dist_layer, corner_to_vertex[triangles]) for material_index, view_dist_layer, triangles in chunks]
+    
+    return edited_quad
+
+class ScenarioImportJob:
+    """
+    State of one ImportQad run, shared by the worker thread that decodes the
+    GEO file and the timer that builds the geometry. Datablocks are tracked
+    by name so a cancelled import can remove them again.
+    """
     def __init__(self):
-        self.VertexIndex1 = 0
-        self.VertexIndex2 = 0
-        self.VertexIndex3 = 0
+        self.qad = QadFile()
+        self.geo = GeoFile()
+        self.geo_file_path = Path()
+        self.qad_file_path = Path()
+        self.quad_indices = []
+        self.landscape_scale = 10.0
+        self.materials = []
+        self.collection = None
+        self.use_quad_objects = False
+        
+        self.decoded_quads = queue.Queue(maxsize=SCENARIO_IMPORT_QUEUE_SIZE)
+        self.cancelled = threading.Event()
+        self.worker = None
+        self.timer = None
+        self.window_manager = None
+        self.built_quads = 0
+        self.finished = False
+        # set when decoding or building fails, the modal handler then cancels the import
+        self.error = None
+        
+        self.object_names = []
+        self.mesh_names = []
+        self.collection_names = []
+        self.material_names = []
+        self.image_names = []
+        
+        # object per quad
+        self.parent_collection = None
+        self.layer_collections = {}
         
-def create_vertex_from_geo(geo : GeoFile, vertex_buffer_index : int, vertex_index : int, bm, vertices : {}, uvs1 : {}, uvs2 : {}, vertex_colors_blend : {}, vertex_colors_ambient : {}, landscape_scale):
-    vertex_buffer = geo.vertexBuffers[vertex_buffer_index]
-    geo_vertex : GeoVertex = vertex_buffer[vertex_index]
+        # single scenario mesh
+        self.bm = None
+        self.vertex_dicts = {}
+        self.material_slots = {}
+        self.face_material_slots = []
+
+def decode_scenario_quads(job : ScenarioImportJob):
+    """Worker thread: decode the selected quads one by one and hand them to the timer."""
+    try:
+        with job.geo_file_path.open('rb') as geo_reader:
+            for h in job.quad_indices:
+                if job.cancelled.is_set():
+                    return
+                
+                geometry = load_scenario_geometry(job.geo, geo_reader, job.qad, [h], job.landscape_scale)
+                
+                job.decoded_quads.put((h, geometry))
+    except Exception as exception:
+        print(f"decode_scenario_quads() failed: {exception!r}")
+        
+        job.error = f"Decoding {job.geo_file_path.name} failed: {exception}"
+
+def start_scenario_geometry(job : ScenarioImportJob):
+    if job.use_quad_objects:
+        job.parent_collection = bpy.data.collections.new(job.qad_file_path.stem)
+        job.collection.children.link(job.parent_collection)
+        
+        job.collection_names.append(job.parent_collection.name)
+    else:
+        job.bm = bmesh.new()
+        
+        job.bm.loops.layers.uv.new("UV1")
+        job.bm.loops.layers.uv.new("UV2")
+        
+        job.bm.loops.layers.color.new("Blend")
+        job.bm.loops.layers.color.new("Ambient")
+
+def add_quad_to_bmesh(job : ScenarioImportJob, quad_index : int, geometry : ScenarioGeometry):
+    qad = job.qad
+    bm = job.bm
     
-    vertex_position = Vector((geo_vertex.positionX, geo_vertex.positionZ, geo_vertex.positionY)) / landscape_scale
+    uv_layer1 = bm.loops.layers.uv["UV1"]
+    uv_layer2 = bm.loops.layers.uv["UV2"]
     
-    normal = geo_vertex.normal
-    normalX = ((normal >> 16) & 0xFF) / 255;
-    normalY = ((normal >> 8) & 0xFF) / 255;
-    normalZ = ((normal >> 0) & 0xFF) / 255;
-    vertex_normal = Vector((normalX, normalZ, normalY))
+    color_layer_blend = bm.loops.layers.color["Blend"]
+    color_layer_ambient = bm.loops.layers.color["Ambient"]
     
-    vertex_uv1 = (geo_vertex.u1, -geo_vertex.v1)
-    vertex_uv2 = (geo_vertex.u2, -geo_vertex.v2)
+    qad_quad : QadQuad = qad.quads[quad_index]
     
-    blend = geo_vertex.blend
-    blendR = ((blend >> 24) & 0xFF) / 255;
-    blendG = ((blend >> 16) & 0xFF) / 255
-    blendB = ((blend >> 8) & 0xFF) / 255;
-    blendA = ((blend >> 0) & 0xFF) / 255;
-    vertex_color_blend = (blendR, blendG, blendB, blendA)
+    vertex_buffer_index = qad_quad.vertexBufferIndex
     
-    ambient = geo_vertex.ambient
-    ambientR = ((ambient >> 24) & 0xFF) / 255;
-    ambientG = ((ambient >> 16) & 0xFF) / 255;
-    ambientB = ((ambient >> 8) & 0xFF) / 255;
-    ambientA = ((ambient >> 0) & 0xFF) / 255;
-    vertex_color_ambient = (ambientR, ambientG, ambientB, ambientA)
+    if vertex_buffer_index not in job.vertex_dicts:
+        job.vertex_dicts[vertex_buffer_index] = {}
+        
+    # keyed by buffer vertex, so quads sharing a buffer share vertices
+    vertices = job.vertex_dicts[vertex_buffer_index]
+    vertex_base = geometry.vertex_bases.get(vertex_buffer_index, 0)
+    attributes = geometry.vertex_attributes.get(vertex_buffer_index)
     
-    vertex = bm.verts.new(vertex_position)
-    vertex.normal = vertex_normal
-    vertices[vertex_index] = vertex
+    for i in range(qad_quad.firstChunk, qad_quad.firstChunk + qad_quad.numChunks):
+        qad_chunk : QadChunk = qad.chunks[i]
+        
+        material_slot = job.material_slots.setdefault(qad_chunk.materialIndex, len(job.material_slots))
+        
+        chunk_triangles = geometry.chunk_triangles[i][:, ::-1].tolist()
+        
+        for j, vertex_indices in enumerate(chunk_triangles, qad_chunk.firstFace):
+            if len(set(vertex_indices)) < 3:
+                print(f"triangle {j} is degenerate, vertices {[vertex_base + vertex_index for vertex_index in vertex_indices]}")
+            else:
+                triangle_vertices = list(range(3))
+                
+                for k, vertex_index in enumerate(vertex_indices):
+                    vertex_key = vertex_base + vertex_index
+                    
+                    if vertex_key not in vertices:
+                        vertices[vertex_key] = create_vertex_from_geo(attributes, vertex_index, bm)
+                        
+                    triangle_vertices[k] = vertices[vertex_key]
+                    
+                face_vertices = (triangle_vertices[0], triangle_vertices[1], triangle_vertices[2])
+                
+                if bm.faces.get(face_vertices):
+                    print("face with vertices already exists:", [vertex_base + vertex_index for vertex_index in vertex_indices]);
+                    for k, vertex_index in enumerate(vertex_indices):
+                        triangle_vertices[k] = vertices[vertex_base + vertex_index] = create_vertex_from_geo(attributes, vertex_index, bm)
+                    face_vertices = (triangle_vertices[0], triangle_vertices[1], triangle_vertices[2])
+                    
+                face = bm.faces.new(face_vertices)
+                
+                face.smooth = True
+                
+                for k, loop in enumerate(face.loops):
+                    vertex_index = vertex_indices[k]
+                    
+                    loop[uv_layer1].uv = attributes.uvs1[vertex_index]
+                    loop[uv_layer2].uv = attributes.uvs2[vertex_index]
+                    
+                    loop[color_layer_blend] = attributes.blend_colors[vertex_index]
+                    loop[color_layer_ambient] = attributes.ambient_colors[vertex_index]
+                    
+                job.face_material_slots.append(material_slot)
+
+def build_scenario_quad(job : ScenarioImportJob, quad_index : int, geometry : ScenarioGeometry):
+    if job.use_quad_objects:
+        layer_collection_count = len(job.layer_collections)
+        
+        objects = add_quad_objects(job.qad, quad_index, geometry, job.materials, job.layer_collections, job.parent_collection, job.qad_file_path)
+        
+        job.object_names += [obj.name for obj in objects]
+        job.mesh_names += [obj.data.name for obj in objects]
+        
+        if len(job.layer_collections) > layer_collection_count:
+            job.collection_names = [job.parent_collection.name] + [collection.name for collection in job.layer_collections.values()]
+    else:
+        add_quad_to_bmesh(job, quad_index, geometry)
+        
+    job.built_quads += 1
+
+def finish_scenario_geometry(job : ScenarioImportJob):
+    if job.bm is not None:
+        bm = job.bm
+        job.bm = None
+        
+        bm.verts.ensure_lookup_table()
+        bm.faces.ensure_lookup_table()
+        
+        mesh = bpy.data.meshes.new(name=f"Scenario Mesh")
+        obj = bpy.data.objects.new("Scenario", mesh)
+        
+        job.collection.objects.link(obj)
+        
+        job.object_names.append(obj.name)
+        job.mesh_names.append(mesh.name)
+        
+        bm.to_mesh(mesh)
+        bm.free()
+        
+        for material_index in job.material_slots:
+            mesh.materials.append(job.materials[material_index])
+            
+        mesh.polygons.foreach_set("material_index", job.face_material_slots)
+        
+        mesh.normals_split_custom_set_from_vertices([v.normal for v in mesh.vertices])
+        
+        mesh.use_auto_smooth = True
+        
+        mesh.update()
+        
+    job.finished = True
+
+def build_scenario_batch(job : ScenarioImportJob):
+    """
+    Timer callback: build decoded quads until the time budget is spent. On
+    an error the job ends with job.error set, for the modal handler to
+    cancel the import.
+    """
+    if job.cancelled.is_set() or job.finished:
+        return None
+    
+    deadline = time.perf_counter() + SCENARIO_IMPORT_TIME_BUDGET
     
-    uvs1[vertex_index] = vertex_uv1
-    uvs2[vertex_index] = vertex_uv2
+    try:
+        while time.perf_counter() < deadline:
+            if job.decoded_quads.empty():
+                # checked before the queue again, so quads decoded just before the worker ended are not missed
+                worker_done = not job.worker.is_alive()
+                
+                if job.decoded_quads.empty():
+                    if worker_done:
+                        if job.error is None:
+                            finish_scenario_geometry(job)
+                        
+                        job.finished = True
+                        
+                        return None
+                    
+                    break
+                
+            h, geometry = job.decoded_quads.get()
+            
+            build_scenario_quad(job, h, geometry)
+            
+        job.window_manager.progress_update(job.built_quads)
+        
+        if job.built_quads == len(job.quad_indices):
+            finish_scenario_geometry(job)
+            
+            return None
+    except Exception as exception:
+        print(f"build_scenario_batch() failed: {exception!r}")
+        
+        job.error = f"Building quad geometry failed: {exception}"
+        job.finished = True
+        
+        return None
     
-    vertex_colors_blend[vertex_index] = vertex_color_blend
-    vertex_colors_ambient[vertex_index] = vertex_color_ambient
+    return 0.01
+
+def cancel_scenario_import(job : ScenarioImportJob):
+    """Stop the worker and timer and remove every datablock the import created."""
+    job.cancelled.set()
     
-    return vertex
+    if job.timer is not None and bpy.app.timers.is_registered(job.timer):
+        bpy.app.timers.unregister(job.timer)
+        
+    # keep draining so a worker blocked on a full queue can see the cancel
+    while job.worker is not None and job.worker.is_alive():
+        while not job.decoded_quads.empty():
+            job.decoded_quads.get()
+            
+        job.worker.join(0.05)
+        
+    if job.bm is not None:
+        job.bm.free()
+        job.bm = None
+        
+    for name in job.object_names:
+        obj = bpy.data.objects.get(name)
+        if obj:
+            bpy.data.objects.remove(obj)
+            
+    for name in job.mesh_names:
+        mesh = bpy.data.meshes.get(name)
+        if mesh:
+            bpy.data.meshes.remove(mesh)
+            
+    for name in job.collection_names:
+        collection = bpy.data.collections.get(name)
+        if collection:
+            bpy.data.collections.remove(collection)
+            
+    for name in job.material_names:
+        material = bpy.data.materials.get(name)
+        if material:
+            bpy.data.materials.remove(material)
+            
+    for name in job.image_names:
+        image = bpy.data.images.get(name)
+        if image:
+            bpy.data.images.remove(image)
 
 class ImportQad(Operator, ImportHelper):
     """This appears in the tooltip of the operator and in the generated docs"""
@@ -136,20 +655,45 @@ class ImportQad(Operator, ImportHelper):
         maxlen=255
     )
 
-    use_setting: BoolProperty(
-        name="Example Boolean",
-        description="Example Tooltip",
-        default=True,
-    )
-
-    type: EnumProperty(
-        name="Example Enum",
-        description="Choose between two items",
+    region: EnumProperty(
+        name="Region",
+        description="Part of the scenario to import",
         items=(
-            ('OPT_A', "First Option", "Description one"),
-            ('OPT_B', "Second Option", "Description two"),
+            ('ALL', "Whole Scenario", "Import every quad"),
+            ('RECTANGLE', "Quad Rectangle", "Import the quads inside a rectangle of quad coordinates"),
+            ('CURSOR', "Around 3D Cursor", "Import the quads within a radius of the 3D cursor"),
         ),
-        default='OPT_A',
+        default='ALL',
+    )
+
+    quad_min: IntVectorProperty(
+        name="First Quad",
+        description="Lowest quad X and Y coordinate to import",
+        size=2,
+        default=(0, 0),
+        min=0,
+    )
+
+    quad_max: IntVectorProperty(
+        name="Last Quad",
+        description="Highest quad X and Y coordinate to import",
+        size=2,
+        default=(9, 9),
+        min=0,
+    )
+
+    use_quad_objects: BoolProperty(
+        name="Object per Quad",
+        description="Import every quad as its own object, grouped into a collection per view distance layer",
+        default=False,
+    )
+
+    cursor_radius: FloatProperty(
+        name="Radius",
+        description="Distance from the 3D cursor within which quads are imported",
+        default=100.0,
+        min=0.0,
+        subtype='DISTANCE',
     )
 
     def execute(self, context):
@@ -166,223 +710,39 @@ class ImportQad(Operator, ImportHelper):
         
         landscapeScale = 10
         
-        with qadFilePath.open('rb') as qadFile:
-            readData_initial = struct.unpack('32I', qadFile.read(128))
-            
-            signature = readData_initial[0]
-            version = readData_initial[1]
-            _ = readData_initial[2]
-            _ = readData_initial[3]
-            numberOfQuadsX = readData_initial[4]
-            numberOfQuadsY = readData_initial[5]
-            numberOfQuads = readData_initial[6]
-            numberOfChunks = readData_initial[7]
-            numberOfTextureNamesTotal = readData_initial[8]
-            numberOfObjectNames = readData_initial[9]
-            numberOfPolygons = readData_initial[10]
-            numberOfMaterials = readData_initial[11]
-            numberOfPlacedObjects = readData_initial[12]
-            numberOfTexturePropertyGroups = readData_initial[13]
-            sizeOfCollisionQuads = readData_initial[14]
-            markerVersionAndCount = readData_initial[15]
-            flagKickdata = readData_initial[16]
-            numberOfSounds = readData_initial[17]
-            sizeOfNamedObjectStringPool = readData_initial[18]
-            numberOfNamedObjects = readData_initial[19]
-            sizeOfMarkerExtraData = readData_initial[20]
-            _ = readData_initial[21]
-            _ = readData_initial[22]
-            _ = readData_initial[23]
-            _ = readData_initial[24]
-            _ = readData_initial[25]
-            _ = readData_initial[26]
-            _ = readData_initial[27]
-            _ = readData_initial[28]
-            _ = readData_initial[29]
-            _ = readData_initial[30]
-            _ = readData_initial[31]
-            
-            numberOfTextureNames = numberOfTextureNamesTotal & 0xFFFF
-
-            numberOfBumpTextureNames = (numberOfTextureNamesTotal >> 16) & 0xFFFF
-
-            numberOfTexGroupIndices = max(((numberOfTextureNamesTotal & 0xFFFF) + 1) & ~1, 256)
-
-            if True:
-                print("version:", version)
-                print("numberOfQuads:", numberOfQuads)
-                print("numberOfChunks:", numberOfChunks)
-                print("numberOfTextureNames:", numberOfTextureNames)
-                print("numberOfBumpTextureNames:", numberOfBumpTextureNames)
-                print("numberOfTexGroupIndices:", numberOfTexGroupIndices)
-                print("sizeOfMarkerExtraData:", sizeOfMarkerExtraData)
-
-            for i in range(numberOfTextureNames):
-                readData_textureName = struct.unpack('32s', qadFile.read(32))
-                textureName = readData_textureName[0].decode().rstrip('\x00')
-                qad.textureNames.insert(i, textureName)
-                #print("textureName:", textureName)
-                
-            for _ in range(numberOfBumpTextureNames):
-                readData_bumpTextureName = struct.unpack('32s', qadFile.read(32))
-                bumpTextureName = readData_bumpTextureName[0].decode().rstrip('\x00')
-                qad.bumpTextureNames.insert(i, bumpTextureName)
-                #print("bumpTextureName:", bumpTextureName)
-                
-            for _ in range(numberOfObjectNames):
-                readData_objectName = struct.unpack('32s', qadFile.read(32))
-                objectName = readData_objectName[0].decode().rstrip('\x00')
-                #print("objectName:", objectName)
-                
-            for _ in range(numberOfObjectNames):
-                readData_objectData = struct.unpack('2H 4I 48s 48s', qadFile.read(116))
-                typeA = readData_objectData[0]
-                typeB = readData_objectData[1]
-                weight = readData_objectData[2]
-                _ = readData_objectData[3]
-                _ = readData_objectData[4]
-                _ = readData_objectData[5]
-                soundA = readData_objectData[6].decode().rstrip('\x00')
-                soundB = readData_objectData[7].decode().rstrip('\x00')
-                
-            for i in range(numberOfQuads):
-                readData_quad = struct.unpack('2H 4I 4f 6H', qadFile.read(48))
-                
-                quad = QadQuad()
-                quad.quadX = readData_quad[0]
-                quad.quadY = readData_quad[1]
-                quad.firstFace = readData_quad[2]
-                quad.numFaces = readData_quad[3]
-                quad.firstChunk = readData_quad[4]
-                quad.numChunks = readData_quad[5]
-                quad.circumSpherePositionX = readData_quad[6]
-                quad.circumSpherePositionY = readData_quad[7]
-                quad.circumSpherePositionZ = readData_quad[8]
-                quad.circumSphereRadius = readData_quad[9]
-                quad.firstObject = readData_quad[10]
-                quad.numObjects = readData_quad[11]
-                quad.firstMarker = readData_quad[12]
-                quad.numMarkers = readData_quad[13]
-                quad.vertexBufferIndex = readData_quad[14]
-                _ = readData_quad[15]
-                qad.quads.insert(i, quad)
-                    
-            collisionQuads = qadFile.read(sizeOfCollisionQuads)
-                
-            for i in range(numberOfChunks):
-                readData_chunk = struct.unpack('2L 1H 2B', qadFile.read(12))
-                
-                chunk = QadChunk()
-                chunk.firstFace = readData_chunk[0]
-                chunk.numFaces = readData_chunk[1]
-                chunk.materialIndex = readData_chunk[2]
-                chunk.viewDistLayer = readData_chunk[3]
-                _ = readData_chunk[4]
-                qad.chunks.insert(i, chunk)
-                    
-            for i in range(numberOfMaterials):
-                readData_material = struct.unpack('4H 3H 3H 4f 4f 2L', qadFile.read(60))
-                
-                material = QadMaterial()
-                material.textureNameIndices = [ readData_material[0], readData_material[1], readData_material[2], readData_material[3] ]
-                material.bumpTextureNameIndices = [ readData_material[4], readData_material[5], readData_material[6] ]
-                material.materialType = readData_material[7]
-                material.textureAnimIndex = readData_material[8]
-                _ = readData_material[9]
-                material.texMods = [ [ readData_material[10], readData_material[11], readData_material[12], readData_material[13] ], [ readData_material[14], readData_material[15], readData_material[16], readData_material[17] ] ]
-                material.texModCrcs = [ readData_material[18], readData_material[19] ]
-                qad.materials.insert(i, material)
-                
-            # continue reading QAD
-               
-            print("Done reading QAD")
-        
-        with geoFilePath.open('rb') as geoFile:
-            readData_initial = struct.unpack('8I', geoFile.read(32))
-            
-            signature = readData_initial[0]
-            geo.version = readData_initial[1]
-            geo.vertexFormat = readData_initial[2]
-            geo.bufferCount = readData_initial[3]
-            geo.indexCount = readData_initial[4]
-            _ = readData_initial[5]
-            _ = readData_initial[6]
-            _ = readData_initial[7]
-            
-            if True:
-                print("version:", geo.version)
-                print("vertexFormat:", geo.vertexFormat)
-                print("bufferCount:", geo.bufferCount)
-                print("indexCount:", geo.indexCount)
-
-            for i in range(geo.bufferCount):
-                readData_bufferVertexCount = struct.unpack('I', geoFile.read(4))
-                bufferVertexCount = readData_bufferVertexCount[0]
-                geo.bufferVertexCounts.insert(i, bufferVertexCount)
-                if False:
-                    print("")
-                    print("bufferVertexCount:", bufferVertexCount)
-                
-            for i in range(geo.bufferCount):
-                vertices = []
-                for j in range(geo.bufferVertexCounts[i]):
-                    readData_vertex = struct.unpack('3f I 4f 2I', geoFile.read(40))
-                    
-                    vertex = GeoVertex()
-                    vertex.positionX = readData_vertex[0]
-                    vertex.positionY = readData_vertex[1]
-                    vertex.positionZ = readData_vertex[2]
-                    vertex.normal = readData_vertex[3]
-                    vertex.u1 = readData_vertex[4]
-                    vertex.v1 = readData_vertex[5]
-                    vertex.u2 = readData_vertex[6]
-                    vertex.v2 = readData_vertex[7]
-                    vertex.blend = readData_vertex[8]
-                    vertex.ambient = readData_vertex[9]
-                    vertices.insert(j, vertex)
-                        
-                geo.vertexBuffers.insert(i, vertices)
-                        
-            if geo.vertexFormat > 2:
-                for i in range(geo.bufferCount):
-                    for j in range(geo.bufferVertexCounts[i]):
-                        readData_uv1Tangent = struct.unpack('4H', geoFile.read(8))
-                        readData_uv2Tangent = struct.unpack('4H', geoFile.read(8))
-                        if False:
-                            print("")
-            
-            for i in range(geo.indexCount // 3):
-                readData_triangle = struct.unpack('3H', geoFile.read(6))
-                
-                triangle = GeoTriangle()
-                triangle.vertexIndex1 = readData_triangle[0]
-                triangle.vertexIndex2 = readData_triangle[1]
-                triangle.vertexIndex3 = readData_triangle[2]
-                geo.triangles.insert(i, triangle)
-            
-            print("Done reading GEO")
+        landscape_scale = 10.0
         
-        loadedTextures = {}
-
-        materials = []
+        with qadFilePath.open('rb') as qad_reader:
+            qad.deserialize(qad_reader)
+            
+        quad_index = QadQuadIndex()
+        quad_index.build(qad)
         
-        landscape_scale = 10.0
+        if self.region == 'RECTANGLE':
+            quad_indices = quad_index.query_quad_rectangle(self.quad_min, self.quad_max).quad_indices.tolist()
+        elif self.region == 'CURSOR':
+            cursor_location = context.scene.cursor.location
+            cursor_point = (cursor_location.x * landscape_scale, cursor_location.z * landscape_scale, cursor_location.y * landscape_scale)
+            
+            quad_indices = quad_index.query_sphere(cursor_point, self.cursor_radius * landscape_scale).quad_indices.tolist()
+        else:
+            quad_indices = list(range(len(qad.quads)))
+            
+        print(f"importing {len(quad_indices)} of {len(qad.quads)} quads")
         
-        bm = bmesh.new()
-    
-        uv_layer1 = bm.loops.layers.uv.new("UV1")
-        uv_layer2 = bm.loops.layers.uv.new("UV2")
+        job = ScenarioImportJob()
+        job.qad = qad
+        job.geo = geo
+        job.qad_file_path = qadFilePath
+        job.geo_file_path = geoFilePath
+        job.quad_indices = quad_indices
+        job.landscape_scale = landscape_scale
+        job.collection = context.collection
+        job.use_quad_objects = self.use_quad_objects
         
-        color_layer_blend = bm.loops.layers.color.new("Blend")
-        color_layer_ambient = bm.loops.layers.color.new("Ambient")
-    
-        vertex_dicts = {}
-        uvs1_dicts = {}
-        uvs2_dicts = {}
-        vertex_colors_blend_dicts = {}
-        vertex_colors_ambient_dicts = {}
+        loadedTextures = {}
 
-        part_material_indices = []
+        materials = job.materials
         
         for i in range(len(qad.materials)):
             qadMaterial = qad.materials[i]
@@ -416,6 +776,7 @@ class ImportQad(Operator, ImportHelper):
                 if firstTextureFilePath.exists():
                     loadedTexture = bpy.data.images.load(str(firstTextureFilePath))
                     loadedTextures[firstTextureName] = loadedTexture
+                    job.image_names.append(loadedTexture.name)
             
             material.use_nodes = True
             material.use_backface_culling = True
@@ -430,115 +791,200 @@ class ImportQad(Operator, ImportHelper):
 
             material.node_tree.links.new(tex_node.outputs[0], principled_BSDF.inputs[0])
         
+            material["qad_material_index"] = i
+            
+            job.material_names.append(material.name)
+            
             materials.insert(i, material)
-        
-        for h in range(len(qad.quads)):
-            qad_quad : QadQuad = qad.quads[h]
-            print("Iterating quad", h)
             
-            vertex_buffer_index = qad_quad.vertexBufferIndex
+        with geoFilePath.open('rb') as geo_reader:
+            geo.deserialize_header(geo_reader)
             
-            if vertex_buffer_index not in vertex_dicts:
-                vertex_dicts[vertex_buffer_index] = {}
-                
-            if vertex_buffer_index not in uvs1_dicts:
-                uvs1_dicts[vertex_buffer_index] = {}
-                
-            if vertex_buffer_index not in uvs2_dicts:
-                uvs2_dicts[vertex_buffer_index] = {}
-                
-            if vertex_buffer_index not in vertex_colors_blend_dicts:
-                vertex_colors_blend_dicts[vertex_buffer_index] = {}
-                
-            if vertex_buffer_index not in vertex_colors_ambient_dicts:
-                vertex_colors_ambient_dicts[vertex_buffer_index] = {}
-                
-            vertices = vertex_dicts[vertex_buffer_index]
-            uvs1 = uvs1_dicts[vertex_buffer_index]
-            uvs2 = uvs2_dicts[vertex_buffer_index]
-            vertex_colors_blend = vertex_colors_blend_dicts[vertex_buffer_index]
-            vertex_colors_ambient = vertex_colors_ambient_dicts[vertex_buffer_index]
-        
-            for i in range(qad_quad.firstChunk, qad_quad.firstChunk + qad_quad.numChunks):
-                qad_chunk : QadChunk = qad.chunks[i]
-                #print("Iterating chunk", j)
-                
-                for j in range(qad_chunk.firstFace, qad_chunk.firstFace + qad_chunk.numFaces):
-                    qad_triangle = geo.triangles[j]
-                    #print("Iterating triangle", j)
-                    
-                    vertex_indices = [qad_triangle.vertexIndex3, qad_triangle.vertexIndex2, qad_triangle.vertexIndex1]
-            
-                    if len(set(vertex_indices)) < 3:
-                        print(f"triangle {j} is degenerate, vertices {vertex_indices}")
-                    else:
-                        triangle_vertices = list(range(3))
-
-                        for k, vertex_index in enumerate(vertex_indices):
-                            if vertex_index in vertices:
-                                triangle_vertices[k] = vertices[vertex_index]
-                            else:
-                                triangle_vertices[k] = create_vertex_from_geo(geo, vertex_buffer_index, vertex_index, bm, vertices, uvs1, uvs2, vertex_colors_blend, vertex_colors_ambient, landscape_scale)
+        start_scenario_geometry(job)
+        
+        # without a window there is nothing to stay responsive for, e.g. in background mode
+        if context.window is None:
+            with geoFilePath.open('rb') as geo_reader:
+                for h in quad_indices:
+                    build_scenario_quad(job, h, load_scenario_geometry(geo, geo_reader, qad, [h], landscape_scale))
                     
-                        face_vertices = (triangle_vertices[0], triangle_vertices[1], triangle_vertices[2])
+            finish_scenario_geometry(job)
             
-                        if bm.faces.get(face_vertices):
-                            print("face with vertices already exists:", vertex_indices);
-                            for k, vertex_index in enumerate(vertex_indices):
-                                triangle_vertices[k] = create_vertex_from_geo(geo, vertex_buffer_index, vertex_index, bm, vertices, uvs1, uvs2, vertex_colors_blend, vertex_colors_ambient, landscape_scale)
-                            face_vertices = (triangle_vertices[0], triangle_vertices[1], triangle_vertices[2])
-                
-                        face = bm.faces.new(face_vertices)
+            print("ImportQad.execute() OUT")
+            
+            return {'FINISHED'}
         
-                        face.smooth = True
+        job.window_manager = context.window_manager
+        job.window_manager.progress_begin(0, max(len(quad_indices), 1))
         
-                        for k, loop in enumerate(face.loops):
-                            vertex_index = vertex_indices[k]
-                            
-                            loop[uv_layer1].uv = uvs1[vertex_index]
-                            loop[uv_layer2].uv = uvs2[vertex_index]
-                            
-                            loop[color_layer_blend] = vertex_colors_blend[vertex_index]
-                            loop[color_layer_ambient] = vertex_colors_ambient[vertex_index]
-
-                        face.material_index = len(part_material_indices)
-                
-                part_material_indices.append(qad_chunk.materialIndex)
-                    
-        bm.verts.ensure_lookup_table()
-        bm.faces.ensure_lookup_table()
-    
-        mesh = bpy.data.meshes.new(name=f"Scenario Mesh")
-        obj = bpy.data.objects.new("Scenario", mesh)
+        job.worker = threading.Thread(target=decode_scenario_quads, args=(job,), daemon=True)
+        job.worker.start()
         
-        bpy.context.collection.objects.link(obj)
+        job.timer = functools.partial(build_scenario_batch, job)
+        bpy.app.timers.register(job.timer)
         
-        bm.to_mesh(mesh)
-        bm.free()
+        self.job = job
         
-        for i in range(len(part_material_indices)):
-            part_material_index = part_material_indices[i]
-            part_material = materials[part_material_index]
-            mesh.materials.append(part_material)
-            #print(f"part material {i} -> index {part_material_index}")
+        # wakes the modal handler up to notice the end of the import without user input
+        self.event_timer = context.window_manager.event_timer_add(0.1, window=context.window)
+        
+        context.window_manager.modal_handler_add(self)
+        
+        return {'RUNNING_MODAL'}
 
-        mesh.normals_split_custom_set_from_vertices([v.normal for v in mesh.vertices])
-    
-        mesh.use_auto_smooth = True
-    
-        mesh.update()
+    def modal(self, context, event):
+        job : ScenarioImportJob = self.job
+        
+        if event.type == 'ESC':
+            cancel_scenario_import(job)
+            
+            context.window_manager.event_timer_remove(self.event_timer)
+            context.window_manager.progress_end()
+            
+            self.report({'WARNING'}, f"Scenario import cancelled after {job.built_quads} of {len(job.quad_indices)} quads")
+            
+            print("ImportQad.modal() cancelled")
+            
+            return {'CANCELLED'}
+        
+        if job.finished and job.error is not None:
+            cancel_scenario_import(job)
+            
+            context.window_manager.event_timer_remove(self.event_timer)
+            context.window_manager.progress_end()
+            
+            self.report({'ERROR'}, job.error)
+            
+            print("ImportQad.modal() failed")
+            
+            return {'CANCELLED'}
+        
+        if job.finished:
+            context.window_manager.event_timer_remove(self.event_timer)
+            context.window_manager.progress_end()
+            
+            self.report({'INFO'}, f"Imported {job.built_quads} of {len(job.qad.quads)} quads")
+            
+            print("ImportQad.execute() OUT")
+            
+            return {'FINISHED'}
         
-        print("ImportQad.execute() OUT")
+        return {'PASS_THROUGH'}
+
+class ExportQad(Operator, ExportHelper):
+    """Write scenario quads imported as one object per quad back to a QAD and GEO file"""
+    bl_idname = "export_landscape.scenario"
+    bl_label = "Export Scenario"
 
+    filename_ext = ".qad"
+
+    filter_glob: StringProperty(
+        default="*.qad",
+        options={'HIDDEN'},
+        maxlen=255
+    )
+
+    def execute(self, context):
+        print("ExportQad.execute() IN")
+        qadFilePath = Path(self.filepath)
+        geoFilePath = qadFilePath.with_suffix(".geo")
+        
+        landscape_scale = 10.0
+        
+        quad_objects = {}
+        source_paths = set()
+        
+        for obj in context.scene.objects:
+            if obj.type == 'MESH' and "qad_quad_index" in obj:
+                quad_objects.setdefault(int(obj["qad_quad_index"]), []).append(obj)
+                source_paths.add(obj.get("qad_source_path", ""))
+                
+        if not quad_objects:
+            self.report({'ERROR'}, "No scenario quads found, import a scenario with Object per Quad first")
+            return {'CANCELLED'}
+        
+        if len(source_paths) != 1:
+            self.report({'ERROR'}, f"Quads from {len(source_paths)} different scenarios found, only one can be exported at a time")
+            return {'CANCELLED'}
+        
+        sourceQadFilePath = Path(source_paths.pop())
+        sourceGeoFilePath = sourceQadFilePath.with_suffix(".geo")
+        print("sourceQadFilePath:", sourceQadFilePath)
+        print("qadFilePath:", qadFilePath)
+        print("geoFilePath:", geoFilePath)
+        
+        if not sourceQadFilePath.exists() or not sourceGeoFilePath.exists():
+            self.report({'ERROR'}, f"Source scenario {sourceQadFilePath} is missing, it is needed for the unedited quads")
+            return {'CANCELLED'}
+        
+        qad = QadFile()
+        geo = GeoFile()
+        
+        with sourceQadFilePath.open('rb') as qad_reader:
+            qad.deserialize(qad_reader)
+            
+        edited_quads = {}
+        
+        for h, objects in sorted(quad_objects.items()):
+            if h >= len(qad.quads):
+                print(f"quad {h} is not part of {sourceQadFilePath.name}, skipping it")
+                continue
+            
+            qad_quad : QadQuad = qad.quads[h]
+            
+            source_layers = {qad.chunks[i].viewDistLayer for i in range(qad_quad.firstChunk, qad_quad.firstChunk + qad_quad.numChunks) if qad.chunks[i].numFaces > 0}
+            layers = {obj.get("qad_view_dist_layer", 0) for obj in objects}
+            
+            unchanged = layers == source_layers and len(objects) == len(layers) and all(obj.get("qad_geometry_hash") == get_quad_object_hash(obj) for obj in objects)
+            
+            if not unchanged:
+                edited_quads[h] = get_edited_quad(objects, landscape_scale)
+                
+        # the source may be the file being written, so write next to it and swap in at the end
+        qadTempFilePath = qadFilePath.with_name(qadFilePath.name + ".tmp")
+        geoTempFilePath = geoFilePath.with_name(geoFilePath.name + ".tmp")
+        
+        with sourceGeoFilePath.open('rb') as geo_reader:
+            geo.deserialize_header(geo_reader)
+            
+            with qadTempFilePath.open('wb') as qad_writer, geoTempFilePath.open('wb') as geo_writer:
+                skipped_quads = write_scenario(qad, geo, geo_reader, edited_quads, qad_writer, geo_writer)
+                
+        os.replace(qadTempFilePath, qadFilePath)
+        os.replace(geoTempFilePath, geoFilePath)
+        
+        # the written file is the new reference for later exports, skipped
+        # quads keep their old hash so their edits are still picked up
+        for h, objects in quad_objects.items():
+            for obj in objects:
+                obj["qad_source_path"] = str(qadFilePath)
+                
+                if h in edited_quads and h not in skipped_quads:
+                    obj["qad_geometry_hash"] = get_quad_object_hash(obj)
+        
+        if skipped_quads:
+            self.report({'ERROR'}, f"Quads {', '.join(str(h) for h in skipped_quads)} have more than {GEO_MAX_BUFFER_VERTICES} vertices, their edits were not exported")
+        else:
+            self.report({'INFO'}, f"Exported {len(qad.quads)} quads, {len(edited_quads)} of them edited")
+        
+        print("ExportQad.execute() OUT")
+        
         return {'FINISHED'}
 
 def menu_func_import(self, context):
     self.layout.operator(ImportQad.bl_idname, text="Landscape Scenario (.qad)")
 
+def menu_func_export(self, context):
+    self.layout.operator(ExportQad.bl_idname, text="Landscape Scenario (.qad)")
+
 def register():
     bpy.utils.register_class(ImportQad)
+    bpy.utils.register_class(ExportQad)
     bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
+    bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
 
 def unregister():
     bpy.utils.unregister_class(ImportQad)
-    bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
\ No newline at end of file
+    bpy.utils.unregister_class(ExportQad)
+    bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
+    bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
\ No newline at end of file
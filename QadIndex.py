@@ -0,0 +1,229 @@
+import numpy as np
+
+from .Qad import *
+
+# upper bound on the number of grid cells per axis
+QAD_INDEX_MAX_CELLS = 256
+
+class QadQuadSelection:
+    """Quads picked by a QadQuadIndex query, in file order, with their chunk and face ranges."""
+    def __init__(self):
+        self.quad_indices = np.empty(0, dtype=np.int64)
+        self.first_chunks = np.empty(0, dtype=np.int64)
+        self.num_chunks = np.empty(0, dtype=np.int64)
+        self.first_faces = np.empty(0, dtype=np.int64)
+        self.num_faces = np.empty(0, dtype=np.int64)
+
+class QadQuadIndex:
+    """
+    Spatial index over the quads of a QadFile, in file space (Y up).
+
+    Quads are looked up by their quadX/quadY coordinates through a table,
+    and by position through a uniform grid over the ground plane (X/Z)
+    that lists every quad whose circumsphere touches a cell. All tests are
+    done on the circumspheres.
+    """
+    def __init__(self):
+        self.quad_x = np.empty(0, dtype=np.int64)
+        self.quad_y = np.empty(0, dtype=np.int64)
+        self.centers = np.empty((0, 3))
+        self.radii = np.empty(0)
+        self.first_chunks = np.empty(0, dtype=np.int64)
+        self.num_chunks = np.empty(0, dtype=np.int64)
+        self.first_faces = np.empty(0, dtype=np.int64)
+        self.num_faces = np.empty(0, dtype=np.int64)
+        self.quad_lookup = np.full((0, 0), -1, dtype=np.int64)
+        self.grid_origin = np.zeros(2)
+        self.cell_size = 1.0
+        self.cell_counts = np.ones(2, dtype=np.int64)
+        self.cell_starts = np.zeros(2, dtype=np.int64)
+        self.cell_quads = np.empty(0, dtype=np.int64)
+
+    def build(self, qad : QadFile):
+        quads = qad.quads
+
+        self.quad_x = np.array([qad_quad.quadX for qad_quad in quads], dtype=np.int64)
+        self.quad_y = np.array([qad_quad.quadY for qad_quad in quads], dtype=np.int64)
+        self.centers = np.array([(qad_quad.circumSpherePositionX, qad_quad.circumSpherePositionY, qad_quad.circumSpherePositionZ) for qad_quad in quads], dtype=np.float64).reshape(-1, 3)
+        self.radii = np.array([qad_quad.circumSphereRadius for qad_quad in quads], dtype=np.float64)
+        self.first_chunks = np.array([qad_quad.firstChunk for qad_quad in quads], dtype=np.int64)
+        self.num_chunks = np.array([qad_quad.numChunks for qad_quad in quads], dtype=np.int64)
+        self.first_faces = np.array([qad_quad.firstFace for qad_quad in quads], dtype=np.int64)
+        self.num_faces = np.array([qad_quad.numFaces for qad_quad in quads], dtype=np.int64)
+
+        quad_count = len(quads)
+
+        lookup_size_x = max(qad.numberOfQuadsX, int(self.quad_x.max()) + 1 if quad_count else 0)
+        lookup_size_y = max(qad.numberOfQuadsY, int(self.quad_y.max()) + 1 if quad_count else 0)
+
+        self.quad_lookup = np.full((lookup_size_x, lookup_size_y), -1, dtype=np.int64)
+        self.quad_lookup[self.quad_x, self.quad_y] = np.arange(quad_count)
+
+        if np.count_nonzero(self.quad_lookup >= 0) < quad_count:
+            print("QadQuadIndex.build(): several quads share a quad position, only the last is found by position")
+
+        if quad_count == 0:
+            self.cell_counts = np.ones(2, dtype=np.int64)
+            self.cell_starts = np.zeros(2, dtype=np.int64)
+            self.cell_quads = np.empty(0, dtype=np.int64)
+
+            return
+
+        bounds_min = self.centers[:, [0, 2]] - self.radii[:, None]
+        bounds_max = self.centers[:, [0, 2]] + self.radii[:, None]
+
+        self.grid_origin = bounds_min.min(axis=0)
+        extent = bounds_max.max(axis=0) - self.grid_origin
+
+        # about one quad per cell, unless that makes too many cells
+        self.cell_size = max(float(np.median(self.radii)) * 2.0, float(extent.max()) / QAD_INDEX_MAX_CELLS, 1e-6)
+        self.cell_counts = np.floor(extent / self.cell_size).astype(np.int64) + 1
+
+        cells_min, cells_max = self.get_cell_ranges(bounds_min, bounds_max)
+
+        quad_indices, cell_ids = self.get_range_cells(cells_min, cells_max)
+
+        order = np.argsort(cell_ids, kind='stable')
+
+        self.cell_quads = quad_indices[order]
+        self.cell_starts = np.concatenate(([0], np.cumsum(np.bincount(cell_ids, minlength=int(np.prod(self.cell_counts))))))
+
+    def get_cell_ranges(self, bounds_min : np.ndarray, bounds_max : np.ndarray) -> (np.ndarray, np.ndarray):
+        """Clamped first and last grid cell, per axis, covered by ground plane bounds."""
+        cells_min = np.floor((bounds_min - self.grid_origin) / self.cell_size).astype(np.int64)
+        cells_max = np.floor((bounds_max - self.grid_origin) / self.cell_size).astype(np.int64)
+
+        return np.clip(cells_min, 0, self.cell_counts - 1), np.clip(cells_max, 0, self.cell_counts - 1)
+
+    def get_range_cells(self, cells_min : np.ndarray, cells_max : np.ndarray) -> (np.ndarray, np.ndarray):
+        """Expand cell ranges into (range, cell id) pairs."""
+        spans = np.maximum(cells_max - cells_min + 1, 0)
+        counts = spans[:, 0] * spans[:, 1]
+
+        range_indices = np.repeat(np.arange(len(counts)), counts)
+        local = np.arange(len(range_indices)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        cell_x = cells_min[range_indices, 0] + local % np.maximum(spans[range_indices, 0], 1)
+        cell_z = cells_min[range_indices, 1] + local // np.maximum(spans[range_indices, 0], 1)
+
+        return range_indices, cell_x * self.cell_counts[1] + cell_z
+
+    def get_candidates(self, bounds_min : np.ndarray, bounds_max : np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Pairs of (query, quad) for every quad listed in the cells each
+        query's ground plane bounds cover. A pair can repeat.
+        """
+        bounds_min = np.atleast_2d(bounds_min)
+        bounds_max = np.atleast_2d(bounds_max)
+
+        outside = np.any((bounds_max < self.grid_origin) | (bounds_min > self.grid_origin + self.cell_counts * self.cell_size), axis=1)
+
+        cells_min, cells_max = self.get_cell_ranges(bounds_min, bounds_max)
+        cells_max[outside] = cells_min[outside] - 1
+
+        query_indices, cell_ids = self.get_range_cells(cells_min, cells_max)
+
+        starts = self.cell_starts[cell_ids]
+        counts = self.cell_starts[cell_ids + 1] - starts
+
+        query_indices = np.repeat(query_indices, counts)
+        slots = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(len(query_indices))
+
+        return query_indices, self.cell_quads[slots]
+
+    def get_selection(self, quad_indices : np.ndarray) -> QadQuadSelection:
+        selection = QadQuadSelection()
+
+        selection.quad_indices = np.unique(np.asarray(quad_indices, dtype=np.int64))
+        selection.first_chunks = self.first_chunks[selection.quad_indices]
+        selection.num_chunks = self.num_chunks[selection.quad_indices]
+        selection.first_faces = self.first_faces[selection.quad_indices]
+        selection.num_faces = self.num_faces[selection.quad_indices]
+
+        return selection
+
+    def query_quad_rectangle(self, quad_min, quad_max) -> QadQuadSelection:
+        """Quads whose quadX/quadY lie within an inclusive range of quad coordinates."""
+        x0 = max(int(quad_min[0]), 0)
+        y0 = max(int(quad_min[1]), 0)
+
+        block = self.quad_lookup[x0:max(int(quad_max[0]) + 1, x0), y0:max(int(quad_max[1]) + 1, y0)]
+
+        return self.get_selection(block[block >= 0])
+
+    def query_points(self, points : np.ndarray) -> np.ndarray:
+        """
+        The quad under each of a batch of file space points, judged on the
+        ground plane: the quad with the nearest center among those whose
+        circumsphere covers the point, or -1.
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        ground_points = points[:, [0, 2]]
+
+        quad_of_points = np.full(len(points), -1, dtype=np.int64)
+
+        point_indices, quad_indices = self.get_candidates(ground_points, ground_points)
+
+        distances = np.linalg.norm(self.centers[quad_indices][:, [0, 2]] - ground_points[point_indices], axis=1)
+
+        covered = distances <= self.radii[quad_indices]
+
+        point_indices = point_indices[covered]
+        quad_indices = quad_indices[covered]
+        distances = distances[covered]
+
+        # nearest quad per point
+        order = np.lexsort((distances, point_indices))
+        point_indices = point_indices[order]
+
+        first = np.ones(len(point_indices), dtype=bool)
+        first[1:] = point_indices[1:] != point_indices[:-1]
+
+        quad_of_points[point_indices[first]] = quad_indices[order[first]]
+
+        return quad_of_points
+
+    def query_point(self, point) -> QadQuadSelection:
+        quad_index = self.query_points(point)[0]
+
+        return self.get_selection([quad_index] if quad_index >= 0 else [])
+
+    def query_rectangle(self, rectangle_min, rectangle_max) -> QadQuadSelection:
+        """Quads whose circumsphere reaches into a file space X/Z rectangle."""
+        rectangle_min = np.asarray(rectangle_min, dtype=np.float64)
+        rectangle_max = np.asarray(rectangle_max, dtype=np.float64)
+
+        _, quad_indices = self.get_candidates(rectangle_min, rectangle_max)
+
+        ground_centers = self.centers[quad_indices][:, [0, 2]]
+        nearest = np.clip(ground_centers, rectangle_min, rectangle_max)
+
+        touching = np.linalg.norm(ground_centers - nearest, axis=1) <= self.radii[quad_indices]
+
+        return self.get_selection(quad_indices[touching])
+
+    def query_sphere(self, center, radius : float) -> QadQuadSelection:
+        """Quads whose circumsphere reaches within radius of a file space point."""
+        center = np.asarray(center, dtype=np.float64)
+
+        _, quad_indices = self.get_candidates(center[[0, 2]] - radius, center[[0, 2]] + radius)
+
+        reach = self.radii[quad_indices] + radius
+
+        touching = np.sum((self.centers[quad_indices] - center) ** 2, axis=1) <= reach * reach
+
+        return self.get_selection(quad_indices[touching])
+
+    def query_frustum(self, planes : np.ndarray) -> QadQuadSelection:
+        """
+        Quads whose circumsphere is not fully outside any of the given file
+        space planes, as (n, 4) rows of inward facing normal and offset
+        (a point p is inside when normal . p + offset >= 0).
+        """
+        planes = np.atleast_2d(np.asarray(planes, dtype=np.float64))
+
+        distances = self.centers @ planes[:, 0:3].T + planes[:, 3]
+
+        inside = np.all(distances >= -self.radii[:, None], axis=1)
+
+        return self.get_selection(np.flatnonzero(inside))
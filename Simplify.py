@@ -0,0 +1,162 @@
+import numpy as np
+
+# cosine of the largest normal rotation a single collapse may cause
+MAX_NORMAL_DEVIATION = 0.25
+
+def get_triangle_normals(positions : np.ndarray, triangles : np.ndarray) -> np.ndarray:
+    p0 = positions[triangles[:, 0]]
+    p1 = positions[triangles[:, 1]]
+    p2 = positions[triangles[:, 2]]
+
+    return np.cross(p1 - p0, p2 - p0)
+
+def get_edges(triangles : np.ndarray) -> np.ndarray:
+    """Return the directed edges of a triangle list, three per triangle."""
+    return np.stack((triangles, np.roll(triangles, -1, axis=1)), axis=2).reshape(-1, 2)
+
+def get_boundary_vertices(triangles : np.ndarray, vertex_count : int) -> np.ndarray:
+    """Flag the vertices on edges that are used by exactly one triangle."""
+    edges = np.sort(get_edges(triangles), axis=1)
+
+    unique_edges, edge_counts = np.unique(edges, axis=0, return_counts=True)
+
+    boundary_vertices = np.zeros(vertex_count, dtype=bool)
+    boundary_vertices[unique_edges[edge_counts == 1].ravel()] = True
+
+    return boundary_vertices
+
+def get_vertex_quadrics(positions : np.ndarray, triangles : np.ndarray) -> np.ndarray:
+    normals = get_triangle_normals(positions, triangles)
+
+    lengths = np.linalg.norm(normals, axis=1)
+    valid = lengths > 0.0
+
+    normals = normals[valid] / lengths[valid, None]
+    offsets = -np.einsum('ij,ij->i', normals, positions[triangles[valid, 0]])
+
+    planes = np.concatenate((normals, offsets[:, None]), axis=1)
+    plane_quadrics = planes[:, :, None] * planes[:, None, :]
+
+    quadrics = np.zeros((len(positions), 4, 4))
+
+    for corner in range(3):
+        np.add.at(quadrics, triangles[valid, corner], plane_quadrics)
+
+    return quadrics
+
+def get_quadric_errors(quadrics : np.ndarray, positions : np.ndarray) -> np.ndarray:
+    homogeneous = np.concatenate((positions, np.ones((len(positions), 1))), axis=1)
+
+    return np.maximum(np.einsum('ni,nij,nj->n', homogeneous, quadrics, homogeneous), 0.0)
+
+def remove_degenerate_triangles(triangles : np.ndarray) -> np.ndarray:
+    degenerate = (triangles[:, 0] == triangles[:, 1]) | (triangles[:, 1] == triangles[:, 2]) | (triangles[:, 2] == triangles[:, 0])
+
+    return triangles[~degenerate]
+
+def simplify_triangles(positions : np.ndarray, triangles : np.ndarray, target_triangle_count : int, locked : np.ndarray = None, max_error : float = np.inf) -> np.ndarray:
+    """
+    Collapse edges of a triangle list by quadric error until the target
+    triangle count or the error limit is reached.
+
+    Vertices only ever collapse onto one of their neighbours, so the result
+    indexes the same vertex array and keeps every vertex attribute intact.
+    Locked vertices are never removed. The error limit is a squared distance.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    triangles = remove_degenerate_triangles(np.asarray(triangles, dtype=np.int64))
+
+    vertex_count = len(positions)
+
+    if locked is None:
+        locked = np.zeros(vertex_count, dtype=bool)
+
+    quadrics = get_vertex_quadrics(positions, triangles)
+
+    while len(triangles) > target_triangle_count:
+        edges = np.unique(np.sort(get_edges(triangles), axis=1), axis=0)
+
+        a = edges[:, 0]
+        b = edges[:, 1]
+
+        edge_quadrics = quadrics[a] + quadrics[b]
+
+        cost_to_a = get_quadric_errors(edge_quadrics, positions[a])
+        cost_to_b = get_quadric_errors(edge_quadrics, positions[b])
+
+        cost_to_a[locked[b]] = np.inf
+        cost_to_b[locked[a]] = np.inf
+
+        collapse_to_b = cost_to_b <= cost_to_a
+
+        sources = np.where(collapse_to_b, a, b)
+        targets = np.where(collapse_to_b, b, a)
+        costs = np.minimum(cost_to_a, cost_to_b)
+
+        # locked collapses cost infinity, which an infinite error limit would still accept
+        candidates = np.flatnonzero(np.isfinite(costs) & (costs <= max_error))
+        candidates = candidates[np.argsort(costs[candidates], kind='stable')]
+
+        # every collapse removes about two triangles, and each vertex takes part in at most one collapse per pass
+        collapse_budget = max(1, min((len(triangles) - target_triangle_count + 1) // 2, len(edges) // 4))
+
+        touched = np.zeros(vertex_count, dtype=bool)
+        collapse_sources = []
+        collapse_targets = []
+
+        for source, target in zip(sources[candidates].tolist(), targets[candidates].tolist()):
+            if touched[source] or touched[target]:
+                continue
+
+            touched[source] = True
+            touched[target] = True
+
+            collapse_sources.append(source)
+            collapse_targets.append(target)
+
+            if len(collapse_sources) >= collapse_budget:
+                break
+
+        if not collapse_sources:
+            break
+
+        collapse_sources = np.array(collapse_sources, dtype=np.int64)
+        collapse_targets = np.array(collapse_targets, dtype=np.int64)
+
+        remap = np.arange(vertex_count)
+        remap[collapse_sources] = collapse_targets
+
+        old_normals = get_triangle_normals(positions, triangles)
+
+        # revert collapses that would fold or twist a surviving triangle
+        while True:
+            new_triangles = remap[triangles]
+
+            changed = np.any(new_triangles != triangles, axis=1)
+            survived = (new_triangles[:, 0] != new_triangles[:, 1]) & (new_triangles[:, 1] != new_triangles[:, 2]) & (new_triangles[:, 2] != new_triangles[:, 0])
+
+            new_normals = get_triangle_normals(positions, new_triangles)
+
+            normal_dots = np.einsum('ij,ij->i', old_normals, new_normals)
+            normal_lengths = np.linalg.norm(old_normals, axis=1) * np.linalg.norm(new_normals, axis=1)
+
+            flipped = changed & survived & (normal_dots <= MAX_NORMAL_DEVIATION * normal_lengths)
+
+            if not np.any(flipped):
+                break
+
+            flipped_vertices = np.unique(triangles[flipped].ravel())
+            reverted = flipped_vertices[remap[flipped_vertices] != flipped_vertices]
+
+            remap[reverted] = reverted
+
+        applied = remap[collapse_sources] != collapse_sources
+
+        if not np.any(applied):
+            break
+
+        np.add.at(quadrics, collapse_targets[applied], quadrics[collapse_sources[applied]])
+
+        triangles = remove_degenerate_triangles(remap[triangles])
+
+    return triangles
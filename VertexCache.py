@@ -0,0 +1,130 @@
+import numpy as np
+
+from collections import deque
+
+VERTEX_CACHE_SIZE = 32
+
+CACHE_DECAY_POWER = 1.5
+LAST_TRIANGLE_SCORE = 0.75
+VALENCE_BOOST_SCALE = 2.0
+VALENCE_BOOST_POWER = 0.5
+
+def calculate_cache_misses(triangles : np.ndarray, cache_size : int = VERTEX_CACHE_SIZE) -> int:
+    """Count the post-transform cache misses of a triangle list on a FIFO cache."""
+    cache = deque()
+    cached = set()
+
+    misses = 0
+
+    for vertex_index in triangles.ravel().tolist():
+        if vertex_index in cached:
+            continue
+
+        misses += 1
+
+        cache.append(vertex_index)
+        cached.add(vertex_index)
+
+        if len(cache) > cache_size:
+            cached.discard(cache.popleft())
+
+    return misses
+
+def get_vertex_score(cache_position : int, remaining_valence : int, cache_size : int) -> float:
+    if remaining_valence == 0:
+        return -1.0
+
+    score = 0.0
+
+    if cache_position >= 0:
+        if cache_position < 3:
+            score = LAST_TRIANGLE_SCORE
+        else:
+            scale = 1.0 / (cache_size - 3)
+            score = (1.0 - (cache_position - 3) * scale) ** CACHE_DECAY_POWER
+
+    score += VALENCE_BOOST_SCALE * remaining_valence ** -VALENCE_BOOST_POWER
+
+    return score
+
+def optimize_vertex_cache(triangles : np.ndarray, cache_size : int = VERTEX_CACHE_SIZE) -> np.ndarray:
+    """
+    Return the order in which to emit the triangles, following Tom Forsyth's
+    linear-speed vertex cache optimisation.
+    """
+    triangle_count = len(triangles)
+
+    if triangle_count == 0:
+        return np.empty(0, dtype=np.int64)
+
+    _, local_triangles = np.unique(triangles, return_inverse=True)
+    local_triangles = local_triangles.reshape(-1, 3)
+
+    vertex_count = int(local_triangles.max()) + 1
+
+    flat_vertices = local_triangles.ravel()
+
+    valences = np.bincount(flat_vertices, minlength=vertex_count)
+    adjacency_offsets = np.concatenate(([0], np.cumsum(valences))).tolist()
+    adjacency = (np.argsort(flat_vertices, kind='stable') // 3).tolist()
+
+    vertex_triangles = [adjacency[adjacency_offsets[i]:adjacency_offsets[i + 1]] for i in range(vertex_count)]
+
+    remaining_valences = valences.tolist()
+    cache_positions = [-1] * vertex_count
+
+    vertex_scores = [get_vertex_score(-1, remaining_valences[i], cache_size) for i in range(vertex_count)]
+
+    triangle_vertices = local_triangles.tolist()
+    triangle_scores = [vertex_scores[a] + vertex_scores[b] + vertex_scores[c] for a, b, c in triangle_vertices]
+    triangle_emitted = [False] * triangle_count
+
+    order = []
+    cache = []
+
+    best_triangle = max(range(triangle_count), key=triangle_scores.__getitem__)
+    next_unemitted = 0
+
+    while len(order) < triangle_count:
+        if best_triangle < 0:
+            while triangle_emitted[next_unemitted]:
+                next_unemitted += 1
+
+            best_triangle = next_unemitted
+
+        triangle_emitted[best_triangle] = True
+        order.append(best_triangle)
+
+        emitted_vertices = triangle_vertices[best_triangle]
+
+        for vertex_index in emitted_vertices:
+            remaining_valences[vertex_index] -= 1
+            vertex_triangles[vertex_index].remove(best_triangle)
+
+        cache = emitted_vertices + [vertex_index for vertex_index in cache if vertex_index not in emitted_vertices]
+
+        for vertex_index in cache[cache_size:]:
+            cache_positions[vertex_index] = -1
+            vertex_scores[vertex_index] = get_vertex_score(-1, remaining_valences[vertex_index], cache_size)
+
+        cache = cache[:cache_size]
+
+        for cache_position, vertex_index in enumerate(cache):
+            cache_positions[vertex_index] = cache_position
+            vertex_scores[vertex_index] = get_vertex_score(cache_position, remaining_valences[vertex_index], cache_size)
+
+        best_triangle = -1
+        best_score = -1.0
+
+        for vertex_index in cache:
+            for triangle_index in vertex_triangles[vertex_index]:
+                a, b, c = triangle_vertices[triangle_index]
+
+                score = vertex_scores[a] + vertex_scores[b] + vertex_scores[c]
+                triangle_scores[triangle_index] = score
+
+                if score > best_score:
+                    best_score = score
+                    best_triangle = triangle_index
+
+    return np.array(order, dtype=np.int64)
@@ -0,0 +1,15 @@
+import sys
+import types
+
+from pathlib import Path
+
+# The add-on's __init__ registers Blender operators. The modules under test
+# only need NumPy, so they are loaded as submodules of a bare package, which
+# also stands in for the add-on folder pytest would otherwise import.
+root_path = Path(__file__).resolve().parent.parent
+
+package = types.ModuleType("landscape")
+package.__path__ = [str(root_path)]
+
+sys.modules.setdefault("landscape", package)
+sys.modules.setdefault(root_path.name, package)
@@ -0,0 +1,80 @@
+import io
+import pytest
+import numpy as np
+
+from landscape.Cpo import *
+
+def get_mesh_shape(polygon_sizes : []) -> CpoShape:
+    rng = np.random.default_rng(3)
+
+    cpo_shape = CpoShape()
+    cpo_shape.type = 3
+
+    shape_data = CpoShapeDataMesh()
+    shape_data.vertices = rng.normal(size=(40, 3)).astype(np.float32)
+    shape_data.polygon_offsets = np.concatenate(([0], np.cumsum(polygon_sizes))).astype(np.int64)
+    shape_data.polygon_indices = rng.integers(0, 40, shape_data.polygon_offsets[-1]).astype(np.uint16)
+    shape_data.position_x, shape_data.position_y, shape_data.position_z = 1.0, 2.0, 3.0
+    shape_data.matrix = [[0.0, 1.0, 0.0], [-1.0, 0.0, 0.0], [0.0, 0.0, 1.0]]
+
+    cpo_shape.data = shape_data
+
+    return cpo_shape
+
+def test_polygon_codec_round_trip():
+    for polygon_sizes in ([3] * 7, [3, 4, 5, 3, 8, 4], []):
+        cpo_shape = get_mesh_shape(polygon_sizes)
+
+        polygon_data = encode_polygons(cpo_shape.data.polygon_indices, cpo_shape.data.polygon_offsets)
+
+        assert len(polygon_data) == sum(polygon_sizes) + len(polygon_sizes)
+
+        # counts lead every polygon, as the per-polygon writer laid them out
+        if polygon_sizes:
+            assert polygon_data[0] == polygon_sizes[0]
+
+        polygon_indices, polygon_offsets = decode_polygons(polygon_data, len(polygon_sizes))
+
+        assert np.array_equal(polygon_indices, cpo_shape.data.polygon_indices)
+        assert np.array_equal(polygon_offsets, cpo_shape.data.polygon_offsets)
+
+def test_encode_polygons_rejects_wide_indices():
+    with pytest.raises(ValueError):
+        encode_polygons(np.array([0, 1, 70000], dtype=np.int64), np.array([0, 3], dtype=np.int64))
+    with pytest.raises(ValueError):
+        encode_polygons(np.zeros(70000, dtype=np.int64), np.array([0, 70000], dtype=np.int64))
+
+def test_file_round_trip():
+    cpo = CpoFile()
+    cpo.shapes.append(get_mesh_shape([3, 4, 5, 6]))
+
+    sphere_shape = CpoShape()
+    sphere_shape.type = 1
+    sphere_shape.data = CpoShapeDataSphere()
+    sphere_shape.data.radius = 2.5
+    sphere_shape.data.matrix = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+
+    cpo.shapes.append(sphere_shape)
+
+    data = io.BytesIO()
+    cpo.serialize(data)
+
+    read_cpo = CpoFile()
+    read_cpo.deserialize(io.BytesIO(data.getvalue()))
+
+    assert [cpo_shape.type for cpo_shape in read_cpo.shapes] == [3, 1]
+
+    shape_data = read_cpo.shapes[0].data
+
+    assert np.array_equal(shape_data.vertices, cpo.shapes[0].data.vertices)
+    assert np.array_equal(shape_data.polygon_indices, cpo.shapes[0].data.polygon_indices)
+    assert np.array_equal(shape_data.polygon_offsets, cpo.shapes[0].data.polygon_offsets)
+    assert (shape_data.position_x, shape_data.position_y, shape_data.position_z) == (1.0, 2.0, 3.0)
+    assert shape_data.matrix == cpo.shapes[0].data.matrix
+
+    assert read_cpo.shapes[1].data.radius == 2.5
+
+    written_again = io.BytesIO()
+    read_cpo.serialize(written_again)
+
+    assert written_again.getvalue() == data.getvalue()
@@ -0,0 +1,156 @@
+import numpy as np
+
+from landscape.Cpo import *
+from landscape.CpoBvh import *
+
+def get_random_cpo(rng) -> CpoFile:
+    cpo = CpoFile()
+
+    for shape_index in range(3):
+        polygon_sizes = rng.integers(3, 6, 60)
+
+        cpo_shape = CpoShape()
+        cpo_shape.type = 3
+
+        shape_data = CpoShapeDataMesh()
+        shape_data.polygon_offsets = np.concatenate(([0], np.cumsum(polygon_sizes))).astype(np.int64)
+
+        # small polygons scattered through the volume, each a fan around its first corner
+        centers = np.repeat(rng.uniform(-5.0, 5.0, (len(polygon_sizes), 3)), polygon_sizes, axis=0)
+        shape_data.vertices = (centers + rng.normal(scale=0.6, size=centers.shape)).astype(np.float32)
+        shape_data.polygon_indices = np.arange(len(shape_data.vertices)).astype(np.uint16)
+
+        angle = 0.4 * (shape_index + 1)
+        shape_data.matrix = [[np.cos(angle), 0.0, -np.sin(angle)], [0.0, 1.0, 0.0], [np.sin(angle), 0.0, np.cos(angle)]]
+        shape_data.position_x, shape_data.position_y, shape_data.position_z = rng.uniform(-1.0, 1.0, 3)
+
+        cpo_shape.data = shape_data
+        cpo.shapes.append(cpo_shape)
+
+    return cpo
+
+def intersect_ray_triangle(origin : np.ndarray, direction : np.ndarray, triangle : np.ndarray) -> float:
+    edge_1 = triangle[1] - triangle[0]
+    edge_2 = triangle[2] - triangle[0]
+
+    p = np.cross(direction, edge_2)
+    determinant = edge_1 @ p
+
+    if abs(determinant) <= 1e-12:
+        return np.inf
+
+    s = origin - triangle[0]
+    u = (s @ p) / determinant
+
+    q = np.cross(s, edge_1)
+    v = (direction @ q) / determinant
+
+    t = (edge_2 @ q) / determinant
+
+    if u < 0.0 or v < 0.0 or u + v > 1.0 or t < 0.0:
+        return np.inf
+
+    return t
+
+def clip_polygon_to_box(polygon : np.ndarray, box_min : np.ndarray, box_max : np.ndarray) -> np.ndarray:
+    for axis in range(3):
+        for sign, bound in ((1.0, box_min[axis]), (-1.0, box_max[axis])):
+            if len(polygon) == 0:
+                return polygon
+
+            distances = sign * (polygon[:, axis] - bound)
+
+            clipped = []
+
+            for i in range(len(polygon)):
+                j = (i + 1) % len(polygon)
+
+                if distances[i] >= 0.0:
+                    clipped.append(polygon[i])
+
+                if (distances[i] >= 0.0) != (distances[j] >= 0.0):
+                    clipped.append(polygon[i] + (polygon[j] - polygon[i]) * (distances[i] / (distances[i] - distances[j])))
+
+            polygon = np.array(clipped).reshape(-1, 3)
+
+    return polygon
+
+def test_ray_cast_matches_brute_force():
+    rng = np.random.default_rng(11)
+    cpo = get_random_cpo(rng)
+
+    bvh = CpoBvh()
+    bvh.build(cpo)
+
+    corners, triangle_shapes, triangle_polygons = get_world_triangles(cpo)
+
+    origins = rng.uniform(-8.0, 8.0, (200, 3))
+    directions = rng.normal(size=(200, 3))
+    directions[:20] = [0.0, -1.0, 0.0]
+
+    distances, shape_indices, polygon_indices = bvh.ray_cast(origins, directions)
+
+    directions = directions / np.linalg.norm(directions, axis=1)[:, None]
+
+    hits = 0
+
+    for ray_index in range(len(origins)):
+        triangle_distances = np.array([intersect_ray_triangle(origins[ray_index], directions[ray_index], triangle) for triangle in corners])
+        nearest = np.argmin(triangle_distances)
+
+        if np.isinf(triangle_distances[nearest]):
+            assert np.isinf(distances[ray_index])
+            assert shape_indices[ray_index] == -1 and polygon_indices[ray_index] == -1
+            continue
+
+        hits += 1
+
+        assert np.isclose(distances[ray_index], triangle_distances[nearest])
+
+        # a tie between polygons sharing the hit point may pick either
+        tied = np.isclose(triangle_distances, triangle_distances[nearest])
+
+        assert (shape_indices[ray_index], polygon_indices[ray_index]) in set(zip(triangle_shapes[tied], triangle_polygons[tied]))
+
+    assert hits > 20
+
+    limited_distances, _, _ = bvh.ray_cast(origins, directions, max_distance=3.0)
+
+    assert np.allclose(limited_distances, np.where(distances <= 3.0, distances, np.inf))
+
+def test_query_aabb_matches_brute_force():
+    rng = np.random.default_rng(12)
+    cpo = get_random_cpo(rng)
+
+    bvh = CpoBvh()
+    bvh.build(cpo)
+
+    corners, triangle_shapes, triangle_polygons = get_world_triangles(cpo)
+
+    boxes_min = rng.uniform(-7.0, 5.0, (40, 3))
+    boxes_max = boxes_min + rng.uniform(0.1, 2.5, (40, 3))
+
+    box_indices, shape_indices, polygon_indices = bvh.query_aabb(boxes_min, boxes_max)
+
+    expected = set()
+
+    for box_index in range(len(boxes_min)):
+        for triangle, shape_index, polygon_index in zip(corners, triangle_shapes, triangle_polygons):
+            if len(clip_polygon_to_box(triangle, boxes_min[box_index], boxes_max[box_index])) > 0:
+                expected.add((box_index, shape_index, polygon_index))
+
+    assert len(expected) > 20
+    assert set(zip(box_indices, shape_indices, polygon_indices)) == expected
+    assert np.all(np.diff(box_indices) >= 0)
+
+def test_empty_file():
+    bvh = CpoBvh()
+    bvh.build(CpoFile())
+
+    distances, shape_indices, polygon_indices = bvh.ray_cast([[0.0, 0.0, 0.0]], [[0.0, 1.0, 0.0]])
+
+    assert np.isinf(distances[0]) and shape_indices[0] == -1
+
+    box_indices, _, _ = bvh.query_aabb([[-1.0, -1.0, -1.0]], [[1.0, 1.0, 1.0]])
+
+    assert len(box_indices) == 0
@@ -0,0 +1,152 @@
+import io
+import numpy as np
+
+from landscape.CpoGeometry import *
+
+def get_grid_shape(size : int) -> CpoShapeDataMesh:
+    shape_data = CpoShapeDataMesh()
+    shape_data.vertices = np.array([(x, 0.0, z) for z in range(size + 1) for x in range(size + 1)], dtype=np.float32)
+
+    polygons = [(z * (size + 1) + x, (z + 1) * (size + 1) + x, (z + 1) * (size + 1) + x + 1, z * (size + 1) + x + 1) for z in range(size) for x in range(size)]
+
+    shape_data.polygon_indices = np.array(polygons, dtype=np.uint16).ravel()
+    shape_data.polygon_offsets = np.arange(0, 4 * len(polygons) + 1, 4, dtype=np.int64)
+
+    return shape_data
+
+def get_area(shape_data : CpoShapeDataMesh) -> float:
+    triangles = triangulate_polygons(shape_data.polygon_indices, shape_data.polygon_offsets)
+    corners = shape_data.vertices.astype(np.float64)[triangles]
+
+    return float(np.sum(np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1)) * 0.5)
+
+def test_decimate_with_budget_keeps_area_and_boundary():
+    shape_data = get_grid_shape(9)
+
+    boundary = {tuple(vertex) for vertex in shape_data.vertices.tolist() if vertex[0] in (0, 9) or vertex[2] in (0, 9)}
+
+    decimate_mesh_shape(shape_data, 4)
+
+    assert shape_data.get_polygon_count() < 81
+    assert abs(get_area(shape_data) - 81.0) < 1e-4
+    assert boundary <= {tuple(vertex) for vertex in shape_data.vertices.tolist()}
+
+def get_box_shape(matrix) -> CpoShape:
+    cpo_shape = CpoShape()
+    cpo_shape.type = 3
+
+    shape_data = CpoShapeDataMesh()
+    shape_data.vertices = np.array([(x, y, z) for x in (-1.0, 1.0) for y in (-2.0, 2.0) for z in (-3.0, 3.0)], dtype=np.float32)
+
+    faces = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+
+    shape_data.polygon_indices = np.array(faces, dtype=np.uint16).ravel()
+    shape_data.polygon_offsets = np.arange(0, 25, 4, dtype=np.int64)
+    shape_data.position_x = 5.0
+    shape_data.matrix = matrix
+
+    cpo_shape.data = shape_data
+
+    return cpo_shape
+
+def test_fit_box_on_exported_shape():
+    rotation = np.array([[0.0, 1.0, 0.0], [-1.0, 0.0, 0.0], [0.0, 0.0, 1.0]])
+
+    # the exporter used to store its transposed 4x4 transform with the translation cleared
+    transform = np.identity(4)
+    transform[0:3, 0:3] = rotation
+
+    for matrix in (transform.tolist(), rotation.tolist()):
+        primitive_shape = fit_primitive_shape(get_box_shape(matrix), 0.01)
+
+        assert primitive_shape is not None and primitive_shape.type == 2
+        assert np.array(primitive_shape.data.matrix).shape == (3, 3)
+        assert abs(primitive_shape.data.position_x - 5.0) < 1e-6
+
+        writer = io.BytesIO()
+        primitive_shape.data.serialize(writer)
+
+        assert len(writer.getvalue()) == 12 + 12 + 36
+
+def test_fit_rejects_open_band():
+    cpo_shape = CpoShape()
+    cpo_shape.type = 3
+
+    angles = np.linspace(0.0, 2.0 * np.pi, 64, endpoint=False)
+
+    shape_data = CpoShapeDataMesh()
+    shape_data.vertices = np.array([(np.cos(angle), height, np.sin(angle)) for angle in angles for height in (-0.05, 0.05)], dtype=np.float32)
+
+    bands = [(2 * i, 2 * i + 1, 2 * ((i + 1) % 64) + 1, 2 * ((i + 1) % 64)) for i in range(64)]
+
+    shape_data.polygon_indices = np.array(bands, dtype=np.uint16).ravel()
+    shape_data.polygon_offsets = np.arange(0, 4 * len(bands) + 1, 4, dtype=np.int64)
+    shape_data.matrix = np.identity(3).tolist()
+
+    cpo_shape.data = shape_data
+
+    assert fit_primitive_shape(cpo_shape, 0.01) is None
+
+def test_surface_distances():
+    corners = np.array([[(0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (0.0, 1.0, 0.0)]])
+    points = np.array([(0.25, 0.25, 2.0), (2.0, 0.0, 0.0), (-1.0, -1.0, 0.0)])
+
+    assert np.allclose(get_surface_distances(points, corners), (2.0, 1.0, np.sqrt(2.0)))
+
+def get_cube_corners(offset : float) -> np.ndarray:
+    return np.array([(x + offset, y, z) for x in (0.0, 1.0) for y in (0.0, 1.0) for z in (0.0, 1.0)])
+
+def test_decompose_in_steps():
+    cpo_shape = CpoShape()
+    cpo_shape.type = 3
+
+    cube_faces = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+
+    # two cubes apart, so their common hull is concave
+    shape_data = CpoShapeDataMesh()
+    shape_data.vertices = np.concatenate((get_cube_corners(0.0), get_cube_corners(3.0))).astype(np.float32)
+    shape_data.polygon_indices = np.array(cube_faces + [tuple(index + 8 for index in face) for face in cube_faces], dtype=np.uint16).ravel()
+    shape_data.polygon_offsets = np.arange(0, 49, 4, dtype=np.int64)
+    shape_data.matrix = np.identity(3).tolist()
+
+    cpo_shape.data = shape_data
+
+    steps = decompose_cpo_shape(cpo_shape, 4, 0.01, 32)
+    number_of_steps = 0
+
+    while True:
+        try:
+            next(steps)
+            number_of_steps += 1
+        except StopIteration as stop:
+            hull_shapes = stop.value
+            break
+
+    assert number_of_steps > 2
+    assert len(hull_shapes) == 2
+
+    for hull_shape in hull_shapes:
+        assert np.allclose(np.ptp(hull_shape.data.vertices, axis=0), 1.0)
+
+    assert len(decompose_cpo_shapes([cpo_shape], 4, 0.01, 32)) == 2
+
+def test_merge_coplanar_keeps_normals_within_angle():
+    step = np.radians(0.25)
+    max_angle = np.radians(1.0)
+
+    angles = np.arange(41) * step
+
+    # a gently curved strip of quads, each turned a quarter degree from the last
+    vertices = np.array([(10.0 * np.sin(angle), height, 10.0 * np.cos(angle)) for angle in angles for height in (0.0, 1.0)])
+
+    quads = [(2 * i, 2 * i + 2, 2 * i + 3, 2 * i + 1) for i in range(40)]
+
+    polygon_indices, polygon_offsets = merge_coplanar_polygons(vertices, np.array(quads, dtype=np.int64).ravel(), np.arange(0, 161, 4, dtype=np.int64), max_angle)
+
+    assert len(polygon_offsets) - 1 < 40
+
+    for i in range(len(polygon_offsets) - 1):
+        polygon_angles = angles[polygon_indices[polygon_offsets[i]:polygon_offsets[i + 1]] // 2]
+
+        # the quads of a polygon face the middle of their own arc
+        assert np.ptp(polygon_angles) - step <= max_angle + 1e-9
@@ -0,0 +1,103 @@
+import io
+import numpy as np
+
+from landscape.Qad import *
+
+def get_scenario():
+    """A small scenario of two quads sharing one vertex buffer, serialized."""
+    rng = np.random.default_rng(0)
+
+    qad = QadFile()
+    qad.numberOfQuadsX = 2
+    qad.numberOfQuadsY = 1
+
+    geo = GeoFile()
+    geo.vertexFormat = 3
+
+    vertex_buffer = np.zeros(32, dtype=GEO_VERTEX_DTYPE)
+    vertex_buffer['position'] = rng.normal(size=(32, 3))
+    vertex_buffer['normal'] = rng.integers(0, 1 << 24, 32)
+
+    triangles = []
+
+    for h in range(2):
+        qad_quad = QadQuad()
+        qad_quad.quadX = h
+        qad_quad.firstChunk = len(qad.chunks)
+        qad_quad.firstFace = len(triangles)
+        qad_quad.numChunks = 1
+        qad_quad.numFaces = 4
+
+        qad_chunk = QadChunk()
+        qad_chunk.firstFace = len(triangles)
+        qad_chunk.numFaces = 4
+
+        triangles.extend(rng.integers(0, 32, (4, 3)).tolist())
+
+        qad.quads.append(qad_quad)
+        qad.chunks.append(qad_chunk)
+
+    qad.numberOfPolygons = len(triangles)
+
+    geo.vertexBuffers = [vertex_buffer]
+    geo.tangentBuffers = [np.zeros(32, dtype=GEO_TANGENT_DTYPE)]
+    geo.triangles = np.array(triangles, dtype=np.uint16)
+
+    qad_data = io.BytesIO()
+    qad.serialize(qad_data)
+
+    geo_data = io.BytesIO()
+    geo.serialize(geo_data)
+
+    return qad_data.getvalue(), geo_data.getvalue()
+
+def write_edited_scenario(qad_data : bytes, geo_data : bytes, edited_quads : {}):
+    qad = QadFile()
+    qad.deserialize(io.BytesIO(qad_data))
+
+    geo = GeoFile()
+    geo_reader = io.BytesIO(geo_data)
+    geo.deserialize_header(geo_reader)
+
+    qad_writer = io.BytesIO()
+    geo_writer = io.BytesIO()
+
+    skipped_quads = write_scenario(qad, geo, geo_reader, edited_quads, qad_writer, geo_writer)
+
+    return skipped_quads, qad_writer.getvalue(), geo_writer.getvalue()
+
+def test_write_scenario_without_edits_is_unchanged():
+    qad_data, geo_data = get_scenario()
+
+    assert write_edited_scenario(qad_data, geo_data, {}) == ([], qad_data, geo_data)
+
+def test_write_scenario_reports_oversized_quads():
+    qad_data, geo_data = get_scenario()
+
+    edited_quad = QadEditedQuad()
+    edited_quad.vertices = np.zeros(GEO_MAX_BUFFER_VERTICES + 1, dtype=GEO_VERTEX_DTYPE)
+    edited_quad.chunks = [(0, 0, np.array([[0, 1, 2]]))]
+
+    assert write_edited_scenario(qad_data, geo_data, {1: edited_quad}) == ([1], qad_data, geo_data)
+
+def test_unchanged_normals_keep_their_packed_value():
+    packed_normals = np.random.default_rng(1).integers(1, 1 << 24, 1000).astype(np.uint32)
+
+    # Blender keeps only the direction of the imported normals
+    normals = decode_packed_normals(packed_normals).astype(np.float64)
+    normals /= np.linalg.norm(normals, axis=1)[:, None]
+
+    assert np.array_equal(encode_packed_normals(normals, packed_normals), packed_normals)
+
+    normals[0] = (0.0, 0.0, 1.0)
+
+    assert encode_packed_normals(normals, packed_normals)[0] == 0x0000FF00
+
+def test_edited_normals_keep_their_direction():
+    normals = np.random.default_rng(2).random((1000, 3)) + 0.05
+    normals /= np.linalg.norm(normals, axis=1)[:, None]
+
+    decoded_normals = decode_packed_normals(encode_packed_normals(normals)).astype(np.float64)
+    decoded_normals /= np.linalg.norm(decoded_normals, axis=1)[:, None]
+
+    assert np.all(np.einsum('ij,ij->i', normals, decoded_normals) > np.cos(np.radians(0.5)))
@@ -0,0 +1,158 @@
+import numpy as np
+
+from landscape.Qad import *
+from landscape.QadIndex import *
+
+def get_random_qad(rng) -> QadFile:
+    qad = QadFile()
+    qad.numberOfQuadsX = 12
+    qad.numberOfQuadsY = 10
+
+    for quad_x in range(qad.numberOfQuadsX):
+        for quad_y in range(qad.numberOfQuadsY):
+            # leave holes, as files without terrain under every quad have
+            if rng.random() < 0.2:
+                continue
+
+            qad_quad = QadQuad()
+            qad_quad.quadX = quad_x
+            qad_quad.quadY = quad_y
+            qad_quad.circumSpherePositionX = quad_x * 10.0 + 5.0 + rng.uniform(-2.0, 2.0)
+            qad_quad.circumSpherePositionY = rng.uniform(-20.0, 20.0)
+            qad_quad.circumSpherePositionZ = quad_y * 10.0 + 5.0 + rng.uniform(-2.0, 2.0)
+            qad_quad.circumSphereRadius = rng.uniform(4.0, 25.0) if rng.random() < 0.1 else rng.uniform(4.0, 9.0)
+            qad_quad.firstChunk = len(qad.quads) * 2
+            qad_quad.numChunks = 2
+            qad_quad.firstFace = len(qad.quads) * 50
+            qad_quad.numFaces = 50
+
+            qad.quads.append(qad_quad)
+
+    return qad
+
+def get_quad_arrays(qad : QadFile) -> (np.ndarray, np.ndarray):
+    centers = np.array([(qad_quad.circumSpherePositionX, qad_quad.circumSpherePositionY, qad_quad.circumSpherePositionZ) for qad_quad in qad.quads])
+    radii = np.array([qad_quad.circumSphereRadius for qad_quad in qad.quads])
+
+    return centers, radii
+
+def test_query_rectangle_matches_brute_force():
+    rng = np.random.default_rng(21)
+    qad = get_random_qad(rng)
+
+    index = QadQuadIndex()
+    index.build(qad)
+
+    centers, radii = get_quad_arrays(qad)
+
+    for _ in range(100):
+        rectangle_min = rng.uniform(-30.0, 130.0, 2)
+        rectangle_max = rectangle_min + rng.uniform(0.0, 40.0, 2)
+
+        selection = index.query_rectangle(rectangle_min, rectangle_max)
+
+        ground_centers = centers[:, [0, 2]]
+        distances = np.linalg.norm(ground_centers - np.clip(ground_centers, rectangle_min, rectangle_max), axis=1)
+
+        assert np.array_equal(selection.quad_indices, np.flatnonzero(distances <= radii))
+
+def test_query_sphere_matches_brute_force():
+    rng = np.random.default_rng(22)
+    qad = get_random_qad(rng)
+
+    index = QadQuadIndex()
+    index.build(qad)
+
+    centers, radii = get_quad_arrays(qad)
+
+    for _ in range(100):
+        center = rng.uniform(-30.0, 130.0, 3)
+        radius = rng.uniform(0.0, 30.0)
+
+        selection = index.query_sphere(center, radius)
+
+        distances = np.linalg.norm(centers - center, axis=1)
+
+        assert np.array_equal(selection.quad_indices, np.flatnonzero(distances <= radii + radius))
+
+def test_query_points_matches_brute_force():
+    rng = np.random.default_rng(23)
+    qad = get_random_qad(rng)
+
+    index = QadQuadIndex()
+    index.build(qad)
+
+    centers, radii = get_quad_arrays(qad)
+
+    points = rng.uniform(-40.0, 140.0, (500, 3))
+
+    quad_of_points = index.query_points(points)
+
+    for point, quad_index in zip(points, quad_of_points):
+        distances = np.linalg.norm(centers[:, [0, 2]] - point[[0, 2]], axis=1)
+        distances[distances > radii] = np.inf
+
+        if np.isinf(distances.min()):
+            assert quad_index == -1
+        else:
+            assert distances[quad_index] == distances.min()
+
+    selection = index.query_point(points[0])
+
+    assert selection.quad_indices.tolist() == ([quad_of_points[0]] if quad_of_points[0] >= 0 else [])
+
+def test_query_quad_rectangle_matches_brute_force():
+    rng = np.random.default_rng(24)
+    qad = get_random_qad(rng)
+
+    index = QadQuadIndex()
+    index.build(qad)
+
+    quad_x = np.array([qad_quad.quadX for qad_quad in qad.quads])
+    quad_y = np.array([qad_quad.quadY for qad_quad in qad.quads])
+
+    for _ in range(50):
+        quad_min = rng.integers(-3, 14, 2)
+        quad_max = quad_min + rng.integers(-1, 6, 2)
+
+        selection = index.query_quad_rectangle(quad_min, quad_max)
+
+        inside = (quad_x >= quad_min[0]) & (quad_x <= quad_max[0]) & (quad_y >= quad_min[1]) & (quad_y <= quad_max[1])
+
+        assert np.array_equal(selection.quad_indices, np.flatnonzero(inside))
+        assert np.array_equal(selection.first_chunks, [qad.quads[i].firstChunk for i in selection.quad_indices])
+        assert np.array_equal(selection.num_faces, [qad.quads[i].numFaces for i in selection.quad_indices])
+
+def test_query_frustum_matches_brute_force():
+    rng = np.random.default_rng(25)
+    qad = get_random_qad(rng)
+
+    index = QadQuadIndex()
+    index.build(qad)
+
+    centers, radii = get_quad_arrays(qad)
+
+    for _ in range(20):
+        normals = rng.normal(size=(6, 3))
+        normals /= np.linalg.norm(normals, axis=1)[:, None]
+
+        # planes through points around the middle of the terrain, facing inwards
+        anchors = rng.uniform(20.0, 100.0, (6, 3))
+        planes = np.hstack((normals, -np.einsum('ij,ij->i', normals, anchors)[:, None]))
+
+        selection = index.query_frustum(planes)
+
+        inside = np.ones(len(centers), dtype=bool)
+
+        for plane in planes:
+            inside &= centers @ plane[0:3] + plane[3] >= -radii
+
+        assert np.array_equal(selection.quad_indices, np.flatnonzero(inside))
+
+def test_empty_file():
+    index = QadQuadIndex()
+    index.build(QadFile())
+
+    assert len(index.query_rectangle([0.0, 0.0], [10.0, 10.0]).quad_indices) == 0
+    assert len(index.query_sphere([0.0, 0.0, 0.0], 5.0).quad_indices) == 0
+    assert index.query_points([[0.0, 0.0, 0.0]]).tolist() == [-1]
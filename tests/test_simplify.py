@@ -0,0 +1,26 @@
+import numpy as np
+
+from landscape.Simplify import *
+
+def get_strip(length : int) -> (np.ndarray, np.ndarray):
+    positions = np.array([(x, y, 0.0) for x in range(length) for y in range(2)], dtype=np.float64)
+    triangles = np.array([triangle for i in range(length - 1) for triangle in ((2 * i, 2 * i + 2, 2 * i + 1), (2 * i + 1, 2 * i + 2, 2 * i + 3))], dtype=np.int64)
+
+    return positions, triangles
+
+def test_simplify_reaches_target():
+    positions, triangles = get_strip(8)
+
+    simplified = simplify_triangles(positions, triangles, 6)
+
+    assert len(simplified) <= 6
+
+def test_simplify_keeps_locked_vertices():
+    positions, triangles = get_strip(8)
+
+    locked = np.ones(len(positions), dtype=bool)
+
+    simplified = simplify_triangles(positions, triangles, 2, locked)
+
+    assert np.array_equal(np.unique(simplified), np.arange(len(positions)))
+    assert len(simplified) == len(triangles)
@@ -1,4 +1,7 @@
 
+import bpy
+import numpy as np
+
 from mathutils import Vector, Matrix
 
 def swap_yz_axes_of_quaternion(quat):
@@ -68,3 +71,35 @@ def compose_matrix(obj, scale_correction_factor=1.0):
     matrix = Matrix.LocRotScale(translation, quaternion, scale)
     
     return matrix
+
+def create_mesh(name, vertices, polygon_indices, polygon_offsets):
+    """Build a mesh straight from a vertex array and CSR polygon arrays."""
+    polygon_counts = np.diff(polygon_offsets)
+    
+    mesh = bpy.data.meshes.new(name=name)
+    
+    mesh.vertices.add(len(vertices))
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(vertices, dtype=np.float32).ravel())
+    
+    mesh.loops.add(len(polygon_indices))
+    mesh.loops.foreach_set("vertex_index", np.ascontiguousarray(polygon_indices, dtype=np.int32))
+    
+    mesh.polygons.add(len(polygon_counts))
+    mesh.polygons.foreach_set("loop_start", np.ascontiguousarray(polygon_offsets[:-1], dtype=np.int32))
+    
+    # polygon sizes follow from the loop starts since Blender 4.0
+    if bpy.app.version < (4, 0, 0):
+        mesh.polygons.foreach_set("loop_total", np.ascontiguousarray(polygon_counts, dtype=np.int32))
+    
+    mesh.update(calc_edges=True)
+    
+    return mesh
+
+def hash_array(hasher, array : np.ndarray):
+    hasher.update(len(array).to_bytes(8, 'little'))
+    hasher.update(array.tobytes())
+
+def hash_collection(hasher, collection, attribute : str, dtype, components : int = 1):
+    array = np.empty(len(collection) * components, dtype=dtype)
+    collection.foreach_get(attribute, array)
+    hash_array(hasher, array)